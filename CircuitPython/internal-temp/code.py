@@ -5,39 +5,57 @@
 # Compatible Pico or Pico W
 #
 # 2023-09-03
+# 2026-10-17 Filter readings, minimum on/off times and adaptive reading rate
 #
 
 # Temperature Switch
-# 
+#
 # Uses Picos internal temperature sensor to switch USB On when set temperature exceeded.
-# It then waits for the temperature to drop by "hysteresis" C 
+# It then waits for the temperature to drop by "hysteresis" C
+#
+# Copy code.py and thermostat.py to the CIRCUITPY drive.
+#
+# Readings are filtered (see thermostat.py) and the output stays on/off for
+# at least "minOn"/"minOff" seconds so it doesn't chatter around "onTemp".
+# The temperature is read every "fastRead" seconds near the thresholds and
+# up to "slowRead" seconds apart away from them, and printed every "logEvery"
+# seconds (and whenever the power is switched).
 #
 
 import board
 import time
 import digitalio
 import microcontroller
+from thermostat import Filter, Thermostat, Log
 
 onTemp = 35 # Turn on at "onTemp" degrees C
 hysteresis = 2 # Turn off when "hysteresis" degrees C below "onTemp"
 
+minOn = 60 # Seconds
+minOff = 60
+fastRead = 0.5
+slowRead = 10
+logEvery = 60
+
 # Setup GPIO pin for Power control
 
 pwrCtrl = digitalio.DigitalInOut(board.GP2)
 pwrCtrl.direction = digitalio.Direction.OUTPUT
 
-# Setup GPIO pin for Slide Switch
-
-slideSwitch = digitalio.DigitalInOut(board.GP13)
-slideSwitch.switch_to_input(pull=digitalio.Pull.UP)
+temps = Filter()
+thermostat = Thermostat(onTemp, hysteresis, minOn, minOff, fastRead, slowRead)
+log = Log(logEvery)
 
 while True:
-        temp = microcontroller.cpu.temperature
-        print("Current Temp: "+str(temp))
-        if pwrCtrl.value == False and temp >= onTemp:
-                pwrCtrl.value = True
-		print("Power on at: "+str(temp))
-        elif pwrCtrl.value == True and temp <= (onTemp - hysteresis):
-                pwrCtrl.value = False
-		print("Power off at: "+str(temp))
-	time.sleep(1)
+	now = time.monotonic()
+	raw = microcontroller.cpu.temperature
+	temp = temps.add(now, raw)
+
+	change = thermostat.update(now, temp)
+	if change != None:
+		pwrCtrl.value = change
+		print(f"Power {'on' if change else 'off'} at: {temp:.1f}")
+	elif log.due(now):
+		print(f"Current Temp: {temp:.1f} (reading {raw:.1f})")
+
+	time.sleep(thermostat.interval(now, temp, temps.slope))
@@ -0,0 +1,119 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Thermostat
+#
+# The Pico's internal temperature sensor is noisy (each ADC step is about
+# half a degree), so switching on raw readings makes the output chatter
+# around the threshold. Readings go through a median of the last few (which
+# drops single spikes) then an exponential moving average, and the output
+# has to stay on/off for a minimum time before it can change again.
+#
+# The filter also tracks how fast the temperature is changing, which is used
+# to read slowly while well away from the thresholds and quickly close to them.
+#
+# Everything is kept in a fixed number of variables/list slots.
+#
+
+import math
+
+class Filter:
+	def __init__(self, size=5, tau=10.0):
+		self.size = size
+		self.tau = tau # EWMA time constant (seconds)
+		self._ring = [0.0] * size # Last "size" readings, oldest at _pos when full
+		self._sorted = [] # The same readings sorted, for the median
+		self._pos = 0
+		self.value = None # Filtered temperature
+		self.slope = 0.0 # Degrees C per second
+		self._lastT = None
+
+	# Add a reading taken at time.monotonic() "t", returns the filtered temperature
+	def add(self, t, reading):
+		if len(self._sorted) == self.size:
+			self._sorted.remove(self._ring[self._pos])
+		self._ring[self._pos] = reading
+		self._pos = (self._pos + 1) % self.size
+		i = len(self._sorted)
+		self._sorted.append(reading)
+		while i > 0 and self._sorted[i - 1] > reading:
+			self._sorted[i] = self._sorted[i - 1]
+			i -= 1
+		self._sorted[i] = reading
+		median = self._sorted[len(self._sorted) // 2]
+
+		if self.value == None:
+			self.value = median
+		else:
+			dt = t - self._lastT
+			# Weighted by the time since the last reading as the rate varies
+			alpha = 1 - math.exp(-dt / self.tau) if dt > 0 else 0
+			previous = self.value
+			self.value += alpha * (median - self.value)
+			if dt > 0:
+				self.slope += alpha * ((self.value - previous) / dt - self.slope)
+		self._lastT = t
+		return self.value
+
+class Thermostat:
+	def __init__(self, onTemp, hysteresis, minOn=60, minOff=60, fast=0.5, slow=10, band=1.0):
+		self.onTemp = onTemp
+		self.offTemp = onTemp - hysteresis
+		self.minOn = minOn # Seconds the output stays on before it can go off
+		self.minOff = minOff # and off before it can go on
+		self.fast = fast # Seconds between readings within "band" C of a threshold
+		self.slow = slow # and at most this far away from one
+		self.band = band
+		self.on = False
+		self.changedAt = None
+
+	# The state the temperature asks for
+	def wanted(self, temp):
+		if self.on:
+			return temp > self.offTemp
+		return temp >= self.onTemp
+
+	# Given the filtered temperature at time "t" returns the new state when the
+	# output should change, otherwise None
+	def update(self, t, temp):
+		if self.wanted(temp) == self.on or self.held(t) > 0:
+			return None
+		self.on = not self.on
+		self.changedAt = t
+		return self.on
+
+	# Seconds until the output is allowed to change
+	def held(self, t):
+		if self.changedAt == None:
+			return 0
+		return max(0, self.changedAt + (self.minOn if self.on else self.minOff) - t)
+
+	# Seconds until the next reading. Close to the threshold that matters, or
+	# heading for it fast, read often. Otherwise read slowly.
+	def interval(self, t, temp, slope):
+		if self.wanted(temp) != self.on:
+			# Waiting out the dwell time, nothing to do until it is over
+			return max(self.fast, min(self.slow, self.held(t)))
+		threshold = self.offTemp if self.on else self.onTemp
+		distance = abs(threshold - temp)
+		if distance <= self.band:
+			return self.fast
+		towards = (threshold - temp) * slope > 0
+		if towards:
+			# Read twice before it could get within "band" at this rate
+			return max(self.fast, min(self.slow, (distance - self.band) / abs(slope) / 2))
+		return self.slow
+
+# Limits how often a message is printed (printing over USB serial costs more
+# than the thermostat itself), use as "if log.due(t): print(...)"
+class Log:
+	def __init__(self, every=60):
+		self.every = every
+		self._lastT = None
+
+	def due(self, t):
+		if self._lastT != None and t - self._lastT < self.every:
+			return False
+		self._lastT = t
+		return True
@@ -0,0 +1,20 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Shared code for the examples, copy the usbswitch folder to the lib folder
+# on the CIRCUITPY drive.
+#
+# Nothing is imported here, import just the parts needed so an example only
+# pays for (and needs the libraries of) what it uses:
+#
+#  usbswitch.relay      - USB power output (GP2)
+#  usbswitch.wdt        - Optional watchdog timer
+#  usbswitch.network    - WiFi and web server bring up and recovery
+#  usbswitch.web        - Web server polling and /stats page
+#  usbswitch.events     - Server-Sent Events to /events listeners
+#  usbswitch.scheduler  - Deadline scheduler
+#  usbswitch.instrument - Loop / request timing, heap and reset reason stats
+#  usbswitch.gestures   - Button short/double/long press and hold
+#  usbswitch.timekeeping - Monotonic deadlines, non-blocking NTP and local time
+#
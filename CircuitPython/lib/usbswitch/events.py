@@ -0,0 +1,89 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Server-Sent Events
+#
+# Listeners on an /events route are sent the state whenever it changes, so a
+# page can show it without polling:
+#
+#  hub = Events(stateEvent, maxListeners=4)
+#  server.route("/events")(hub.route)
+#  ... hub.notify() after each change and hub.welcome() after server.poll()
+#
+# "state" returns the current state as a JSON string. Each listener is kept
+# as (SSEResponse, connection) so the socket can still be closed if the SSE
+# close message can't be sent. A listener is only noticed to have gone away
+# when sending to it fails, so call ping() now and then to find them.
+#
+
+from adafruit_httpserver import Response, SSEResponse, SERVICE_UNAVAILABLE_503
+
+class Events:
+	def __init__(self, state, maxListeners=4, retryAfter=30):
+		self.state = state
+		self.maxListeners = maxListeners # More are refused with 503 until one goes away
+		self.retryAfter = retryAfter # Seconds a refused listener is told to wait
+		self.listeners = []
+		self._new = [] # Listeners not yet sent the state
+		self.eventId = 0
+
+	# The /events route handler
+	def route(self, request):
+		if len(self.listeners) >= self.maxListeners:
+			# Drop any which have gone away (e.g. a reloaded page) before turning this one away
+			self.ping()
+			if len(self.listeners) >= self.maxListeners:
+				return Response(request, "Too many listeners", status=SERVICE_UNAVAILABLE_503, headers={"Retry-After": str(self.retryAfter)})
+		sse = SSEResponse(request)
+		self.listeners.append((sse, request.connection))
+		self._new.append(self.listeners[-1])
+		return sse
+
+	# Send the state to every listener, call after it changes
+	def notify(self):
+		if self.listeners:
+			self.eventId += 1
+			self._send(self.listeners, self.state(), "state")
+
+	# New listeners are sent the current state once their headers have gone out,
+	# call after server.poll() has handled a request
+	def welcome(self):
+		if self._new:
+			self._send(self._new, self.state(), "state")
+			self._new.clear()
+
+	# Keep-alive, also drops any listeners which have gone away
+	def ping(self):
+		if self.listeners:
+			self._send(self.listeners, "", "ping")
+
+	# Drop every listener, e.g. when the server they were connected to has gone
+	def dropAll(self):
+		while self.listeners:
+			self._drop(self.listeners[0])
+		while self._new:
+			self._drop(self._new[0])
+
+	def _drop(self, listener):
+		sse, connection = listener
+		try:
+			sse.close()
+		except OSError:
+			try:
+				connection.close()
+			except OSError:
+				pass
+		if listener in self.listeners:
+			self.listeners.remove(listener)
+		if listener in self._new:
+			self._new.remove(listener)
+
+	# Send an event to each of "listeners", dropping any which have gone away
+	def _send(self, listeners, data, event):
+		for i in range(len(listeners) - 1, -1, -1):
+			listener = listeners[i]
+			try:
+				listener[0].send_event(data, event=event, id=self.eventId)
+			except OSError:
+				self._drop(listener)
@@ -0,0 +1,144 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Button gestures
+#
+# Turns keypad.Keys events into gestures, using the timestamps keypad gives
+# each event so they are measured from when the button actually moved:
+#
+#  PRESS  - as soon as the button goes down
+#  SHORT  - pressed and released
+#  DOUBLE - pressed again within "doubleMs" of a short press being released
+#  LONG   - held down for "longMs"
+#  HOLD   - still held, every "repeatMs" after LONG (e.g. to keep adding time)
+#
+# Gestures are mapped to actions with a table, keys are keypad key numbers:
+#
+#  gestures = Gestures({(0, SHORT): turnOn, (0, LONG): turnOff})
+#
+# Each key is a small state machine so an event is handled in O(1). LONG,
+# HOLD and a SHORT that might still become a DOUBLE are due some time after
+# the last event, call expire() when the loop comes round (or sleep for
+# timeout() seconds) and they are run then; there is nothing to poll.
+#
+# A key only waits for what its table uses, without a DOUBLE action SHORT is
+# run on release and without LONG/HOLD actions a press is never long.
+#
+
+from supervisor import ticks_ms
+
+PRESS = 0
+SHORT = 1
+DOUBLE = 2
+LONG = 3
+HOLD = 4
+
+# Key states
+_IDLE = 0
+_DOWN = 1 # Pressed, not yet long
+_RELEASED = 2 # Released after a short press, waiting to see if it is a double
+_DOWN_AGAIN = 3 # Second press of a double
+_HELD = 4 # Held past LONG
+
+# ticks_ms() wraps every 2**29 ms (about 6 days)
+_TICKS_PERIOD = 1 << 29
+_TICKS_MASK = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+# a - b in ms allowing for ticks_ms() wrapping
+def ticksDiff(a, b):
+	return ((a - b + _TICKS_HALF) & _TICKS_MASK) - _TICKS_HALF
+
+class Gestures:
+	def __init__(self, actions, longMs=800, doubleMs=300, repeatMs=1000):
+		self.actions = actions
+		self.longMs = longMs
+		self.doubleMs = doubleMs
+		self.repeatMs = repeatMs
+
+		keyCount = max(key for key, _ in actions) + 1
+		self._double = [(key, DOUBLE) in actions for key in range(keyCount)]
+		self._long = [(key, LONG) in actions or (key, HOLD) in actions for key in range(keyCount)]
+		self._state = [_IDLE] * keyCount
+		self._since = [0] * keyCount # ticks_ms of the last press/release
+		self._due = [None] * keyCount # ticks_ms the pending gesture is due, None if there isn't one
+		self.holds = 0 # HOLD gestures since LONG, for the action to look at
+
+	# Run the action for "gesture" on "key" (if there is one)
+	def _run(self, key, gesture):
+		action = self.actions.get((key, gesture))
+		if action != None:
+			action()
+
+	# Handle a keypad event
+	def event(self, event):
+		key = event.key_number
+		if key >= len(self._state):
+			return
+		t = event.timestamp
+		state = self._state[key]
+
+		if event.pressed:
+			if state == _RELEASED:
+				if ticksDiff(t, self._since[key]) <= self.doubleMs:
+					self._state[key] = _DOWN_AGAIN
+					self._due[key] = None
+					return
+				# Too late for a double, expire() wasn't called in time
+				self._run(key, SHORT)
+			self._state[key] = _DOWN
+			self._since[key] = t
+			self._due[key] = (t + self.longMs) & _TICKS_MASK if self._long[key] else None
+			self._run(key, PRESS)
+			return
+
+		self._due[key] = None
+		self._state[key] = _IDLE
+		if state == _DOWN:
+			if self._long[key] and ticksDiff(t, self._since[key]) >= self.longMs:
+				# Held long enough but expire() wasn't called in time
+				self.holds = 0
+				self._run(key, LONG)
+			elif self._double[key]:
+				self._state[key] = _RELEASED
+				self._since[key] = t
+				self._due[key] = (t + self.doubleMs) & _TICKS_MASK
+			else:
+				self._run(key, SHORT)
+		elif state == _DOWN_AGAIN:
+			self._run(key, DOUBLE)
+
+	# Run any gestures which are due by "now" (ticks_ms)
+	def expire(self, now=None):
+		if now == None:
+			now = ticks_ms()
+		for key, due in enumerate(self._due):
+			if due == None or ticksDiff(now, due) < 0:
+				continue
+			state = self._state[key]
+			if state == _RELEASED:
+				self._state[key] = _IDLE
+				self._due[key] = None
+				self._run(key, SHORT)
+			elif state == _DOWN:
+				self._state[key] = _HELD
+				self._due[key] = (due + self.repeatMs) & _TICKS_MASK if (key, HOLD) in self.actions else None
+				self.holds = 0
+				self._run(key, LONG)
+			elif state == _HELD:
+				self._due[key] = (due + self.repeatMs) & _TICKS_MASK
+				self.holds += 1
+				self._run(key, HOLD)
+
+	# Seconds until the next gesture is due (0 if one is overdue), None if nothing is pending
+	def timeout(self, now=None):
+		if now == None:
+			now = ticks_ms()
+		soonest = None
+		for due in self._due:
+			if due != None:
+				wait = max(0, ticksDiff(due, now))
+				if soonest == None or wait < soonest:
+					soonest = wait
+		return None if soonest == None else soonest / 1000
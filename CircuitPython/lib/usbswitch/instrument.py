@@ -0,0 +1,146 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Runtime instrumentation
+#
+# Records how long each main loop pass and each web/MQTT request takes in
+# fixed bucket histograms, the lowest free heap seen, how many garbage
+# collections have happened and why the board last reset. Read it with
+# stats.json(), e.g. from a /stats web page or an MQTT message.
+#
+# Timing uses supervisor.ticks_ms() (a small int, so nothing is allocated)
+# and the free heap is only checked every "memEvery" loop passes as
+# gc.mem_free() has to walk the heap.
+#
+# The reason for a restart the code asks for (reset() below) is kept in the
+# last REASON_SIZE bytes of microcontroller.nvm (from REASON_OFFSET) so it can
+# be reported after the restart. Anything else kept in nvm has to stay below
+# REASON_OFFSET.
+#
+
+import gc
+import json
+import time
+import supervisor
+import microcontroller
+
+# Histogram bucket upper bounds in ms, anything slower goes in a final overflow bucket
+BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+TICKS_MASK = (1 << 29) - 1
+
+REASON_SIZE = 32
+REASON_OFFSET = len(microcontroller.nvm) - REASON_SIZE if microcontroller.nvm != None else 0
+
+class Histogram:
+	def __init__(self, bounds=BOUNDS):
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds) + 1)
+		self.count = 0
+		self.total = 0
+		self.max = 0
+
+	def add(self, ms):
+		self.count += 1
+		self.total += ms
+		if ms > self.max:
+			self.max = ms
+		n = 0
+		for bound in self.bounds:
+			if ms <= bound:
+				break
+			n += 1
+		self.counts[n] += 1
+
+	def summary(self):
+		return {
+			"Count": self.count,
+			"MeanMs": self.total / self.count if self.count else 0,
+			"MaxMs": self.max,
+			"Buckets": self.counts,
+			"Bounds": self.bounds,
+		}
+
+class Stats:
+	def __init__(self, memEvery=16):
+		self.loops = Histogram()
+		self.requests = Histogram()
+		self.memEvery = memEvery
+		self._memCountdown = 0
+		self.memFree = gc.mem_free()
+		self.memLow = self.memFree
+		self.collections = 0 # At least this many, several between checks count as one
+		self.resetReason = str(microcontroller.cpu.reset_reason)
+		self.runReason = str(supervisor.runtime.run_reason)
+		self.safeModeReason = str(getattr(supervisor.runtime, "safe_mode_reason", None))
+		self.lastReset = takeReason()
+
+	# Current tick count to pass to loop() / request()
+	def start(self):
+		return supervisor.ticks_ms()
+
+	# A main loop pass that started at "start" has finished
+	def loop(self, start):
+		self.loops.add((supervisor.ticks_ms() - start) & TICKS_MASK)
+		self._memCountdown -= 1
+		if self._memCountdown <= 0:
+			self._memCountdown = self.memEvery
+			self.checkMem()
+
+	# A request that started at "start" has been handled
+	def request(self, start):
+		self.requests.add((supervisor.ticks_ms() - start) & TICKS_MASK)
+
+	def checkMem(self):
+		free = gc.mem_free()
+		if free > self.memFree: # Free memory only goes up when garbage is collected
+			self.collections += 1
+		if free < self.memLow:
+			self.memLow = free
+		self.memFree = free
+
+	# "extra" is a dict of more top level entries, e.g. from other modules
+	def json(self, extra=None):
+		stats = {
+			"UptimeSec": int(time.monotonic()),
+			"Loop": self.loops.summary(),
+			"Request": self.requests.summary(),
+			"Heap": {"Free": self.memFree, "Low": self.memLow, "Collections": self.collections},
+			"Reset": {
+				"Reason": self.resetReason,
+				"Run": self.runReason,
+				"SafeMode": self.safeModeReason,
+				"Last": self.lastReset,
+			},
+		}
+		if extra:
+			stats.update(extra)
+		return json.dumps(stats)
+
+# Read (and clear) the reason saved by reset(), None if there isn't one
+def takeReason():
+	nvm = microcontroller.nvm
+	if nvm == None:
+		return None
+	data = nvm[REASON_OFFSET:]
+	if data[0] in (0, 0xFF):
+		return None
+	nvm[REASON_OFFSET] = 0
+	return bytes(data).split(b"\x00")[0].decode("utf-8", "replace")
+
+# Save "reason" so it can be reported after the restart
+def record(reason):
+	nvm = microcontroller.nvm
+	if nvm == None:
+		return
+	data = reason.encode()[:REASON_SIZE - 1]
+	nvm[REASON_OFFSET:] = data + bytes(REASON_SIZE - len(data))
+
+# Restart the board, recording why
+def reset(reason):
+	try:
+		record(reason)
+	except Exception:
+		pass
+	microcontroller.reset()
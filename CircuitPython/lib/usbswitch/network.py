@@ -0,0 +1,160 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# WiFi and web server bring up, and recovery when the server fails
+#
+# Uses the CIRCUITPY_WIFI_SSID / CIRCUITPY_WIFI_PASSWORD from settings.toml.
+#
+
+import os
+import time
+import wifi
+from usbswitch import instrument
+
+# Wait for the WiFi details to be set up then connect, "wdt" is a usbswitch.wdt.Watchdog
+def connect(wdt):
+	ssid = os.getenv('CIRCUITPY_WIFI_SSID')
+	password = os.getenv('CIRCUITPY_WIFI_PASSWORD')
+
+	# Check WiFi connection details have been setup
+	if ssid == None or ssid == "" or password == None or password == "":
+		while True:
+			print("Waiting for WiFi details to be setup in settings.toml")
+			wdt.feed()
+			time.sleep(5)
+
+	print("Connecting to WiFi")
+	try:
+		wdt.feed()
+		wifi.radio.connect(ssid, password)
+	except OSError:
+		while True:
+			print("Unable to connect to WiFi, check details in settings.toml")
+			wdt.feed()
+			time.sleep(5)
+
+# Restart the board (recording why) after a short pause
+def restart(wdt, reason):
+	print("Restarting (" + reason + ")")
+	wdt.feed()
+	time.sleep(5)
+	instrument.reset(reason)
+
+# A new socket pool and web server (not yet started), with the routes of server "routesFrom" if given
+def newServer(routesFrom=None):
+	import socketpool
+	from adafruit_httpserver import Server
+
+	pool = socketpool.SocketPool(wifi.radio)
+	server = Server(pool, "/static", debug=True)
+	if routesFrom != None:
+		# The library has no public way to list a server's routes, they are
+		# moved across so the handlers registered with @server.route keep working
+		server.add_routes(routesFrom._routes)
+	return pool, server
+
+# Start a web server on port 80, returns (pool, server)
+def startServer(wdt):
+	print("Starting web server")
+	try:
+		wdt.feed()
+		pool, server = newServer()
+		server.start(str(wifi.radio.ipv4_address))
+	except OSError:
+		restart(wdt, "Web server setup failed")
+	return pool, server
+
+# Keeps the web server going without restarting the board, which would switch
+# the power output back to its initial state and forget anything scheduled.
+#
+# When the server fails (failed()) it is stopped, then recover() builds a new
+# socket pool and server with the same routes. If that doesn't work, or WiFi
+# has dropped, WiFi is reconnected as well. Attempts back off from
+# "backoffMin" to "backoffMax" seconds and nothing waits in between, so the
+# rest of the code (e.g. scheduled switching) carries on while it is down.
+class Link:
+	def __init__(self, wdt, onRecovered=None, backoffMin=1, backoffMax=60, radioAfter=2):
+		self.wdt = wdt
+		self.onRecovered = onRecovered # Called with the Link once the new server is running
+		self.backoffMin = backoffMin
+		self.backoffMax = backoffMax
+		self.radioAfter = radioAfter # Failed attempts before WiFi is reconnected too
+		self.pool, self.server = startServer(wdt)
+		self.up = True
+		self.recoveries = 0
+		self.radioRestarts = 0
+		self.failedAttempts = 0
+		self.downSeconds = 0 # Total
+		self.lastDownSeconds = 0
+		self.lastError = None
+		self._failedAt = None
+		self._attempts = 0
+		self._nextAttempt = 0
+
+	# The server raised "error"
+	def failed(self, error):
+		print("Web server error")
+		print(error)
+		self.up = False
+		self.lastError = str(error)
+		self._failedAt = time.monotonic()
+		self._attempts = 0
+		self._nextAttempt = self._failedAt
+		try:
+			self.server.stop()
+		except OSError:
+			pass
+
+	# Seconds until recover() will next try
+	def retryIn(self):
+		return max(0, self._nextAttempt - time.monotonic())
+
+	# Try to bring the server back if an attempt is due, returns True once it is up
+	def recover(self):
+		if self.up:
+			return True
+		if time.monotonic() < self._nextAttempt:
+			return False
+		self.wdt.feed()
+		self._attempts += 1
+		try:
+			if self._attempts > self.radioAfter or not wifi.radio.connected:
+				self._reconnect()
+			pool, server = newServer(self.server)
+			server.start(str(wifi.radio.ipv4_address))
+		except OSError as e:
+			self.failedAttempts += 1
+			delay = min(self.backoffMax, self.backoffMin * 2 ** min(self._attempts - 1, 10))
+			print("Web server recovery failed (%s), retrying in %d seconds" % (e, delay))
+			self._nextAttempt = time.monotonic() + delay
+			return False
+
+		self.pool, self.server = pool, server
+		self.up = True
+		self.recoveries += 1
+		self.lastDownSeconds = time.monotonic() - self._failedAt
+		self.downSeconds += self.lastDownSeconds
+		print("Web server recovered after %.1f seconds" % self.lastDownSeconds)
+		if self.onRecovered:
+			self.onRecovered(self)
+		return True
+
+	def _reconnect(self):
+		print("Reconnecting WiFi")
+		self.radioRestarts += 1
+		wifi.radio.enabled = False
+		wifi.radio.enabled = True
+		wifi.radio.connect(os.getenv('CIRCUITPY_WIFI_SSID'), os.getenv('CIRCUITPY_WIFI_PASSWORD'))
+
+	# For the /stats page
+	def summary(self):
+		return {
+			"Up": self.up,
+			"Recoveries": self.recoveries,
+			"RadioRestarts": self.radioRestarts,
+			"FailedAttempts": self.failedAttempts,
+			"DownSec": self.downSeconds,
+			"LastDownSec": self.lastDownSeconds,
+			"LastError": self.lastError,
+		}
@@ -0,0 +1,37 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# USB power output
+#
+
+import board
+from digitalio import DigitalInOut, Direction
+
+class Relay:
+	def __init__(self, initialState=False, pin=board.GP2):
+		self.pin = DigitalInOut(pin)
+		self.pin.direction = Direction.OUTPUT
+		self.pin.value = initialState
+
+	@property
+	def value(self):
+		return self.pin.value
+
+	@value.setter
+	def value(self, value):
+		self.pin.value = value
+
+	# Switch on/off, returns True if the output changed
+	def set(self, value):
+		if self.pin.value == value:
+			return False
+		self.pin.value = value
+		return True
+
+	# "On" or "Off"
+	def state(self):
+		if self.pin.value:
+			return "On"
+		else:
+			return "Off"
@@ -0,0 +1,138 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Deadline scheduler
+#
+# Keeps scheduled actions in a binary heap ordered by due time, so the next
+# deadline is always at the front and insert / cancel are O(log n).
+# Entries can repeat at a fixed interval. Daily on/off slots don't, a day
+# isn't always 24 hours when DST starts/ends, so wifi-boost reschedules them
+# from the wall clock after each run instead.
+#
+# Times are plain numbers in whatever units the caller uses, wifi-boost uses
+# timekeeping.now() (monotonic ms), and "repeat" is in the same units.
+#
+
+class Entry:
+	def __init__(self, at, action, repeat):
+		self.at = at
+		self.action = action
+		self.repeat = repeat
+		self.index = -1 # Position in the heap, -1 when not scheduled
+
+	def scheduled(self):
+		return self.index >= 0
+
+class Scheduler:
+	# onChange is called whenever an entry is added or removed, so a sleeping
+	# main loop can recalculate how long to wait for
+	def __init__(self, onChange=None):
+		self._heap = []
+		self._onChange = onChange
+
+	def __len__(self):
+		return len(self._heap)
+
+	# Run "action" at time "at", then every "repeat" (same units as "at") if set
+	def schedule(self, at, action, repeat=None):
+		entry = Entry(at, action, repeat)
+		self._push(entry)
+		self._changed()
+		return entry
+
+	# Remove a pending entry, returns False if it had already run / been cancelled
+	def cancel(self, entry):
+		if not entry.scheduled():
+			return False
+		self._remove(entry)
+		self._changed()
+		return True
+
+	# Move an entry to a new time (re-adding it if it has already run)
+	def reschedule(self, entry, at):
+		if entry.scheduled():
+			self._remove(entry)
+		entry.at = at
+		self._push(entry)
+		self._changed()
+
+	# Time the next entry is due or None if nothing is scheduled
+	def nextDue(self):
+		if self._heap:
+			return self._heap[0].at
+		return None
+
+	# Run every entry due at or before "now", returns the number run
+	def runDue(self, now):
+		heap = self._heap
+		count = 0
+		while heap and heap[0].at <= now:
+			entry = self._pop()
+			if entry.repeat:
+				# Skip any missed repeats rather than running them all at once
+				while entry.at <= now:
+					entry.at += entry.repeat
+				self._push(entry)
+			entry.action()
+			count += 1
+		return count
+
+	def _changed(self):
+		if self._onChange:
+			self._onChange()
+
+	# Heap helpers, each entry tracks its own index so it can be removed in O(log n)
+
+	def _push(self, entry):
+		heap = self._heap
+		entry.index = len(heap)
+		heap.append(entry)
+		self._siftUp(entry.index)
+
+	def _pop(self):
+		entry = self._heap[0]
+		self._remove(entry)
+		return entry
+
+	def _remove(self, entry):
+		heap = self._heap
+		i = entry.index
+		last = heap.pop()
+		entry.index = -1
+		if last is not entry:
+			heap[i] = last
+			last.index = i
+			self._siftDown(i)
+			self._siftUp(last.index)
+
+	def _siftUp(self, i):
+		heap = self._heap
+		entry = heap[i]
+		while i > 0:
+			parent = (i - 1) >> 1
+			if heap[parent].at <= entry.at:
+				break
+			heap[i] = heap[parent]
+			heap[i].index = i
+			i = parent
+		heap[i] = entry
+		entry.index = i
+
+	def _siftDown(self, i):
+		heap = self._heap
+		n = len(heap)
+		entry = heap[i]
+		while True:
+			child = 2 * i + 1
+			if child >= n:
+				break
+			if child + 1 < n and heap[child + 1].at < heap[child].at:
+				child += 1
+			if entry.at <= heap[child].at:
+				break
+			heap[i] = heap[child]
+			heap[i].index = i
+			i = child
+		heap[i] = entry
+		entry.index = i
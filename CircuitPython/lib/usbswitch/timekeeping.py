@@ -0,0 +1,326 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Timekeeping
+#
+# time.time() jumps whenever the RTC is set (e.g. from NTP), so anything timed
+# with it can end early or late. Deadlines are kept in milliseconds of
+# time.monotonic_ns() instead, which never jumps (and, unlike
+# time.monotonic(), keeps its precision however long the board is up).
+#
+# Wall clock time is only needed to show the time and for calendar schedules.
+# It is worked out from the monotonic clock plus the offset NTP measured, and
+# how fast the monotonic clock drifts is estimated from one sync to the next.
+#
+# The NTP query is non-blocking, poll() sends it, picks up the answer when it
+# arrives and gives up after "timeout" seconds, so the rest of the code keeps
+# running (adafruit_ntp waits for the answer). Failed syncs are retried after
+# "retry" seconds, doubling each time. Looking up the server blocks, so its
+# address is kept and only looked up again after a failure or a new pool.
+#
+# Local time follows a POSIX TZ rule (as used for TZ on Linux), e.g.
+#  "UTC0", "GMT0BST,M3.5.0/1,M10.5.0", "CET-1CEST,M3.5.0,M10.5.0/3",
+#  "EST5EDT,M3.2.0,M11.1.0" or "AEST-10AEDT,M10.1.0,M4.1.0/3"
+#
+
+import time
+import struct
+
+NTP_TO_UNIX_EPOCH = 2208988800
+
+# Milliseconds of time.monotonic_ns()
+def now():
+	return time.monotonic_ns() // 1000000
+
+# Days from 1970-01-01 to year/month/day
+def daysFromCivil(year, month, day):
+	if month <= 2:
+		year -= 1
+	era = year // 400
+	yearOfEra = year - era * 400
+	dayOfYear = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+	return era * 146097 + yearOfEra * 365 + yearOfEra // 4 - yearOfEra // 100 + dayOfYear - 719468
+
+class TimeZone:
+	def __init__(self, spec="UTC0"):
+		self.spec = spec
+		self._text = spec
+		self._pos = 0
+		self.std = self._name()
+		self.stdOffset = -self._offset() # Seconds ahead of UTC
+		self.dst = None
+		self.dstOffset = self.stdOffset
+		if self._more() and self._peek() != ",":
+			self.dst = self._name()
+			self.dstOffset = self.stdOffset + 3600
+			if self._more() and self._peek() != ",":
+				self.dstOffset = -self._offset()
+		if self.dst != None:
+			self._expect(",")
+			self.start = self._rule() # Local standard time DST starts
+			self._expect(",")
+			self.end = self._rule() # Local daylight time it ends
+		if self._more():
+			self._invalid()
+
+	# Seconds ahead of UTC at "utc"
+	def offset(self, utc):
+		if self.dst == None:
+			return self.stdOffset
+		year = time.localtime(utc + self.stdOffset)[0]
+		start = self._date(year, self.start) - self.stdOffset
+		end = self._date(year, self.end) - self.dstOffset
+		if start < end:
+			daylight = start <= utc < end
+		else: # Southern hemisphere, DST over new year
+			daylight = not (end <= utc < start)
+		return self.dstOffset if daylight else self.stdOffset
+
+	# Seconds from 1970 (local) that "rule" happens in "year"
+	def _date(self, year, rule):
+		month, week, weekday, at = rule
+		first = daysFromCivil(year, month, 1)
+		day = first + (weekday - (first + 4) % 7) % 7 + (week - 1) * 7 # 1970-01-01 was a Thursday
+		nextMonth = daysFromCivil(year + 1, 1, 1) if month == 12 else daysFromCivil(year, month + 1, 1)
+		while day >= nextMonth: # Week 5 is the last one
+			day -= 7
+		return day * 86400 + at
+
+	# Parsing
+
+	def _invalid(self):
+		raise ValueError("Invalid TZ: " + self.spec)
+
+	def _more(self):
+		return self._pos < len(self._text)
+
+	def _peek(self):
+		return self._text[self._pos]
+
+	def _expect(self, c):
+		if not self._more() or self._peek() != c:
+			self._invalid()
+		self._pos += 1
+
+	def _number(self):
+		start = self._pos
+		while self._more() and self._peek().isdigit():
+			self._pos += 1
+		if start == self._pos:
+			self._invalid()
+		return int(self._text[start:self._pos])
+
+	# "EST" or "<+10>"
+	def _name(self):
+		start = self._pos
+		if self._more() and self._peek() == "<":
+			end = self._text.find(">", start)
+			if end < 0:
+				self._invalid()
+			self._pos = end + 1
+			return self._text[start + 1:end]
+		while self._more() and self._peek().isalpha():
+			self._pos += 1
+		if self._pos - start < 3:
+			self._invalid()
+		return self._text[start:self._pos]
+
+	# [+-]hh[:mm[:ss]] in seconds
+	def _offset(self):
+		sign = 1
+		if self._more() and self._peek() in "+-":
+			if self._peek() == "-":
+				sign = -1
+			self._pos += 1
+		seconds = self._number() * 3600
+		if self._more() and self._peek() == ":":
+			self._pos += 1
+			seconds += self._number() * 60
+			if self._more() and self._peek() == ":":
+				self._pos += 1
+				seconds += self._number()
+		return sign * seconds
+
+	# Mmonth.week.weekday[/time], only the M form is supported
+	def _rule(self):
+		self._expect("M")
+		month = self._number()
+		self._expect(".")
+		week = self._number()
+		self._expect(".")
+		weekday = self._number()
+		if not (1 <= month <= 12 and 1 <= week <= 5 and 0 <= weekday <= 6):
+			self._invalid()
+		at = 2 * 3600
+		if self._more() and self._peek() == "/":
+			self._pos += 1
+			at = self._offset()
+		return (month, week, weekday, at)
+
+class Clock:
+	def __init__(self, pool, server="pool.ntp.org", timeZone=None, interval=60*60*24, timeout=5, retry=60, onSync=None):
+		self.pool = pool # Replace if the socket pool is rebuilt, the address is looked up again
+		self.server = server
+		self.timeZone = timeZone or TimeZone()
+		self.interval = interval # Seconds between syncs
+		self.timeout = timeout # Seconds to wait for an answer
+		self.retry = retry # Seconds before the first retry after a failure
+		self.pollInterval = 0.01 # Seconds between checks for an answer
+		self.onSync = onSync # Called after each sync, e.g. to replan calendar schedules
+
+		# UTC ms = monotonic ms + offset (+ drift since syncedAt), offset is None until synced
+		self.offset = None
+		self.syncedAt = None
+		self.drift = 0.0 # How much faster UTC runs than the monotonic clock (ppm)
+		self.delay = None # Round trip of the last sync (ms)
+		self.step = 0 # How far the last sync moved the wall clock (ms)
+		self.syncs = 0
+		self.failures = 0
+
+		self._socket = None
+		self._address = None # Server's address, None until looked up
+		self._sentAt = None
+		self._nextSync = now()
+		self._wait = retry
+		self._packet = bytearray(48)
+
+	@property
+	def pool(self):
+		return self._pool
+
+	@pool.setter
+	def pool(self, pool):
+		self._pool = pool
+		self._address = None
+
+	@property
+	def synced(self):
+		return self.offset != None
+
+	# UTC ms at monotonic ms "at", uses the RTC until NTP has answered
+	def _utcMs(self, at):
+		if self.offset == None:
+			return time.time() * 1000 + at - now()
+		return at + self.offset + int((at - self.syncedAt) * self.drift / 1000000)
+
+	# Seconds since 1970 UTC at monotonic ms "at" (default now)
+	def utc(self, at=None):
+		return self._utcMs(now() if at == None else at) // 1000
+
+	# Seconds since 1970 in local time, for time.localtime()
+	def local(self, at=None):
+		t = self.utc(at)
+		return t + self.timeZone.offset(t)
+
+	def localtime(self, at=None):
+		return time.localtime(self.local(at))
+
+	# Monotonic ms of the next local "hour":"minute" after monotonic ms "at" (default now)
+	def nextLocal(self, hour, minute, at=None):
+		if at == None:
+			at = now()
+		utcMs = self._utcMs(at)
+		t = utcMs // 1000
+		local = t + self.timeZone.offset(t)
+		target = local - local % 86400 + hour * 3600 + minute * 60
+		if target <= local:
+			target += 86400
+		# The offset then, which differs from now's if DST starts/ends in between
+		utcTarget = target - self.timeZone.offset(target - self.timeZone.offset(t))
+		return at + utcTarget * 1000 - utcMs
+
+	# NTP
+
+	# Send/receive NTP without blocking, returns seconds until it wants calling again
+	def poll(self):
+		t = now()
+		if self._socket == None:
+			if t < self._nextSync:
+				return (self._nextSync - t) / 1000
+			self._request(t)
+			return self.pollInterval
+
+		try:
+			size = self._socket.recv_into(self._packet)
+		except OSError: # Nothing yet
+			size = 0
+		if size >= 48 and self._received(t):
+			return (self._nextSync - t) / 1000
+		if t - self._sentAt >= self.timeout * 1000:
+			self._failed(t, "timed out")
+		return self.pollInterval
+
+	def _request(self, t):
+		packet = self._packet
+		for i in range(48):
+			packet[i] = 0
+		packet[0] = 0x23 # Version 4, client
+		# The transmit time is just the monotonic ms, the answer has to echo it back
+		struct.pack_into("!II", packet, 40, (t >> 32) & 0xFFFFFFFF, t & 0xFFFFFFFF)
+		try:
+			if self._address == None:
+				self._address = self._pool.getaddrinfo(self.server, 123)[0][4]
+			self._socket = self._pool.socket(self._pool.AF_INET, self._pool.SOCK_DGRAM)
+			self._socket.settimeout(0)
+			self._socket.sendto(packet, self._address)
+		except OSError:
+			self._failed(t, "send failed")
+			return
+		self._sentAt = t
+
+	# Check and use an answer, False if it isn't one to the request sent
+	def _received(self, t):
+		packet = self._packet
+		sentAt = self._sentAt
+		if (packet[0] & 7) != 4 or packet[1] == 0: # Not from a server, or a kiss-o'-death
+			return False
+		if struct.unpack_from("!II", packet, 24) != ((sentAt >> 32) & 0xFFFFFFFF, sentAt & 0xFFFFFFFF):
+			return False
+		received = self._ntpMs(32)
+		transmitted = self._ntpMs(40)
+		self._close()
+
+		offset = ((received - sentAt) + (transmitted - t)) // 2
+		self.delay = (t - sentAt) - (transmitted - received)
+		if self.offset == None:
+			self.step = offset - (time.time() * 1000 - t)
+		else:
+			self.step = offset - (self._utcMs(t) - t)
+			elapsed = t - self.syncedAt
+			drift = (offset - self.offset) * 1000000 / elapsed
+			# A step bigger than any crystal is out by is the time being changed, not drift
+			if elapsed >= 60000 and abs(drift) < 500:
+				self.drift = drift if self.syncs == 1 else (self.drift + drift) / 2
+		self.offset = offset
+		self.syncedAt = t
+		self.syncs += 1
+		self._wait = self.retry
+		self._nextSync = t + self.interval * 1000
+		print("NTP sync, clock moved %d ms (round trip %d ms, drift %.1f ppm)" % (self.step, self.delay, self.drift))
+		if self.onSync:
+			self.onSync()
+		return True
+
+	# NTP timestamp at "pos" in the packet as UTC ms
+	def _ntpMs(self, pos):
+		seconds, fraction = struct.unpack_from("!II", self._packet, pos)
+		if seconds < 0x80000000: # After the NTP era rolls over in 2036
+			seconds += 1 << 32
+		return (seconds - NTP_TO_UNIX_EPOCH) * 1000 + ((fraction * 1000) >> 32)
+
+	def _failed(self, t, reason):
+		self._close()
+		self._address = None # The server may have moved (pool.ntp.org rotates)
+		self.failures += 1
+		print("NTP " + reason + ", retrying in %d seconds" % self._wait)
+		self._nextSync = t + self._wait * 1000
+		self._wait = min(self._wait * 2, self.interval)
+
+	def _close(self):
+		if self._socket != None:
+			try:
+				self._socket.close()
+			except OSError:
+				pass
+			self._socket = None
@@ -0,0 +1,24 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Watchdog timer
+#
+# Reboots the board if feed() isn't called for "timeout" seconds (True = 8
+# seconds), feed() does nothing when the watchdog isn't in use.
+#
+
+import microcontroller
+from watchdog import WatchDogMode
+
+class Watchdog:
+	def __init__(self, timeout=False):
+		self.enabled = bool(timeout)
+		if self.enabled:
+			self._wdt = microcontroller.watchdog
+			self._wdt.mode = WatchDogMode.RESET
+			self._wdt.timeout = 8 if timeout is True else timeout
+
+	def feed(self):
+		if self.enabled:
+			self._wdt.feed()
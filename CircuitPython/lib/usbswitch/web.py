@@ -0,0 +1,43 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Web server polling and /stats page
+#
+
+import time
+from adafruit_httpserver import Request, Response, NO_REQUEST
+
+# Serve usbswitch.instrument stats as JSON from /stats, with the web server
+# recovery counts if "link" (a usbswitch.network.Link) is given
+def addStats(server, runStats, link=None):
+	@server.route("/stats")
+	def statsPage(request: Request):
+		extra = {"Web": link.summary()} if link != None else None
+		return Response(request, runStats.json(extra), content_type='application/json')
+
+# Handle any waiting request on "link"'s server (a usbswitch.network.Link).
+# If the server fails it is rebuilt by the link rather than restarting the board.
+# Returns the server.poll() result (NO_REQUEST while the server is down)
+def poll(link, wdt, runStats):
+	wdt.feed()
+	if not link.up and not link.recover():
+		return NO_REQUEST
+	start = runStats.start()
+	try:
+		result = link.server.poll()
+	except OSError as e:
+		link.failed(e)
+		return NO_REQUEST
+	if result != NO_REQUEST:
+		runStats.request(start)
+	runStats.loop(start)
+	return result
+
+# Handle requests forever
+def serve(link, wdt, runStats):
+	print("Waiting for requests from web browser")
+	while True:
+		poll(link, wdt, runStats)
+		if not link.up:
+			time.sleep(min(1, link.retryIn()))
@@ -5,21 +5,37 @@
 # Compatible Pico or Pico W
 #
 # 2023-08-30
+# 2026-10-17 Hold the button down to turn off
 #
 
 # Momentary Push Button
 # 
 # Connect switch between GND and GP13
 #
+# Press to toggle the power, hold for "holdOff" ms to turn it off whatever
+# state it was in.
+#
+# Copy code.py to the CIRCUITPY drive and the lib/usbswitch folder to its lib folder.
+#
 
 import board
 import digitalio
 import keypad
+import time
+from usbswitch.gestures import Gestures, SHORT, LONG
 
 # Start with power on (True) or off (False)?
 
 initialState = False
 
+# How long to hold the button to turn off (ms)
+
+holdOff = 1000
+
+# How often to check for keypresses when idle (seconds)
+
+pollInterval = 0.01
+
 # Setup GPIO pin for Power control
 
 pwrCtrl = digitalio.DigitalInOut(board.GP2)
@@ -31,11 +47,27 @@ pwrCtrl.value = initialState
 
 keys = keypad.Keys((board.GP13,), value_when_pressed=False, pull=True)
 
+def toggle():
+	pwrCtrl.value = not pwrCtrl.value
+
+def turnOff():
+	pwrCtrl.value = False
+
+# Button gestures, (key number, gesture): action
+# A short press toggles when the button is released, so a long one doesn't toggle first
+
+gestures = Gestures({
+	(0, SHORT): toggle,
+	(0, LONG): turnOff,
+}, longMs=holdOff)
+
 while True:
 	# Get any keypad events
 	event = keys.events.get()
 
-	# Check if there was an event, if so was it a keypress?
-	if event and event.pressed:
-		# Button pressed so toggle the power control pin
-		pwrCtrl.value = not pwrCtrl.value
+	if event:
+		gestures.event(event)
+	else:
+		# Run a long press once the button has been held long enough
+		gestures.expire()
+		time.sleep(pollInterval)
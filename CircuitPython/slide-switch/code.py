@@ -5,28 +5,109 @@
 # Compatible Pico or Pico W
 #
 # 2023-08-30
+# 2026-10-17 Only switch on debounced changes, sleep in between
 #
 
 # Simple slide button
-# 
+#
 # Connect a slide or toggle switch between GND and GP13
 #
+# The power is only switched when the slide switch has moved and settled,
+# rather than rewriting it as fast as the loop can go. In between the Pico
+# waits in light sleep (GP2 keeps its state), so it uses less power and stays
+# cool. While connected to a computer over USB CircuitPython doesn't really
+# sleep, but it still waits rather than looping.
+#
+# With the switch open a PinAlarm wakes it as soon as GP13 is pulled low.
+# A PinAlarm always pulls the pin away from the level it waits for, so one
+# waiting for an opened switch would pull GP13 down and never see it go high.
+# With the switch closed it wakes every "closedCheck" seconds to look instead.
+#
+# Debouncing is timed with supervisor.ticks_ms(), time.monotonic() is a float
+# which loses precision the longer the board is up.
+#
 
+import alarm
 import board
 import digitalio
+import keypad
+import time
+from supervisor import ticks_ms
+
+# Use light sleep between changes (True) or wait for keypad events (False)
+
+lowPower = True
+
+# The switch must read the same for this many ms to count as moved
+
+debounce = 20
+
+# How often to check a closed switch when in light sleep
+
+closedCheck = 0.1
 
 # Setup GPIO pin for Power control
 
 pwrCtrl = digitalio.DigitalInOut(board.GP2)
 pwrCtrl.direction = digitalio.Direction.OUTPUT
 
-# Setup GPIO pin for Slide Switch
+# ticks_ms() wraps every 2**29 ms (about 6 days)
+TICKS_MASK = (1 << 29) - 1
+
+# ms since ticks_ms() was "since", allowing for it wrapping
+def msSince(since):
+	return (ticks_ms() - since) & TICKS_MASK
+
+# Read the slide switch, True when closed (on). If it isn't where it was
+# ("last") wait for it to stop bouncing.
+# GP13 is only claimed while being read as the PinAlarm needs it while asleep
+
+def readSwitch(last=None):
+	with digitalio.DigitalInOut(board.GP13) as slideSwitch:
+		slideSwitch.switch_to_input(pull=digitalio.Pull.UP)
+		closed = not slideSwitch.value
+		if closed == last:
+			return closed
+		since = ticks_ms()
+		while msSince(since) < debounce:
+			time.sleep(debounce / 4000)
+			if slideSwitch.value == closed:
+				closed = not closed
+				since = ticks_ms()
+	return closed
+
+def setPower(value):
+	if pwrCtrl.value != value:
+		pwrCtrl.value = value
+
+if lowPower:
+	closed = None
+	while True:
+		closed = readSwitch(closed)
+		setPower(closed)
 
-slideSwitch = digitalio.DigitalInOut(board.GP13)
-slideSwitch.switch_to_input(pull=digitalio.Pull.UP)
+		if closed:
+			# TimeAlarm only takes a time.monotonic() time, which after about 6
+			# days up is only precise to 1/4 second (CircuitPython floats have 22
+			# bits), so "closedCheck" would be rounded away and the alarm would go
+			# off straight away every time. time.sleep() (timed in ms) is used then.
+			now = time.monotonic()
+			if now + closedCheck <= now:
+				time.sleep(closedCheck)
+				continue
+			wake = alarm.time.TimeAlarm(monotonic_time=now + closedCheck)
+		else:
+			# A level alarm, so it goes off straight away if the switch closed while being read
+			wake = alarm.pin.PinAlarm(pin=board.GP13, value=False, pull=True)
+		alarm.light_sleep_until_alarms(wake)
+else:
+	# keypad scans and debounces GP13 in the background, a switch closed at
+	# startup is reported as pressed on the first scan
+	keys = keypad.Keys((board.GP13,), value_when_pressed=False, pull=True, interval=debounce / 1000)
+	event = keypad.Event()
 
-while True:
-	if slideSwitch.value:
-		pwrCtrl.value = False
-	else:
-		pwrCtrl.value = True
+	while True:
+		if keys.events.get_into(event):
+			setPower(event.pressed)
+		else:
+			time.sleep(debounce / 1000)
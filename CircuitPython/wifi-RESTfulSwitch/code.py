@@ -5,6 +5,8 @@
 # Compatible Pico W
 #
 # 2023-09-27
+# 2026-10-17 Use the shared usbswitch library
+# 2026-10-17 Recover from web server errors without restarting the board
 #
 # WiFi RESTful Switch
 # An untested example which will hopefully be useful for Home Assistant users
@@ -16,12 +18,19 @@
 #
 # switch:
 #   - platform: rest
-#     resource: http://<IP>/
-#     state_resource: http://<IP>/state
+#     resource: http://<IP>/api/v1/switch
+#     method: put
+#     state_resource: http://<IP>/api/v1/state
+#     headers:
+#       Content-Type: application/json
 #     body_on: '{"button": "true"}'
 #     body_off: '{"button": "false"}'
 #     is_on_template: "{{ value_json.button }}"
 #
+# /api/v1/state returns an ETag which changes whenever the power state does,
+# clients sending it back in If-None-Match get an empty "304 Not Modified"
+# until the state changes.
+#
 
 
 # This example requires the additional library adafruit_httpserver
@@ -29,7 +38,8 @@
 # https://learn.adafruit.com/keep-your-circuitpython-libraries-on-devices-up-to-date-with-circup/
 #
 # Once CircuitPython is installed plugin your "USB Power Switch Pro (with Pico W onboard)"
-# copy the settings.toml and code.py files to the CIRCUITPY drive.
+# copy the settings.toml and code.py files to the CIRCUITPY drive
+# and the lib/usbswitch folder to its lib folder.
 #
 # Edit settings.toml to configure your WiFi credentials
 # (See https://docs.circuitpython.org/en/latest/docs/environment.html )
@@ -45,14 +55,10 @@
 #
 
 import os
-import board
-import wifi
-import time
-import microcontroller
-import socketpool
-from digitalio import DigitalInOut, Direction
-from adafruit_httpserver import Server, Request, Response, POST, GET
-from watchdog import WatchDogMode
+from adafruit_httpserver import Request, Response, Status, POST, GET, PUT, BAD_REQUEST_400
+from usbswitch import instrument, network, web
+from usbswitch.relay import Relay
+from usbswitch.wdt import Watchdog
 
 # Set to True to use watchdog timer to reboot on CircuitPython crashes
 watchdogTimeout = False
@@ -63,96 +69,113 @@ device_name = "USBSwitch"
 
 initialState = False
 
-if watchdogTimeout:
-	wdt = microcontroller.watchdog
-	wdt.mode = WatchDogMode.RESET
-	wdt.timeout = 8
+wdt = Watchdog(watchdogTimeout)
 
 # Setup GPIO pin for Power control
 
-pwr = DigitalInOut(board.GP2)
-pwr.direction = Direction.OUTPUT
-pwr.value = initialState
+pwr = Relay(initialState)
+
+# Loop / request timing, heap and reset reason stats (served as JSON from /stats)
+runStats = instrument.Stats()
 
 # Setup web server
 
-WiFi_SSID = os.getenv('CIRCUITPY_WIFI_SSID')
-WiFi_Password = os.getenv('CIRCUITPY_WIFI_PASSWORD')
-
-# Check WiFi connection details have been setup
-
-if WiFi_SSID == None or WiFi_SSID == "" or WiFi_Password == None or WiFi_Password == "":
-	while True:
-		print("Waiting for WiFi details to be setup in settings.toml")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-
-print("Connecting to WiFi")
-try:
-	if watchdogTimeout: wdt.feed()
-	wifi.radio.connect(WiFi_SSID, WiFi_Password)
-except OSError:
-	while True:
-		print("Unable to connect to WiFi, check details in settings.toml")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-
-print("Starting web server")
-try:
-	if watchdogTimeout: wdt.feed()
-	pool = socketpool.SocketPool(wifi.radio)
-	server = Server(pool, "/static", debug=True)
-	server.start(str(wifi.radio.ipv4_address))
-except OSError:
-	print("Restarting (Web server setup failed)")
-	if watchdogTimeout: wdt.feed()
-	time.sleep(5)
-	microcontroller.reset()
-
-# Return current status of USB Power Switch
-
-def getState():
-	global pwr
-
-	if pwr.value:
-		return "On"
+network.connect(wdt)
+# Rebuilds the server if it fails rather than restarting the board (which
+# would switch the power back to "initialState"). Routes are added to the
+# first server and moved across to each new one.
+link = network.Link(wdt)
+server = link.server
+web.addStats(server, runStats, link)
+
+NOT_MODIFIED_304 = Status(304, "Not Modified")
+
+# JSON state bodies, pre-encoded as they never change
+stateBodies = {True: b'{"button": "true"}', False: b'{"button": "false"}'}
+
+# Increased every time the power state changes, used as the ETag for /api/v1/state
+# bootId stops clients confusing versions from before a restart with the current ones
+bootId = "%08x" % int.from_bytes(os.urandom(4), "big")
+stateVersion = 0
+stateETag = '"%s-%d"' % (bootId, stateVersion)
+
+def setPower(value):
+	global stateVersion, stateETag
+	if pwr.set(value):
+		stateVersion += 1
+		stateETag = '"%s-%d"' % (bootId, stateVersion)
+
+def turnOn():
+	print("Turning on USB Power")
+	setPower(True)
+
+def turnOff():
+	print("Turning off USB Power")
+	setPower(False)
+
+# Commands sent by the page buttons or Home Assistant ({"button": ...})
+commands = {
+	"true": turnOn,
+	"false": turnOff,
+}
+
+def runCommand(command):
+	handler = commands.get(command)
+	if handler:
+		handler()
 	else:
-		return "Off"
+		print("Refresh")
+
+# Home Assistant sends a JSON body, the web page sends form data
+def getCommand(request):
+	if request.body.startswith(b"{"):
+		try:
+			return request.json().get("button")
+		except (ValueError, AttributeError):
+			return None
+	if request.form_data == None:
+		return None
+	return request.form_data.get("button")
 
 # Web server calls
 
 @server.route("/")
 def base(request: Request):  # pylint: disable=unused-argument
-	return Response(request, f"{webpage()}", content_type='text/html')
+	return Response(request, webpage(), content_type='text/html')
 
 @server.route("/state", GET)
 def status(request: Request):
-	global pwr
-	if pwr.value:
-		return Response(request, '{"button": "true"}', content_type='text/html')
-	else:
-		return Response(request, '{"button": "false"}', content_type='text/html')
+	return Response(request, stateBodies[bool(pwr.value)], content_type='application/json')
+
+def stateResponse(request: Request):
+	headers = {"ETag": stateETag, "Cache-Control": "no-cache"}
+	ifNoneMatch = request.headers.get("If-None-Match")
+	if ifNoneMatch and stateETag in ifNoneMatch:
+		return Response(request, status=NOT_MODIFIED_304, headers=headers, content_type='application/json')
+	return Response(request, stateBodies[bool(pwr.value)], headers=headers, content_type='application/json')
+
+@server.route("/api/v1/state", GET)
+def apiState(request: Request):
+	return stateResponse(request)
+
+@server.route("/api/v1/switch", PUT)
+def apiSwitch(request: Request):
+	handler = commands.get(getCommand(request))
+	if handler == None:
+		return Response(request, '{"error": "unknown button value"}', status=BAD_REQUEST_400, content_type='application/json')
+	handler()
+	return stateResponse(request)
 
 @server.route("/", POST)
 def buttonpress(request: Request):
-	global pwr
-
-	raw_text = request.raw_request.decode("utf8")
-
-	if "true" in raw_text:
-		print("Turning on USB Power")
-		pwr.value = True
+	runCommand(getCommand(request))
 
-	elif "false" in raw_text:
-		print("Turning off USB Power")
-		pwr.value = False
+	return Response(request, webpage(), content_type='text/html')
 
-	else:
-		print("Refresh")
+# The page only changes with the power state, so render both versions once
+# at startup and serve the matching one without rebuilding it on every request
 
-	return Response(request, f"{webpage()}", content_type='text/html')
-
-def webpage():
+def renderPage(state):
 	html = f"""<html>
  <head>
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
@@ -160,25 +183,21 @@ def webpage():
  </head>
  <body>
   <h1>{device_name}</h1>
-  Power Status: {getState()}<br /><br />
+  Power Status: {state}<br /><br />
   <form accept-charset="utf-8" method="POST">
    <button class="button" name="button" value="true" type="submit">Power On</button><br /><br />
    <button class="button" name="button" value="false" type="submit">Power Off</button><br /><br />
-   <button class="button" name="refresh" value="REFRESH" type="submit">Refresh</button><br />
+   <button class="button" name="button" value="REFRESH" type="submit">Refresh</button><br />
   </form>
  </body>
 </html>"""
 	return html
 
+pages = {True: renderPage("On").encode(), False: renderPage("Off").encode()}
+
+def webpage():
+	return pages[bool(pwr.value)]
+
 # Main loop
 
-print("Waiting for requests from web browser")
-while True:
-	try:
-		if watchdogTimeout: wdt.feed()
-		server.poll()
-	except OSError:
-		print("Restarting (Loop)")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-		microcontroller.reset()
+web.serve(link, wdt, runStats)
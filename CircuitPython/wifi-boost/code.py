@@ -6,20 +6,33 @@
 #
 # 2023-09-03
 # 2023-09-27 Add support for Watchdog timer
+# 2026-10-17 Run web server, keypad, boost expiry and NTP as asyncio tasks
+# 2026-10-17 Use the shared usbswitch library
+# 2026-10-17 Short/double/long press and hold on GP12 select the boost time
+# 2026-10-17 Time boosts on the monotonic clock, non-blocking NTP and local time with DST
+# 2026-10-17 Recover from web server errors without restarting the board
 #
 # WiFi Boost
 #
 # Connect ON/BOOST switch between GND and GP12
 # Connect OFF switch between GND and GP13
-# 
+#
+# Press GP12 once to boost for 15 minutes, twice for 30 minutes or hold it
+# down for 60 minutes (keep holding to add 15 minutes a second).
+# Boosting while already on adds to the time left.
+#
+# Optional daily on/off times can be set with DAILY_SCHEDULE in settings.toml,
+# in local time as set by TZ (see usbswitch/timekeeping.py), UTC if not set.
+# Daily times start once the time has been set from NTP.
 #
 
-# This example requires the additional libraries adafruit_httpserver, adafruit_ntp
+# This example requires the additional libraries adafruit_httpserver, asyncio
 # which can be installed using circup
 # https://learn.adafruit.com/keep-your-circuitpython-libraries-on-devices-up-to-date-with-circup/
 #
 # Once Python is installed plugin your "USB Power Switch Pro (with Pico W onboard)"
-# copy the settings.toml and code.py files to the CIRCUITPY drive.
+# copy the settings.toml and code.py files to the CIRCUITPY drive
+# and the lib/usbswitch folder to its lib folder.
 #
 # Edit settings.toml to configure your WiFi credentials
 # (See https://docs.circuitpython.org/en/latest/docs/environment.html )
@@ -35,22 +48,40 @@
 
 import os
 import time
+import asyncio
 import board
-import rtc
-import wifi
-import socketpool
-import microcontroller
-import adafruit_ntp
-from digitalio import DigitalInOut, Direction, Pull
 import keypad
-from adafruit_httpserver import Server, Request, Response, POST
-from watchdog import WatchDogMode
+from adafruit_httpserver import Request, Response, POST, NO_REQUEST
+from usbswitch import instrument, network, web, timekeeping
+from usbswitch.events import Events
+from usbswitch.relay import Relay
+from usbswitch.wdt import Watchdog
+from usbswitch.scheduler import Scheduler
+from usbswitch.gestures import Gestures, PRESS, SHORT, DOUBLE, LONG, HOLD
+from usbswitch.timekeeping import Clock, TimeZone
 
 # Set to True to use watchdog timer to reboot on CircuitPython crashes
 watchdogTimeout = False
 
-# Number of seconds to turn on for when boost button is pressed
-onBoost = 60*30 # 30 minutes
+# Number of seconds to turn on for when boost button is pressed (short),
+# pressed twice (double), held down (long) and for each second it is held after that
+shortBoost = 60*15
+doubleBoost = 60*30
+longBoost = 60*60
+holdBoost = 60*15
+
+# How often to check for new web requests / keypresses when idle (seconds)
+httpPollInterval = 0.05
+keypadPollInterval = 0.02
+
+# Maximum number of /events listeners (more are refused with 503 until one goes away)
+maxSubscribers = 4
+
+# How often to send a keep-alive to /events listeners, so closed ones are noticed (seconds)
+eventKeepAlive = 30
+
+# How often to update the time via NTP (seconds)
+ntpInterval = 60*60*24
 
 # Start with power on (True) or off (False)?
 
@@ -58,141 +89,187 @@ initialState = False
 
 # https://learn.adafruit.com/key-pad-matrix-scanning-in-circuitpython/keys-one-key-per-pin
 
-# GP12 = power on for "onBoost" seconds
+# GP12 = power on for a boost (see above)
 # GP13 = power off
 
 keys = keypad.Keys((board.GP12, board.GP13), value_when_pressed=False, pull=True)
 
 # GPIO Setup
-pwr = DigitalInOut(board.GP2)
-pwr.direction = Direction.OUTPUT
-pwr.value = initialState
+pwr = Relay(initialState)
+
+offAt = None # Monotonic ms (see usbswitch/timekeeping.py)
+offEntry = None
 
-offAt = None
+# Set whenever the schedule changes so the schedule task can recalculate when to wake up
+scheduleChanged = asyncio.Event()
+scheduler = Scheduler(onChange=scheduleChanged.set)
 
-WiFi_SSID = os.getenv('CIRCUITPY_WIFI_SSID')
-WiFi_Password = os.getenv('CIRCUITPY_WIFI_PASSWORD')
 device_name = os.getenv('CIRCUITPY_WEB_INSTANCE_NAME') or "USBSwitch"
+daily_schedule = os.getenv('DAILY_SCHEDULE') or ""
 
 # Init Watchdog
-if watchdogTimeout:
-	wdt = microcontroller.watchdog
-	wdt.mode = WatchDogMode.RESET
-	wdt.timeout = 8
+wdt = Watchdog(watchdogTimeout)
 
-# Check WiFi connection details have been setup
+# Loop / request timing, heap and reset reason stats (served as JSON from /stats)
+runStats = instrument.Stats()
 
-if WiFi_SSID == None or WiFi_SSID == "" or WiFi_Password == None or WiFi_Password == "":
-	while True:
-		print("Waiting for WiFi details to be setup in settings.toml")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-
-print("Connecting to WiFi")
-try:
-	if watchdogTimeout: wdt.feed()
-	wifi.radio.connect(WiFi_SSID, WiFi_Password)
-except OSError:
-	while True:
-		print("Unable to connect to WiFi, check details in settings.toml")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
+network.connect(wdt)
+# Rebuilds the server if it fails rather than restarting the board (which
+# would switch the power back to "initialState" and forget "offAt"). Routes
+# are added to the first server and moved across to each new one.
+link = network.Link(wdt)
+server = link.server
+web.addStats(server, runStats, link)
 
-print("Starting web server")
-try:
-	if watchdogTimeout: wdt.feed()
-	pool = socketpool.SocketPool(wifi.radio)
-	server = Server(pool, "/static", debug=True)
-	server.start(str(wifi.radio.ipv4_address))
-except OSError:
-	print("Restarting (Web server setup failed)")
-	if watchdogTimeout: wdt.feed()
-	time.sleep(5)
-	microcontroller.reset()
-
-# Update time and setup web server
+# Wall clock time from NTP, in the background so it doesn't hold anything up
 try:
-	if watchdogTimeout: wdt.feed()
-	ntp = adafruit_ntp.NTP(pool, tz_offset=0)
-	print("Getting time via NTP")
-	rtc.RTC().datetime = ntp.datetime
-	lastntp = time.time()
-except OSError:
-	print("Restarting (Initial NTP failed)")
-	if watchdogTimeout: wdt.feed()
-	time.sleep(5)
-	microcontroller.reset()
+	timeZone = TimeZone(os.getenv('TZ') or "UTC0")
+except ValueError as e:
+	print(e)
+	timeZone = TimeZone()
+clock = Clock(link.pool, os.getenv('NTP_SERVER') or "pool.ntp.org", timeZone, ntpInterval)
 
 # Helper functions
 
-# return string of current date/time
-def getTime(t):
-	if t == None:
+# return string of local date/time at monotonic ms "at"
+def getTime(at):
+	if at == None:
 		return " - "
-	d=time.localtime(t)
+	d=clock.localtime(at)
 	return "%4d-%02d-%02d %02d:%02d:%02d" % (d[0],d[1],d[2],d[3],d[4],d[5])
 
-# Return current status of USB Power Switch
-
-def getState():
-	global pwr
-	if pwr.value:
-		return "On"
-	else:
-		return "Off"
-
 # Boot ON period by X seconds
 def boost(t):
-	global offAt, pwr
+	global offAt, offEntry
 
 	pwr.value=True
-        
+
 	if offAt == None: # Not currently on 
-		offAt = time.time()+t
+		offAt = timekeeping.now()+t*1000
+		offEntry = scheduler.schedule(offAt, turnOff)
 		print("Schedule off At: ", end="")
 	else: # Already on so add t seconds to offAt
-		offAt = offAt+t
+		offAt = offAt+t*1000
+		scheduler.reschedule(offEntry, offAt)
 		print("Schedule now off At: ", end="")
-	print(time.localtime(offAt))
+	print(getTime(offAt))
+	events.notify()
 
 # Turn OFF power and reset "offAt"
 def turnOff():
-	global pwr, offAt
-	print("Turning off at: " + getTime(time.time()) )
+	global offAt, offEntry
+	print("Turning off at: " + getTime(timekeeping.now()) )
 	pwr.value=False
 	offAt = None
+	if offEntry != None:
+		scheduler.cancel(offEntry)
+		offEntry = None
+	events.notify()
+
+def turnOn():
+	print("Turning on USB Power")
+	pwr.value = True
+	events.notify()
+
+# Server-Sent Events, listeners on /events are sent the state whenever it changes
+
+def stateEvent():
+	return '{"power":%s,"offAt":%s}' % ("true" if pwr.value else "false", "null" if offAt == None else "%d" % clock.utc(offAt))
+
+events = Events(stateEvent, maxSubscribers, eventKeepAlive)
+
+# Daily on/off times, each [hour, minute, action, scheduler entry]
+dailySlots = []
+
+# Schedule each daily time for its next occurrence in local time. Called again
+# whenever NTP syncs, as that may have moved the wall clock
+def planDaily():
+	if not clock.synced:
+		return
+	for slot in dailySlots:
+		at = clock.nextLocal(slot[0], slot[1])
+		if slot[3] == None:
+			slot[3] = scheduler.schedule(at, lambda slot=slot: runDaily(slot))
+		else:
+			scheduler.reschedule(slot[3], at)
+
+# Run a daily action then schedule it for tomorrow, worked out again in local
+# time (rather than adding 24 hours) so it follows DST changes
+def runDaily(slot):
+	slot[2]()
+	scheduler.reschedule(slot[3], clock.nextLocal(slot[0], slot[1], timekeeping.now() + 60000))
+
+# "hh:mm" as (hour, minute), ValueError if it isn't a time of day
+def parseTime(hhmm):
+	h, m = hhmm.split(":")
+	h, m = int(h), int(m)
+	if not (0 <= h <= 23 and 0 <= m <= 59):
+		raise ValueError(hhmm)
+	return h, m
+
+# DAILY_SCHEDULE = "06:00-06:30,18:00-19:00" turns on/off at those times every day.
+# Both times of a slot are checked before either is added, so a bad off time
+# can't leave a daily on without its off
+def scheduleDaily(slots):
+	for slot in slots.split(","):
+		slot = slot.strip()
+		if slot == "":
+			continue
+		try:
+			on, off = slot.split("-")
+			onTime, offTime = parseTime(on), parseTime(off)
+		except ValueError:
+			print("Invalid DAILY_SCHEDULE slot: " + slot)
+			continue
+		dailySlots.append([onTime[0], onTime[1], turnOn, None])
+		dailySlots.append([offTime[0], offTime[1], turnOff, None])
+		print("Daily on " + on + " off " + off)
+	clock.onSync = planDaily
+	planDaily()
+
+# Commands sent by the page buttons (name="button" value=...)
+commands = {
+	"ON": turnOn,
+	"OFF": turnOff,
+	"BOOST15": lambda: boost(15*60),
+	"BOOST30": lambda: boost(30*60),
+	"BOOST45": lambda: boost(45*60),
+	"BOOST60": lambda: boost(60*60),
+}
+
+def runCommand(command):
+	handler = commands.get(command)
+	if handler:
+		handler()
+	else:
+		print("Refresh")
 
 # Web server calls
 
 @server.route("/")
 def base(request: Request):  # pylint: disable=unused-argument
-	return Response(request, f"{webpage()}", content_type='text/html')
+	return Response(request, webpage(), content_type='text/html')
+
+server.route("/events")(events.route)
 
 @server.route("/", POST)
 def buttonpress(request: Request):
-	global pwr
-
-	raw_text = request.raw_request.decode("utf8")
-
-	if "ON" in raw_text:
-		print("Turning on USB Power")
-		pwr.value = True
-	elif "OFF" in raw_text:
-		turnOff()
-	elif "BOOST15" in raw_text:
-		boost(15*60)
-	elif "BOOST30" in raw_text:
-		boost(30*60)
-	elif "BOOST45" in raw_text:
-		boost(45*60)
-	elif "BOOST60" in raw_text:
-		boost(60*60)
-	else:
-		print("Refresh")
+	runCommand(request.form_data.get("button"))
 
-	return Response(request, f"{webpage()}", content_type='text/html')
+	return Response(request, webpage(), content_type='text/html')
 
-def webpage():
+# The page is rendered once at startup with placeholders for the status, offAt
+# and current time. Requests then patch only the fields that have changed into
+# the same buffer, which is served without being copied.
+
+statusMark = "\x01" * 3
+offAtMark = "\x02" * 19
+nowMark = "\x03" * 19
+
+noTime = b" -                 "
+timeTemplate = b"0000-00-00 00:00:00"
+
+def renderPage():
 	html = f"""<html>
  <head>
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
@@ -200,62 +277,149 @@ def webpage():
  </head>
  <body>
   <h1>{device_name}</h1>
-  Power Status: {getState()}<br />
-  Power offAt: {getTime(offAt)}<br />
-  Time now: {getTime(time.time())}<br /><br />
+  Power Status: {statusMark}<br />
+  Power offAt: {offAtMark}<br />
+  Time now: {nowMark}<br /><br />
   <form accept-charset="utf-8" method="POST">
-   <button class="button" name="pwron" value="ON" type="submit">Power On</button>
-   <button class="button" name="pwroff" value="OFF" type="submit">Power Off</button>
-   <button class="button" name="refresh" value="REFRESH" type="submit">Refresh</button>
+   <button class="button" name="button" value="ON" type="submit">Power On</button>
+   <button class="button" name="button" value="OFF" type="submit">Power Off</button>
+   <button class="button" name="button" value="REFRESH" type="submit">Refresh</button>
    <br /><br /><br />
-   <button class="button" name="pwrboost" value="BOOST15" type="submit">On +15 min</button>
-   <button class="button" name="pwrboost" value="BOOST30" type="submit">On +30 min</button>
+   <button class="button" name="button" value="BOOST15" type="submit">On +15 min</button>
+   <button class="button" name="button" value="BOOST30" type="submit">On +30 min</button>
    <br /><br /><br />
-   <button class="button" name="pwrboost" value="BOOST45" type="submit">On +45 min</button>
-   <button class="button" name="pwrboost" value="BOOST60" type="submit">On +1 hr</button>
+   <button class="button" name="button" value="BOOST45" type="submit">On +45 min</button>
+   <button class="button" name="button" value="BOOST60" type="submit">On +1 hr</button>
   </form>
+  <script>
+   var first = true;
+   new EventSource("/events").addEventListener("state", function() {{ if (!first) location.href = "/"; first = false; }});
+  </script>
  </body>
 </html>"""
 	return html
 
-# Main loop
+page = bytearray(renderPage().encode())
+statusPos = page.find(statusMark.encode())
+offAtPos = page.find(offAtMark.encode())
+nowPos = page.find(nowMark.encode())
 
-print("Waiting for requests from web browser")
-while True:
-	if watchdogTimeout: wdt.feed()
+# Values currently patched into "page" ("" so the first request fills them all in)
+pageState = ""
+pageOffAt = ""
+pageNow = ""
 
-	# Once a day try to update the time via NTP
+# Write n as "width" zero padded digits into buf at pos
+def putDigits(buf, pos, n, width):
+	for i in range(pos + width - 1, pos - 1, -1):
+		buf[i] = 48 + n % 10
+		n //= 10
 
-	if lastntp+60*60*24 < time.time():
-		print("Updating RTC from NTP")
-		print(time.localtime())
-		try:
-			rtc.RTC().datetime = ntp.datetime
-			print(time.localtime())
-		except Exception as e:
-			print("NTP Update failed")
-
-		# Even if it failed we don't try again until tomorrow
-		lastntp=time.time()
-
-	# Check for keypress
-
-	event = keys.events.get()
-	if event:
-		if event.key_number == 0 and event.pressed: # GP12 pressed
-			boost(onBoost)
-		if event.key_number == 1 and event.pressed: # GP13 pressed
-			turnOff()
-
-	# If "offAt" has been reached turn the power OFF
-	if offAt != None and time.time() > offAt:
-		turnOff()
-
-	try:
-		if watchdogTimeout: wdt.feed()
-		server.poll()
-	except OSError:
-		print("Restarting (Loop)")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-		microcontroller.reset()
+# Write local time t (seconds from 1970) as "YYYY-MM-DD HH:MM:SS" into buf at pos
+def putTime(buf, pos, t):
+	if t == None:
+		buf[pos:pos+19] = noTime
+		return
+	d = time.localtime(t)
+	buf[pos:pos+19] = timeTemplate
+	putDigits(buf, pos, d[0], 4)
+	putDigits(buf, pos+5, d[1], 2)
+	putDigits(buf, pos+8, d[2], 2)
+	putDigits(buf, pos+11, d[3], 2)
+	putDigits(buf, pos+14, d[4], 2)
+	putDigits(buf, pos+17, d[5], 2)
+
+def webpage():
+	global pageState, pageOffAt, pageNow
+
+	state = pwr.value
+	if state != pageState:
+		page[statusPos:statusPos+3] = b"On " if state else b"Off"
+		pageState = state
+
+	offAtLocal = None if offAt == None else clock.local(offAt)
+	if offAtLocal != pageOffAt:
+		putTime(page, offAtPos, offAtLocal)
+		pageOffAt = offAtLocal
+
+	now = clock.local()
+	if now != pageNow:
+		putTime(page, nowPos, now)
+		pageNow = now
+
+	return page
+
+# The old server's /events connections went with it, NTP uses the new pool
+def recovered(link):
+	events.dropAll()
+	clock.pool = link.pool
+
+link.onRecovered = recovered
+
+# Tasks
+
+# Handle web requests, only sleeping when there is nothing waiting.
+# web.poll() feeds the watchdog, so while the server is down it still wakes
+# at least every second (as web.serve() does) rather than waiting out the
+# whole retry, which can be longer than the watchdog timeout.
+async def httpTask():
+	while True:
+		if web.poll(link, wdt, runStats) == NO_REQUEST:
+			await asyncio.sleep(max(httpPollInterval, min(1, link.retryIn())))
+		else:
+			events.welcome()
+			await asyncio.sleep(0)
+
+# Keep /events connections alive and notice any which have closed
+async def keepAliveTask():
+	while True:
+		await asyncio.sleep(eventKeepAlive)
+		events.ping()
+
+# Button gestures, (key number, gesture): action
+# (keys are numbered in the order given to keypad.Keys, GP12 = 0, GP13 = 1)
+gestures = Gestures({
+	(0, SHORT): lambda: boost(shortBoost),
+	(0, DOUBLE): lambda: boost(doubleBoost),
+	(0, LONG): lambda: boost(longBoost),
+	(0, HOLD): lambda: boost(holdBoost),
+	(1, PRESS): turnOff,
+}, longMs=800, doubleMs=300, repeatMs=1000)
+
+# Check for keypresses, keypad queues events in the background so none are missed while sleeping
+async def keypadTask():
+	while True:
+		event = keys.events.get()
+		if event:
+			gestures.event(event)
+		else:
+			gestures.expire()
+			await asyncio.sleep(keypadPollInterval)
+
+# Sleep until the next scheduled action is due (or the schedule changes) then run it
+async def scheduleTask():
+	while True:
+		scheduleChanged.clear()
+		scheduler.runDue(timekeeping.now())
+		nextDue = scheduler.nextDue()
+		if nextDue == None:
+			await scheduleChanged.wait()
+		else:
+			try:
+				await asyncio.wait_for(scheduleChanged.wait(), max(0, nextDue - timekeeping.now()) / 1000)
+			except asyncio.TimeoutError:
+				pass
+
+# Keep the wall clock in step with NTP, once a day (sooner if a sync fails).
+# The query doesn't block, so requests and keypresses are still handled
+async def ntpTask():
+	while True:
+		await asyncio.sleep(clock.poll())
+
+async def main():
+	await asyncio.gather(httpTask(), keypadTask(), scheduleTask(), ntpTask(), keepAliveTask())
+
+scheduleDaily(daily_schedule)
+
+print("Waiting for requests from web browser")
+asyncio.run(main())
@@ -6,6 +6,8 @@
 #
 # 2023-09-02
 # 2023-09-27 Add support for Watchdog timer
+# 2026-10-17 Use the shared usbswitch library
+# 2026-10-17 Recover from web server errors without restarting the board
 #
 # WiFi Buttons
 #
@@ -15,7 +17,8 @@
 # https://learn.adafruit.com/keep-your-circuitpython-libraries-on-devices-up-to-date-with-circup/
 #
 # Once CircuitPython is installed plugin your "USB Power Switch Pro (with Pico W onboard)"
-# copy the settings.toml and code.py files to the CIRCUITPY drive.
+# copy the settings.toml and code.py files to the CIRCUITPY drive
+# and the lib/usbswitch folder to its lib folder.
 #
 # Edit settings.toml to configure your WiFi credentials
 # (See https://docs.circuitpython.org/en/latest/docs/environment.html )
@@ -30,15 +33,10 @@
 # Visit the URL shown in a web browser (on the same WiFi network)
 #
 
-import os
-import board
-import wifi
-import time
-import microcontroller
-import socketpool
-from digitalio import DigitalInOut, Direction
-from adafruit_httpserver import Server, Request, Response, POST
-from watchdog import WatchDogMode
+from adafruit_httpserver import Request, Response, POST
+from usbswitch import instrument, network, web
+from usbswitch.relay import Relay
+from usbswitch.wdt import Watchdog
 
 # Set to True to use watchdog timer to reboot on CircuitPython crashes
 watchdogTimeout = False
@@ -49,88 +47,62 @@ device_name = "USBSwitch"
 
 initialState = False
 
-if watchdogTimeout:
-	wdt = microcontroller.watchdog
-	wdt.mode = WatchDogMode.RESET
-	wdt.timeout = 8
+wdt = Watchdog(watchdogTimeout)
 
 # Setup GPIO pin for Power control
 
-pwr = DigitalInOut(board.GP2)
-pwr.direction = Direction.OUTPUT
-pwr.value = initialState
+pwr = Relay(initialState)
+
+# Loop / request timing, heap and reset reason stats (served as JSON from /stats)
+runStats = instrument.Stats()
 
 # Setup web server
 
-WiFi_SSID = os.getenv('CIRCUITPY_WIFI_SSID')
-WiFi_Password = os.getenv('CIRCUITPY_WIFI_PASSWORD')
-
-# Check WiFi connection details have been setup
-
-if WiFi_SSID == None or WiFi_SSID == "" or WiFi_Password == None or WiFi_Password == "":
-	while True:
-		print("Waiting for WiFi details to be setup in settings.toml")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-
-print("Connecting to WiFi")
-try:
-	if watchdogTimeout: wdt.feed()
-	wifi.radio.connect(WiFi_SSID, WiFi_Password)
-except OSError:
-	while True:
-		print("Unable to connect to WiFi, check details in settings.toml")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-
-print("Starting web server")
-try:
-	if watchdogTimeout: wdt.feed()
-	pool = socketpool.SocketPool(wifi.radio)
-	server = Server(pool, "/static", debug=True)
-	server.start(str(wifi.radio.ipv4_address))
-except OSError:
-	print("Restarting (Web server setup failed)")
-	if watchdogTimeout: wdt.feed()
-	time.sleep(5)
-	microcontroller.reset()
-
-# Return current status of USB Power Switch
-
-def getState():
-	global pwr
-
-	if pwr.value:
-		return "On"
+network.connect(wdt)
+# Rebuilds the server if it fails rather than restarting the board (which
+# would switch the power back to "initialState"). Routes are added to the
+# first server and moved across to each new one.
+link = network.Link(wdt)
+server = link.server
+web.addStats(server, runStats, link)
+
+def turnOn():
+	print("Turning on USB Power")
+	pwr.value = True
+
+def turnOff():
+	print("Turning off USB Power")
+	pwr.value = False
+
+# Commands sent by the page buttons (name="button" value=...)
+commands = {
+	"ON": turnOn,
+	"OFF": turnOff,
+}
+
+def runCommand(command):
+	handler = commands.get(command)
+	if handler:
+		handler()
 	else:
-		return "Off"
+		print("Refresh")
 
 # Web server calls
 
 @server.route("/")
 def base(request: Request):  # pylint: disable=unused-argument
-	return Response(request, f"{webpage()}", content_type='text/html')
+	return Response(request, webpage(), content_type='text/html')
 
 @server.route("/", POST)
 def buttonpress(request: Request):
-	global pwr
-
-	raw_text = request.raw_request.decode("utf8")
+	runCommand(request.form_data.get("button"))
 
-	if "ON" in raw_text:
-		print("Turning on USB Power")
-		pwr.value = True
+	return Response(request, webpage(), content_type='text/html')
 
-	elif "OFF" in raw_text:
-		print("Turning off USB Power")
-		pwr.value = False
-
-	else:
-		print("Refresh")
+# The page only changes with the power state, so render both versions once
+# at startup and serve the matching one without rebuilding it on every request
 
-	return Response(request, f"{webpage()}", content_type='text/html')
-
-def webpage():
+def renderPage(state):
 	html = f"""<html>
  <head>
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
@@ -138,25 +110,21 @@ def webpage():
  </head>
  <body>
   <h1>{device_name}</h1>
-  Power Status: {getState()}<br /><br />
+  Power Status: {state}<br /><br />
   <form accept-charset="utf-8" method="POST">
-   <button class="button" name="pwron" value="ON" type="submit">Power On</button><br /><br />
-   <button class="button" name="pwroff" value="OFF" type="submit">Power Off</button><br /><br />
-   <button class="button" name="refresh" value="REFRESH" type="submit">Refresh</button><br />
+   <button class="button" name="button" value="ON" type="submit">Power On</button><br /><br />
+   <button class="button" name="button" value="OFF" type="submit">Power Off</button><br /><br />
+   <button class="button" name="button" value="REFRESH" type="submit">Refresh</button><br />
   </form>
  </body>
 </html>"""
 	return html
 
+pages = {True: renderPage("On").encode(), False: renderPage("Off").encode()}
+
+def webpage():
+	return pages[bool(pwr.value)]
+
 # Main loop
 
-print("Waiting for requests from web browser")
-while True:
-	try:
-		if watchdogTimeout: wdt.feed()
-		server.poll()
-	except OSError:
-		print("Restarting (Loop)")
-		if watchdogTimeout: wdt.feed()
-		time.sleep(5)
-		microcontroller.reset()
+web.serve(link, wdt, runStats)
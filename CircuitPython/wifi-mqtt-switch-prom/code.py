@@ -6,13 +6,27 @@
 #
 # MQTT USB Power Switch with power monitoring
 #
+# Understands the Tasmota commands POWER (ON/OFF/TOGGLE/1/0/2), PulseTime,
+# Status (0/8/10) and State sent to cmnd/<topic>/<command>
+#
+# Announces the switch and its voltage/current/power/energy sensors to Home
+# Assistant using MQTT discovery (set HA_DISCOVERY_PREFIX = "" to turn off)
+#
+# Power state changes are also pushed to browsers/integrations as
+# Server-Sent Events from http://<IP>:<HTTP_PORT>/events
+#
+# Prometheus can scrape relay state, voltage/current/power, energy used,
+# reconnect counts, free heap and uptime from http://<IP>:<HTTP_PORT>/metrics
+# and loop / request timings, heap and reset reasons from /stats
+#
 
-# This example requires the additional libraries adafruit_bus_device, adafruit_minimqtt, adafruit_register, adafruit_connection_manager, adafruit_ina219, adafruit_tricks
+# This example requires the additional libraries adafruit_bus_device, adafruit_minimqtt, adafruit_register, adafruit_connection_manager, adafruit_ina219, adafruit_tricks, adafruit_httpserver
 # which can be installed using circup
 # https://learn.adafruit.com/keep-your-circuitpython-libraries-on-devices-up-to-date-with-circup/
 #
 # Once CircuitPython is installed plugin your "USB Power Switch ProM or BJ Power Switch Pro (with Pico W onboard)"
-# copy the settings.toml and code.py files to the CIRCUITPY drive.
+# copy the settings.toml, samples.py, energy.py, persist.py, discovery.py, telemetry.py and code.py files to the CIRCUITPY drive
+# and the lib/usbswitch folder to its lib folder.
 #
 # Edit settings.toml to configure your WiFi credentials, MQTT server settings, etc.
 # (See https://docs.circuitpython.org/en/latest/docs/environment.html )
@@ -29,28 +43,113 @@ import os
 import digitalio
 import time
 import json
+import gc
+import errno
 import random
 import microcontroller
+from usbswitch import instrument
+from usbswitch.events import Events
 import supervisor
 import adafruit_ina219
 import adafruit_minimqtt.adafruit_minimqtt as MQTT
+from adafruit_httpserver import Server, Request, Response, NO_REQUEST
+from samples import SampleRing
+from energy import PowerStats
+from persist import EnergyStore
+from discovery import discoveryMessages
+from telemetry import Template
 #import adafruit_logging as logging
 
 # Get options from config file
 MQTT_TOPIC_SENSOR = os.getenv("MQTT_TOPIC_SENSOR") or "tele/UNKNOWN/SENSOR"
 MQTT_TOPIC_POWER  = os.getenv("MQTT_TOPIC_POWER") or "cmnd/UNKNOWN/POWER"
 
+# Power state is published (retained) here after every change (Tasmota "stat/<topic>/POWER")
+MQTT_TOPIC_STAT = os.getenv("MQTT_TOPIC_STAT") or MQTT_TOPIC_POWER.replace("cmnd/", "stat/", 1)
+
+# Other Tasmota topics are based on the POWER ones, e.g. cmnd/PWRSW/PulseTime, stat/PWRSW/RESULT
+cmndPrefix = MQTT_TOPIC_POWER.rsplit("/", 1)[0] + "/"
+statPrefix = MQTT_TOPIC_STAT.rsplit("/", 1)[0] + "/"
+MQTT_TOPIC_STATE = MQTT_TOPIC_SENSOR.rsplit("/", 1)[0] + "/STATE"
+deviceTopic = cmndPrefix.split("/")[-2]
+
+# Samples which couldn't be sent (e.g. while the broker was down) are sent here in batches
+MQTT_TOPIC_BACKLOG = os.getenv("MQTT_TOPIC_BACKLOG") or MQTT_TOPIC_SENSOR.replace("SENSOR", "BACKLOG")
+
+# Number of unsent samples to keep (20 bytes each), the oldest are dropped when full
+backlogSize = os.getenv("MQTT_BACKLOG_SIZE") or 720
+
+# Samples per backlog message, one message is sent each time round the wait loop
+backlogBatch = 20
+
+# Home Assistant discovery topic prefix, "" to not publish discovery configs
+haPrefix = os.getenv("HA_DISCOVERY_PREFIX", "homeassistant")
+
+# Port 80 is used by the CircuitPython web workflow
+HTTP_PORT = os.getenv("HTTP_PORT") or 8080
+
+# Maximum number of /events listeners (more are refused with 503 until one goes away)
+maxSubscribers = 4
+
+# Loop / request timing, heap and reset reason stats (served as JSON from /stats)
+runStats = instrument.Stats()
+
 # Stop auto restart on file change (prevents toggling power unexpectedly)
 supervisor.runtime.autoreload=False
 
+# Restore the energy total and relay state saved before the last restart / power cut
+# (below the reset reason instrument keeps at the end of nvm)
+store = EnergyStore(microcontroller.nvm, slots=os.getenv("NVM_SLOTS") or 32, end=instrument.REASON_OFFSET)
+saved = store.load()
+
+if saved == None:
+	initialState = True # Default to power turned on
+else:
+	print(f"Restored {saved[0]} mWh, power {'on' if saved[1] else 'off'}")
+	initialState = saved[1]
+
 # Setup GPIO pin for Power control
 pwrCtrl = digitalio.DigitalInOut(board.GP2)
-pwrCtrl.direction = digitalio.Direction.OUTPUT
+pwrCtrl.switch_to_output(value=initialState)
 
-pwrCtrl.value=True # Default to power turned on
+# Save the energy total every "checkpointInterval" seconds (if it has changed)
+# Relay changes are saved sooner but not more than once every "checkpointMinGap" seconds
+checkpointInterval = (os.getenv("NVM_CHECKPOINT_MINUTES") or 15) * 60
+checkpointMinGap = 60
 
 interval = os.getenv("MQTT_SENSOR_INTERVAL") or 60
 
+# INA219 readings per second, min/max/mean and energy are published every "interval"
+sampleRate = os.getenv("SENSOR_SAMPLE_RATE") or 20
+readPeriod = 1000000000 // sampleRate # ns
+
+# Energy used while readings are held up (e.g. reconnecting WiFi/MQTT) is
+# counted at the power of the last reading, for stalls of up to this long (ns)
+maxReadGap = 5 * 60 * 1000000000
+
+# Shortest time each MQTT check waits for incoming messages (seconds), between
+# INA219 readings the MQTT socket is watched for the whole time instead of sleeping
+mqttPollTimeout = 0.01
+mqttConnectTimeout = 1
+
+# Failures are retried by reconnecting MQTT alone, with exponential backoff
+# (plus jitter) between attempts, for as long as only the broker looks to be
+# at fault. Closing all sockets and then restarting the WiFi radio are only
+# moved on to when there is evidence they are needed (see faultTier()), after
+# "tierAttempts" failures at the tier below.
+TIER_MQTT = 0
+TIER_SOCKETS = 1
+TIER_RADIO = 2
+tierNames = ("MQTT", "Sockets", "Radio")
+tierAttempts = 3
+backoffMin = 1 # seconds
+backoffMax = interval
+
+# Recovery metrics
+outages = 0
+recoveries = [0, 0, 0] # Successful recoveries at each tier
+lastRecoverySeconds = 0 # Time from failure to reconnected
+
 i2c = busio.I2C(board.GP1, board.GP0)
 
 sensor = adafruit_ina219.INA219(i2c)
@@ -59,50 +158,461 @@ sensor = adafruit_ina219.INA219(i2c)
 sensor.set_calibration_16V_5A()
 sensor.bus_voltage_range = adafruit_ina219.BusVoltageRange.RANGE_32V
 
-# Average out the current/voltage readings
-sensor.bus_adc_resolution=adafruit_ina219.ADCResolution.ADCRES_12BIT_128S
-sensor.shunt_adc_resolution=adafruit_ina219.ADCResolution.ADCRES_12BIT_128S
+# Average out the current/voltage readings, using as many ADC samples as fit
+# in one reading period (bus and shunt are converted one after the other)
+for adcSamples, conversionTime in ((128, 68.10), (64, 34.05), (32, 17.02), (16, 8.51), (8, 4.26), (4, 2.13), (2, 1.06), (1, 0.532)):
+	if 2 * conversionTime * 1000000 <= readPeriod:
+		break
+adcResolution = getattr(adafruit_ina219.ADCResolution, f"ADCRES_12BIT_{adcSamples}S")
+sensor.bus_adc_resolution=adcResolution
+sensor.shunt_adc_resolution=adcResolution
+print(f"Reading INA219 at {sampleRate}Hz averaging {adcSamples} samples")
+
+samples = SampleRing(backlogSize)
+nextSampleAt = time.monotonic()
+
+stats = PowerStats()
+if saved != None:
+	stats.total_mWh = saved[0]
+
+lastCheckpoint = time.monotonic()
+checkpointed = (stats.total_mWh, pwrCtrl.value)
+nextReadAt = time.monotonic_ns()
+
+server = None
+
+# Server-Sent Events, listeners on /events are sent the state whenever it changes
+
+def stateEvent():
+	return '{"POWER":"ON"}' if pwrCtrl.value else '{"POWER":"OFF"}'
+
+events = Events(stateEvent, maxSubscribers)
+
+# Prometheus metrics, written into a preallocated template (see telemetry.py)
+# so a scrape doesn't build any strings
+metricsPage = Template(
+	"# HELP usbsw_relay_on Output power state (1 = on)\n"
+	"# TYPE usbsw_relay_on gauge\n"
+	"usbsw_relay_on %(Relay)1d\n"
+	"# HELP usbsw_voltage_volts Mean bus voltage over the last sensor interval\n"
+	"# TYPE usbsw_voltage_volts gauge\n"
+	"usbsw_voltage_volts %(V)8.3f\n"
+	"# HELP usbsw_current_amps Mean current over the last sensor interval\n"
+	"# TYPE usbsw_current_amps gauge\n"
+	"usbsw_current_amps %(I)9.5f\n"
+	"# HELP usbsw_power_watts Mean power over the last sensor interval\n"
+	"# TYPE usbsw_power_watts gauge\n"
+	"usbsw_power_watts %(W)8.3f\n"
+	"# HELP usbsw_energy_watt_hours_total Energy used (restored from nvm after a restart)\n"
+	"# TYPE usbsw_energy_watt_hours_total counter\n"
+	"usbsw_energy_watt_hours_total %(Total)12.3f\n"
+	"# HELP usbsw_readings INA219 readings in the last sensor interval\n"
+	"# TYPE usbsw_readings gauge\n"
+	"usbsw_readings %(Readings)6d\n"
+	"# HELP usbsw_backlog_samples Samples waiting to be sent over MQTT\n"
+	"# TYPE usbsw_backlog_samples gauge\n"
+	"usbsw_backlog_samples %(Backlog)6d\n"
+	"# HELP usbsw_backlog_dropped_total Unsent samples dropped as the backlog was full\n"
+	"# TYPE usbsw_backlog_dropped_total counter\n"
+	"usbsw_backlog_dropped_total %(Dropped)8d\n"
+	"# HELP usbsw_outages_total Times the MQTT connection has been lost\n"
+	"# TYPE usbsw_outages_total counter\n"
+	"usbsw_outages_total %(Outages)6d\n"
+	"# HELP usbsw_recoveries_total Reconnections by recovery tier\n"
+	"# TYPE usbsw_recoveries_total counter\n"
+	'usbsw_recoveries_total{tier="mqtt"} %(MQTT)6d\n'
+	'usbsw_recoveries_total{tier="sockets"} %(Sockets)6d\n'
+	'usbsw_recoveries_total{tier="radio"} %(Radio)6d\n'
+	"# HELP usbsw_last_recovery_seconds Time taken by the last recovery\n"
+	"# TYPE usbsw_last_recovery_seconds gauge\n"
+	"usbsw_last_recovery_seconds %(LastSeconds)8.1f\n"
+	"# HELP usbsw_heap_free_bytes Free heap\n"
+	"# TYPE usbsw_heap_free_bytes gauge\n"
+	"usbsw_heap_free_bytes %(Heap)8d\n"
+	"# HELP usbsw_uptime_seconds Seconds since boot (starts again from 0 on every restart)\n"
+	"# TYPE usbsw_uptime_seconds gauge\n"
+	"usbsw_uptime_seconds %(Uptime)10d\n"
+)
+
+def metrics(request: Request):
+	p = metricsPage
+	p.put("Relay", pwrCtrl.value)
+	p.put("V", stats.lastV)
+	p.put("I", stats.lastI)
+	p.put("W", stats.lastW)
+	p.put("Total", stats.totalWh())
+	p.put("Readings", stats.lastCount)
+	p.put("Backlog", samples.count)
+	p.put("Dropped", samples.dropped)
+	p.put("Outages", outages)
+	p.put("MQTT", recoveries[TIER_MQTT])
+	p.put("Sockets", recoveries[TIER_SOCKETS])
+	p.put("Radio", recoveries[TIER_RADIO])
+	p.put("LastSeconds", lastRecoverySeconds)
+	p.put("Heap", gc.mem_free())
+	p.put("Uptime", time.monotonic())
+	return Response(request, p.buf, content_type="text/plain; version=0.0.4")
+
+def statsPage(request: Request):
+	return Response(request, runStats.json(), content_type="application/json")
+
+# Web server helpers, the server is restarted along with WiFi/MQTT in start()
+def startServer(pool):
+	global server
+	try:
+		server = Server(pool)
+		server.route("/events")(events.route)
+		server.route("/metrics")(metrics)
+		server.route("/stats")(statsPage)
+		server.start(str(wifi.radio.ipv4_address), HTTP_PORT)
+		print(f"Web server on http://{wifi.radio.ipv4_address}:{HTTP_PORT}/events")
+	except OSError as e:
+		print("Unable to start web server")
+		print(e)
+		server = None
+
+def stopServer():
+	global server
+	events.dropAll()
+	if server != None:
+		try:
+			server.stop()
+		except OSError:
+			pass
+		server = None
+
+def pollServer():
+	if server == None:
+		return
+	try:
+		start = runStats.start()
+		if server.poll() != NO_REQUEST:
+			runStats.request(start)
+			events.welcome()
+	except OSError as e:
+		print("Web server error")
+		print(e)
+
+def setPower(value):
+	global pulseOffAt
+	if not value:
+		pulseOffAt = None
+	if pwrCtrl.value != value:
+		pwrCtrl.value = value
+		events.notify()
+
+# Tasmota PulseTime, turns the power back off this long after an ON command
+# 0 = off, 1-111 = tenths of a second, 112+ = seconds + 100
+pulseTime = 0
+pulseOffAt = None
+
+def pulseSeconds(value):
+	if value <= 111:
+		return value / 10
+	return value - 100
+
+def pulseValue(seconds):
+	if seconds < 11.2:
+		return int(seconds * 10)
+	return int(seconds) + 100
+
+# Turn off when the PulseTime is up
+def pulseIfDue():
+	if pulseOffAt != None and time.monotonic() >= pulseOffAt:
+		setPower(False)
+		publishPower(mqtt_client)
+
+# Save the energy total / relay state to nvm when due (see checkpointInterval)
+def checkpointIfDue():
+	global lastCheckpoint, checkpointed
+	now = time.monotonic()
+	since = now - lastCheckpoint
+	if since < checkpointMinGap:
+		return
+	relay = pwrCtrl.value
+	if relay == checkpointed[1] and (since < checkpointInterval or stats.total_mWh == checkpointed[0]):
+		return
+	try:
+		store.save(stats.total_mWh, relay)
+	except Exception as e:
+		print("Unable to save to nvm")
+		print(e)
+	lastCheckpoint = now
+	checkpointed = (stats.total_mWh, relay)
+
+# Read the INA219 into "stats" every "readPeriod" ns
+def readIfDue():
+	global nextReadAt
+	now = time.monotonic_ns()
+	if now < nextReadAt:
+		return
+	nextReadAt += readPeriod
+	if nextReadAt < now: # Don't try to catch up after a long stall
+		nextReadAt = now + readPeriod
+		stats.bridgeGap(now, maxReadGap)
+
+	try:
+		mA = sensor.current
+		v = sensor.bus_voltage
+		W = sensor.power
+		if sensor.overflow:
+			stats.overflows += 1
+	except:
+		stats.restartIntegration()
+		return
+
+	# Can't be any real usage if the output is turned off
+	if pwrCtrl.value == False:
+		v = 0
+		mA = 0
+		W = 0
+
+	stats.add(now, v, mA/1000, W)
+
+# Every "interval" seconds close the current period and add its means to "samples"
+# Returns True if a sample was added, False if not due yet or None if the sensor failed
+def sampleIfDue():
+	global nextSampleAt
+	readIfDue()
+	pulseIfDue()
+	checkpointIfDue()
+	now = time.monotonic()
+	if now < nextSampleAt:
+		return False
+	nextSampleAt += interval
+	if nextSampleAt < now: # Don't try to catch up after a long stall
+		nextSampleAt = now + interval
+
+	stats.closePeriod()
+	if stats.lastCount == 0:
+		print("Unable to communicate with INA219")
+		return None
+
+	print(f"V: {stats.lastV:.3f} // mA: {stats.lastI*1000:.3f} // W: {stats.lastW:.3f} // readings: {stats.lastCount} // W max: {stats.lastMaxW:.3f}")
+
+	if stats.lastOverflows:
+		print(f"ERROR: overflow ({stats.lastOverflows} readings)")
+
+	# The clock is never set (it starts at 2000-01-01 on each boot) so samples are
+	# stamped with seconds since boot and sent with their age instead
+	samples.add(time.monotonic_ns() // 1000000000, stats.lastV, stats.lastI, stats.lastW)
+	return True
+
+# Sleep until the next reading is due
+def sleepUntilRead():
+	time.sleep(max(0, nextReadAt - time.monotonic_ns()) / 1000000000)
 
-output = {}
+# Sleep for "seconds" while still taking readings and answering web requests
+# (so /metrics and /events keep working while MQTT is being reconnected)
+def wait(seconds):
+	until = time.monotonic() + seconds
+	while time.monotonic() < until:
+		sampleIfDue()
+		pollServer()
+		sleepUntilRead()
+
+# Publish the newest sample in Tasmota format
+def energyData(v, i, W):
+	return {
+		"Voltage": v,
+		"Current": i,
+		"Power" : W,
+		"Factor": 1,
+		"ApparentPower": W,
+		"ReactivePower": W,
+		"Total": stats.totalWh() / 1000,
+		"Period": stats.last_mWh / 1000,
+	}
+
+# SENSOR message template, the DEVICE section only changes if the IP address
+# does so the template is rebuilt in connectWiFi()
+sensorPayload = None
+sensorPayloadIP = None
+
+def buildSensorPayload():
+	global sensorPayload, sensorPayloadIP
+	ip = str(wifi.radio.ipv4_address)
+	if sensorPayload != None and ip == sensorPayloadIP:
+		return
+	device = json.dumps({'MAC': [hex(i) for i in wifi.radio.mac_address], 'IP': ip})
+	sensorPayload = Template(
+		'{"ENERGY":{'
+			'"Voltage":%(V)8.3f,"Current":%(I)9.5f,"Power":%(W)8.3f,"Factor":1,'
+			'"ApparentPower":%(W)8.3f,"ReactivePower":%(W)8.3f,'
+			'"Total":%(Total)12.6f,"Period":%(Period)10.3f},'
+		'"INA219":{'
+			'"Readings":%(Readings)6d,'
+			'"VoltageMin":%(MinV)8.3f,"VoltageMax":%(MaxV)8.3f,'
+			'"CurrentMin":%(MinI)9.5f,"CurrentMax":%(MaxI)9.5f,'
+			'"PowerMin":%(MinW)8.3f,"PowerMax":%(MaxW)8.3f},'
+		'"DEVICE":' + device + ','
+		'"RECOVERY":{'
+			'"Outages":%(Outages)6d,"MQTT":%(MQTT)6d,"Sockets":%(Sockets)6d,'
+			'"Radio":%(Radio)6d,"LastSeconds":%(LastSeconds)8.1f}}')
+	sensorPayloadIP = ip
+
+def publishLatest(client):
+	n = samples.index(samples.count - 1)
+	p = sensorPayload
+	p.put("V", samples.v[n])
+	p.put("I", samples.i[n])
+	p.put("W", samples.w[n])
+	p.put("Total", stats.totalWh() / 1000)
+	p.put("Period", stats.last_mWh / 1000)
+	p.put("Readings", stats.lastCount)
+	p.put("MinV", stats.lastMinV)
+	p.put("MaxV", stats.lastMaxV)
+	p.put("MinI", stats.lastMinI)
+	p.put("MaxI", stats.lastMaxI)
+	p.put("MinW", stats.lastMinW)
+	p.put("MaxW", stats.lastMaxW)
+	p.put("Outages", outages)
+	p.put("MQTT", recoveries[TIER_MQTT])
+	p.put("Sockets", recoveries[TIER_SOCKETS])
+	p.put("Radio", recoveries[TIER_RADIO])
+	p.put("LastSeconds", lastRecoverySeconds)
+
+	print(f"Publishing to {MQTT_TOPIC_SENSOR}")
+	# MiniMQTT only accepts bytes (not bytearray) so this is the one copy made
+	client.publish(MQTT_TOPIC_SENSOR, bytes(p.buf))
+	samples.discardNewest()
+
+# Publish up to "backlogBatch" of the oldest unsent samples as
+# {"Samples": [[Seq, Age, Voltage, Current, Power], ...]}
+# Age is how many seconds before the message was sent the sample was taken, so
+# the receiver can work out when from the time it arrived.
+# They are only removed once published so nothing is lost (Seq can be used to spot repeats)
+def flushBacklog(client):
+	if samples.count == 0:
+		return
+	n = min(backlogBatch, samples.count)
+	now = time.monotonic_ns() // 1000000000
+	rows = []
+	for k in range(n):
+		j = samples.index(k)
+		rows.append("[%d,%d,%.3f,%.5f,%.3f]" % (samples.seq(k), now - samples.t[j], samples.v[j], samples.i[j], samples.w[j]))
+	print(f"Publishing {n} of {samples.count} unsent samples to {MQTT_TOPIC_BACKLOG}")
+	client.publish(MQTT_TOPIC_BACKLOG, '{"Samples":[' + ",".join(rows) + ']}')
+	samples.discard(n)
+
+def powerText():
+	return "ON" if pwrCtrl.value else "OFF"
+
+# Publish the (retained) power state and Tasmota STATE
+def publishPower(client):
+	if client == None or not client.is_connected():
+		return
+	try:
+		client.publish(MQTT_TOPIC_STAT, powerText(), retain=True)
+		client.publish(statPrefix + "RESULT", '{"POWER":"%s"}' % powerText())
+		publishState(client)
+	except Exception as e:
+		print("Unable to publish power state")
+		print(e)
+
+def publishState(client):
+	client.publish(MQTT_TOPIC_STATE, '{"UptimeSec":%d,"Heap":%d,"POWER":"%s"}' % (time.monotonic(), gc.mem_free() // 1024, powerText()), retain=True)
+
+# Tasmota commands, payloads are already upper case
+
+powerCommands = {
+	"ON": True, "1": True,
+	"OFF": False, "0": False,
+}
+
+def cmdPower(client, payload):
+	global pulseOffAt
+	if payload in ("TOGGLE", "2"):
+		value = not pwrCtrl.value
+	else:
+		value = powerCommands.get(payload)
+	if value != None:
+		setPower(value)
+		if value:
+			pulseOffAt = time.monotonic() + pulseSeconds(pulseTime) if pulseTime else None
+	# An empty (or unknown) payload just reports the current state
+	publishPower(client)
+
+def cmdPulseTime(client, payload):
+	global pulseTime
+	if payload != "":
+		try:
+			pulseTime = max(0, min(64900, int(payload)))
+		except ValueError:
+			pass
+	remaining = 0
+	if pulseOffAt != None:
+		remaining = max(0, pulseOffAt - time.monotonic())
+	client.publish(statPrefix + "RESULT", '{"PulseTime":{"Set":%d,"Remaining":%d}}' % (pulseTime, pulseValue(remaining)))
+
+def cmdStatus(client, payload):
+	if payload in ("8", "10"):
+		output = {"StatusSNS": {"ENERGY": energyData(stats.lastV, stats.lastI, stats.lastW)}}
+		client.publish(statPrefix + "STATUS" + payload, json.dumps(output))
+	else:
+		client.publish(statPrefix + "STATUS", '{"Status":{"Topic":"%s","Power":%d}}' % (deviceTopic, pwrCtrl.value))
+
+def cmdState(client, payload):
+	publishState(client)
+
+# Looked up by the full topic, commands are case insensitive in Tasmota so the
+# upper case versions are tried if the topic doesn't match exactly
+commands = {
+	MQTT_TOPIC_POWER: cmdPower,
+	cmndPrefix + "POWER": cmdPower,
+	cmndPrefix + "PULSETIME": cmdPulseTime,
+	cmndPrefix + "STATUS": cmdStatus,
+	cmndPrefix + "STATE": cmdState,
+}
 
 # MQTT helper functions
 def mqtt_message(client, topic, message):
+	handler = commands.get(topic)
+	if handler == None and topic.startswith(cmndPrefix):
+		handler = commands.get(cmndPrefix + topic[len(cmndPrefix):].upper())
+	if handler == None:
+		return
+	# Handle and acknowledge first, printing over USB serial can be slow
+	start = runStats.start()
+	try:
+		handler(client, message.strip().upper())
+	except Exception as e:
+		print("Unable to handle command")
+		print(e)
+	runStats.request(start)
 	print(f"New message on topic {topic}: {message}")
-	if message == "ON":
-		pwrCtrl.value=True
-	if message == "OFF":
-		pwrCtrl.value=False
 
 def mqtt_connected(client, userdata, flags, rc):
 	print("Connected to MQTT broker")
-	client.subscribe(MQTT_TOPIC_POWER)
+	client.subscribe(cmndPrefix + "#")
+	for topic, payload in discovery:
+		client.publish(topic, payload, retain=True)
+	publishPower(client)
 
 def mqtt_disconnect(client, userdata, rc):
-	print("Disconnected from MQTT broker restarting.")
-	time.sleep(5)
-	return
+	print("Disconnected from MQTT broker")
 
-# Handles restarting everything without actually restarting
-# Don't restart unless we have to otherwise power will be switched off
-def start():
-	print("Starting")
+mqtt_client = None
 
-	# Connect to Wifi
-	try:
-		print("Connecting to WiFi")
-		wifi.radio.enabled=False
-		wifi.radio.enabled=True
-		wifi.radio.connect(
-		    os.getenv("CIRCUITPY_WIFI_SSID"), os.getenv("CIRCUITPY_WIFI_PASSWORD")
-		)
-	except Exception as e:
-		print("Unable to connect WiFi")
-		print(e)
-		time.sleep(5)
-		return
+# Home Assistant discovery configs, built once and (re)published on every connect
+discovery = []
+if haPrefix:
+	uid = "usbsw_" + "".join("%02x" % b for b in wifi.radio.mac_address)
+	discovery = discoveryMessages(haPrefix, uid, os.getenv("CIRCUITPY_WEB_INSTANCE_NAME") or deviceTopic, MQTT_TOPIC_POWER, MQTT_TOPIC_STAT, MQTT_TOPIC_SENSOR)
+	print(f"Home Assistant discovery as {uid} ({len(discovery)} configs)")
+
+def connectWiFi():
+	print("Connecting to WiFi")
+	stopServer()
+	wifi.radio.enabled=False
+	wifi.radio.enabled=True
+	wifi.radio.connect(
+	    os.getenv("CIRCUITPY_WIFI_SSID"), os.getenv("CIRCUITPY_WIFI_PASSWORD")
+	)
 
 	print(f"Connected to {os.getenv('CIRCUITPY_WIFI_SSID')}")
 	print(f"My IP address: {wifi.radio.ipv4_address}")
+	buildSensorPayload()
 
 	# Check if the gateway is pingable (ping is IPv4 only)
 	gw = wifi.radio.ipv4_gateway
@@ -112,13 +622,25 @@ def start():
 		ping = wifi.radio.ping(gw)
 		if ping == None:
 			print("No.")
-			return
-		else:
-			print(f"Yes: {ping} seconds.")
+			raise RuntimeError("Gateway not responding")
+		print(f"Yes: {ping} seconds.")
+
+# Close every socket and start again with a new web server and MQTT client
+def resetSockets():
+	global mqtt_client
+	print("Resetting sockets")
+	stopServer()
+	# Only the radio's pool is closed, closing them all removes entries from the
+	# dict the library is looping over (an error under CPython, e.g. tools/sim)
+	try:
+		adafruit_connection_manager.connection_manager_close_all(adafruit_connection_manager.get_radio_socketpool(wifi.radio), release_references=True)
+	except RuntimeError:
+		pass # Nothing opened on it yet
 
-	adafruit_connection_manager.connection_manager_close_all(release_references=True)
+	startServer(adafruit_connection_manager.get_radio_socketpool(wifi.radio))
 
-	# Set up a MiniMQTT Client
+	# Set up a MiniMQTT Client, retries are handled by recover() so samples are
+	# still taken while waiting
 	mqtt_client = MQTT.MQTT(
 		broker=os.getenv("MQTT_BROKER"),
 		port=os.getenv("MQTT_PORT"),
@@ -126,6 +648,7 @@ def start():
 		password=os.getenv("MQTT_PASSWORD"),
 		socket_pool=adafruit_connection_manager.get_radio_socketpool(wifi.radio),
 		ssl_context=adafruit_connection_manager.get_radio_ssl_context(wifi.radio),
+		connect_retries=1,
 	)
 #	mqtt_client.logger = logging.getLogger()
 #	mqtt_client.logger.setLevel(logging.DEBUG)
@@ -133,74 +656,122 @@ def start():
 	mqtt_client.on_connect = mqtt_connected
 	mqtt_client.on_disconnect = mqtt_disconnect
 
-	while not mqtt_client.is_connected():
-		print(f"Attempting to connect to {mqtt_client.broker}")
+def connectMQTT():
+	if mqtt_client.is_connected():
+		try:
+			mqtt_client.disconnect()
+		except Exception:
+			pass
+
+	print(f"Attempting to connect to {mqtt_client.broker}")
+
+	# MiniMQTT uses socket_timeout both for connecting and for how long loop() waits
+	# for messages. Connect with the default then shorten it so checking for
+	# messages doesn't hold up INA219 readings.
+	mqtt_client._socket_timeout = mqttConnectTimeout
+	mqtt_client.connect()
+	mqtt_client._socket_timeout = mqttPollTimeout
+	mqtt_client._sock.settimeout(mqttPollTimeout)
+
+# Make one attempt to reconnect at "tier", returns the tier actually used
+def reconnect(tier):
+	if tier == TIER_RADIO or not wifi.radio.connected:
+		tier = TIER_RADIO
+		connectWiFi()
+	if tier >= TIER_SOCKETS or mqtt_client == None:
+		tier = max(tier, TIER_SOCKETS)
+		resetSockets()
+	connectMQTT()
+	return tier
+
+# Socket errors which only mean the broker can't be reached (e.g. it is down or
+# restarting), rather than anything wrong with the board's own sockets
+BROKER_ERRORS = (errno.ECONNREFUSED, errno.ECONNRESET, errno.ETIMEDOUT, errno.EHOSTUNREACH)
+
+# The tier a failed reconnect calls for. The radio is restarted if WiFi has
+# dropped or the gateway doesn't answer a ping, the sockets are reset after a
+# socket error other than the broker being unreachable (e.g. out of sockets),
+# anything else is just the broker so MQTT alone is retried
+def faultTier(e):
+	if not wifi.radio.connected:
+		return TIER_RADIO
+	gw = wifi.radio.ipv4_gateway
+	if gw != None and wifi.radio.ping(gw) == None:
+		return TIER_RADIO
+	# MiniMQTT wraps socket errors, the original is kept where the port supports it
+	cause = getattr(e, "__cause__", None) or e
+	if isinstance(cause, OSError) and cause.errno not in BROKER_ERRORS:
+		return TIER_SOCKETS
+	return TIER_MQTT
+
+# Keep trying to reconnect until connected, only moving up a tier after
+# "tierAttempts" failures which each point to a fault beyond the current tier
+def recover(tier, failedAt):
+	global lastRecoverySeconds
+	failures = 0
+	attempt = 0
+	while True:
+		print(f"Reconnecting ({tierNames[tier]}, attempt {attempt + 1})")
 		try:
-			mqtt_client.connect()
+			tier = reconnect(tier)
+			break
 		except Exception as e:
 			print(e)
-			print("Unable to connect MQTT")
-			time.sleep(5)
-			return
+			needed = faultTier(e)
+
+		failures += 1
+		attempt += 1
+		if needed == TIER_MQTT:
+			tier = TIER_MQTT
+		elif needed > tier and attempt >= tierAttempts:
+			tier += 1
+			attempt = 0
+
+		delay = min(backoffMax, backoffMin * 2 ** min(failures, 10))
+		delay = random.uniform(delay / 2, delay)
+		print(f"Waiting {delay:.1f} seconds before retrying")
+		wait(delay)
+
+	if failedAt != None:
+		lastRecoverySeconds = time.monotonic() - failedAt
+		recoveries[tier] += 1
+		print(f"Recovered ({tierNames[tier]}) after {lastRecoverySeconds:.1f} seconds")
+
+# Publish samples and handle MQTT / web requests until something fails
+def run():
 	while True:
+		start = runStats.start()
+		taken = sampleIfDue()
+
 		try:
-			mA = sensor.current
-			v = sensor.bus_voltage
-			W = sensor.power
-		except:
-			print("Unable to communicate with INA219")
-			time.sleep(5)
+			if taken:
+				publishLatest(mqtt_client)
+				publishState(mqtt_client)
+			flushBacklog(mqtt_client)
+		except Exception as e:
+			print("MQTT Publish error")
+			print(e)
 			return
+		runStats.loop(start)
 
-		# Can't be any real usage if the output is turned off
-		if pwrCtrl.value == False:
-			v = 0
-			mA = 0
-			W = 0
-
-		print(f"V: {v:.3f} // mA: {mA:.3f} // W: {W:.3f}")
-
-		if sensor.overflow:
-			print("ERROR: overflow")
-
-		output = {
-				'ENERGY': {
-					"Voltage": v,
-					"Current": mA/1000,
-					"Power" : W,
-					"Factor": 1,
-					"ApparentPower": W,
-					"ReactivePower": W,
-					"Total": 0,
-				},
-				'DEVICE': {
-					'MAC': [hex(i) for i in wifi.radio.mac_address],
-					'IP': str(wifi.radio.ipv4_address),
-				}
-			}
-
-		print(f"Publishing to {MQTT_TOPIC_SENSOR}")
+		# Wait for MQTT messages until the next reading is due, handling them as soon as they arrive
 		try:
-			mqtt_client.publish(MQTT_TOPIC_SENSOR, json.dumps(output))
-		except:
-			print("MQTT Publish error, restarting")
-			time.sleep(5)
+			mqtt_client.loop(timeout=max(mqttPollTimeout, (nextReadAt - time.monotonic_ns()) / 1000000000))
+		except Exception as e:
+			print("MQTT error")
+			print(e)
 			return
 
-		# Wait before sending data again
-		print("Waiting for next poll")
-		wait_until = time.time()+interval
-		while time.time()<wait_until:
-			mqtt_client.loop(timeout=1)
-			time.sleep(1)
+		pollServer()
+
+# Sleep up to "interval" seconds to prevent everything connecting at once after power outage
+r = random.randint(1,interval)
+print(f"Waiting {r} seconds before starting.")
+wait( r )
 
+# Don't restart unless we have to otherwise power will be switched off
+recover(TIER_RADIO, None)
 while True:
-	# Sleep up to "interval" seconds to prevent everything reconnecting at once after power outage/broker restart
-	r = random.randint(1,interval)
-	print(f"Waiting {r} seconds before [re]start.")
-	time.sleep( r )
-	try:
-		start()
-	except Exception as e:
-		print("Exception")
-		print(e)
+	run()
+	outages += 1
+	recover(TIER_MQTT, time.monotonic())
@@ -0,0 +1,59 @@
+# USB Power Switch ProM
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Home Assistant MQTT discovery
+#
+# Builds the retained homeassistant/<component>/<id>/config messages for the
+# switch and its voltage/current/power/energy sensors. They are built once at
+# boot and kept as bytes, so (re)publishing them after every reconnect is just
+# a copy to the socket.
+#
+# https://www.home-assistant.io/integrations/mqtt/#mqtt-discovery
+#
+
+import json
+
+# (key, name, ENERGY field, unit, device_class, state_class)
+SENSORS = (
+	("voltage", "Voltage", "Voltage", "V", "voltage", "measurement"),
+	("current", "Current", "Current", "A", "current", "measurement"),
+	("power", "Power", "Power", "W", "power", "measurement"),
+	("energy", "Energy", "Total", "kWh", "energy", "total_increasing"),
+)
+
+# Returns a list of (topic, payload bytes)
+def discoveryMessages(prefix, uid, name, cmndTopic, statTopic, sensorTopic):
+	device = {
+		"identifiers": [uid],
+		"name": name,
+		"manufacturer": "8086 Consultancy",
+		"model": "USB Power Switch ProM",
+	}
+	messages = []
+
+	config = {
+		"name": None, # Use the device name
+		"unique_id": uid + "_switch",
+		"command_topic": cmndTopic,
+		"state_topic": statTopic,
+		"payload_on": "ON",
+		"payload_off": "OFF",
+		"device": device,
+	}
+	messages.append((f"{prefix}/switch/{uid}/power/config", json.dumps(config).encode()))
+
+	for key, label, field, unit, deviceClass, stateClass in SENSORS:
+		config = {
+			"name": label,
+			"unique_id": f"{uid}_{key}",
+			"state_topic": sensorTopic,
+			"value_template": "{{ value_json.ENERGY.%s }}" % field,
+			"unit_of_measurement": unit,
+			"device_class": deviceClass,
+			"state_class": stateClass,
+			"device": {"identifiers": [uid]},
+		}
+		messages.append((f"{prefix}/sensor/{uid}/{key}/config", json.dumps(config).encode()))
+
+	return messages
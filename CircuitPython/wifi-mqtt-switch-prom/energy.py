@@ -0,0 +1,95 @@
+# USB Power Switch ProM
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Power statistics
+#
+# Keeps running min/max/mean voltage, current and power for the current
+# reporting period plus the energy used (integrated from each reading), all
+# in a fixed number of variables however many readings are added.
+#
+# Energy is kept as a whole number of mWh plus a fraction, as CircuitPython
+# floats are only single precision and small amounts added to a large float
+# total would be lost.
+#
+
+class PowerStats:
+	def __init__(self):
+		self.total_mWh = 0 # Energy used since the counters were started/restored
+		self._mWhFraction = 0.0
+		self._lastT = None
+		self._lastW = 0.0
+		self.reset()
+		self.closePeriod()
+
+	# Start a new reporting period
+	def reset(self):
+		self.count = 0
+		self.overflows = 0
+		self.period_mWh = 0.0
+		self._sumV = 0.0
+		self._sumI = 0.0
+		self._sumW = 0.0
+		self.minV = self.minI = self.minW = 0.0
+		self.maxV = self.maxI = self.maxW = 0.0
+
+	# Add a reading taken at time.monotonic_ns() "t"
+	def add(self, t, v, i, w):
+		if self.count == 0:
+			self.minV = self.maxV = v
+			self.minI = self.maxI = i
+			self.minW = self.maxW = w
+		else:
+			if v < self.minV: self.minV = v
+			if v > self.maxV: self.maxV = v
+			if i < self.minI: self.minI = i
+			if i > self.maxI: self.maxI = i
+			if w < self.minW: self.minW = w
+			if w > self.maxW: self.maxW = w
+		self.count += 1
+		self._sumV += v
+		self._sumI += i
+		self._sumW += w
+
+		# Trapezoid rule between this and the previous reading, 1 mWh = 3.6 J
+		if self._lastT != None:
+			self._addEnergy((self._lastW + w) * (t - self._lastT) / 7200000000)
+		self._lastT = t
+		self._lastW = w
+
+	def _addEnergy(self, mWh):
+		self.period_mWh += mWh
+		self._mWhFraction += mWh
+		if self._mWhFraction >= 1:
+			whole = int(self._mWhFraction)
+			self.total_mWh += whole
+			self._mWhFraction -= whole
+
+	# Carry integration on from time.monotonic_ns() "t" after readings stopped
+	# for a while (e.g. while reconnecting), counting the gap at the power of
+	# the last reading for at most "maxNs"
+	def bridgeGap(self, t, maxNs):
+		if self._lastT != None:
+			self._addEnergy(self._lastW * min(t - self._lastT, maxNs) / 3600000000)
+			self._lastT = t
+
+	# Restart integration (e.g. after the sensor failed) without counting the gap
+	def restartIntegration(self):
+		self._lastT = None
+
+	# Copy this period's results into the "last*" values and start a new period
+	def closePeriod(self):
+		n = self.count or 1
+		self.lastCount = self.count
+		self.lastOverflows = self.overflows
+		self.lastV = self._sumV / n
+		self.lastI = self._sumI / n
+		self.lastW = self._sumW / n
+		self.lastMinV, self.lastMaxV = self.minV, self.maxV
+		self.lastMinI, self.lastMaxI = self.minI, self.maxI
+		self.lastMinW, self.lastMaxW = self.minW, self.maxW
+		self.last_mWh = self.period_mWh
+		self.reset()
+
+	def totalWh(self):
+		return (self.total_mWh + self._mWhFraction) / 1000
@@ -0,0 +1,68 @@
+# USB Power Switch ProM
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Energy / relay state persistence
+#
+# Checkpoints the energy total and relay state into microcontroller.nvm as
+# small records, each with a sequence number and CRC. Every save goes into the
+# next slot round a fixed ring, so the previous record is left intact and a
+# corrupt/half written record is simply ignored at boot. Loading reads a fixed
+# number of slots however many checkpoints have been written.
+#
+# On the RP2040 nvm is a single flash sector and every write erases it, so
+# how often save() is called is what matters for flash wear.
+#
+# The ring runs from "offset" up to "end" (default the end of nvm), pass
+# instrument.REASON_OFFSET so it stays clear of the reset reason kept at the
+# end of nvm.
+#
+
+import struct
+import binascii
+
+MAGIC = 0xE5
+RECORD = "<BBHII" # magic, flags, reserved, sequence, total mWh
+RECORD_SIZE = 16 # struct + CRC32
+
+FLAG_RELAY = 0x01
+
+class EnergyStore:
+	def __init__(self, nvm, offset=0, slots=32, end=None):
+		self.nvm = nvm
+		self.offset = offset
+		if end == None:
+			end = len(nvm)
+		self.slots = min(slots, (end - offset) // RECORD_SIZE)
+		assert self.slots > 0 and offset + self.slots * RECORD_SIZE <= end, "EnergyStore doesn't fit in nvm below %d" % end
+		self.seq = 0
+		self.slot = -1 # Slot the newest record is in
+		self.writes = 0
+
+	# Returns (total_mWh, relay) from the newest valid record or None if there isn't one
+	def load(self):
+		best = None
+		for slot in range(self.slots):
+			pos = self.offset + slot * RECORD_SIZE
+			data = self.nvm[pos:pos + RECORD_SIZE]
+			body = data[:RECORD_SIZE - 4]
+			magic, flags, _, seq, total = struct.unpack(RECORD, body)
+			if magic != MAGIC:
+				continue
+			if struct.unpack("<I", data[RECORD_SIZE - 4:])[0] != binascii.crc32(body) & 0xFFFFFFFF:
+				continue
+			if best == None or seq > best[0]:
+				best = (seq, slot, total, bool(flags & FLAG_RELAY))
+		if best == None:
+			return None
+		self.seq, self.slot, total, relay = best
+		return total, relay
+
+	# Write a new record into the next slot
+	def save(self, total_mWh, relay):
+		self.seq += 1
+		self.slot = (self.slot + 1) % self.slots
+		body = struct.pack(RECORD, MAGIC, FLAG_RELAY if relay else 0, 0, self.seq, total_mWh & 0xFFFFFFFF)
+		pos = self.offset + self.slot * RECORD_SIZE
+		self.nvm[pos:pos + RECORD_SIZE] = body + struct.pack("<I", binascii.crc32(body) & 0xFFFFFFFF)
+		self.writes += 1
@@ -3,8 +3,16 @@
 # the PicoW doesn't have. This code resets it when it happens.
 
 import microcontroller
+import supervisor
 import time
 
+# Record why so it can be reported (see lib/usbswitch/instrument.py) once restarted
+try:
+	from usbswitch import instrument
+	instrument.record("Safe mode " + str(getattr(supervisor.runtime, "safe_mode_reason", "")).split(".")[-1])
+except Exception:
+	pass
+
 print("SAFEMODE: Waiting 10 seconds before restart.")
 microcontroller.on_next_reset(microcontroller.RunMode.NORMAL)
 time.sleep(10)
@@ -0,0 +1,59 @@
+# USB Power Switch ProM
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Sample ring buffer
+#
+# Holds timestamped (whole seconds, e.g. since boot) voltage/current/power samples which haven't been sent yet
+# in preallocated arrays, so nothing is allocated per sample. When full the
+# oldest sample is overwritten (and counted in "dropped").
+#
+
+import array
+
+class SampleRing:
+	def __init__(self, size):
+		self.size = size
+		self.seqs = array.array("L", [0] * size)
+		self.t = array.array("L", [0] * size)
+		self.v = array.array("f", [0] * size)
+		self.i = array.array("f", [0] * size)
+		self.w = array.array("f", [0] * size)
+		self.start = 0 # Index of the oldest sample
+		self.count = 0
+		self.nextSeq = 0 # Sequence number the next sample added will get
+		self.dropped = 0
+
+	# Add a sample, overwriting the oldest if full
+	def add(self, t, v, i, w):
+		if self.count == self.size:
+			self.start = (self.start + 1) % self.size
+			self.count -= 1
+			self.dropped += 1
+		n = (self.start + self.count) % self.size
+		self.seqs[n] = self.nextSeq
+		self.t[n] = t
+		self.v[n] = v
+		self.i[n] = i
+		self.w[n] = w
+		self.count += 1
+		self.nextSeq += 1
+
+	# Array index of the k'th oldest sample
+	def index(self, k):
+		return (self.start + k) % self.size
+
+	# Sequence number of the k'th oldest sample
+	def seq(self, k):
+		return self.seqs[self.index(k)]
+
+	# Forget the n oldest samples (once they have been sent)
+	def discard(self, n):
+		n = min(n, self.count)
+		self.start = (self.start + n) % self.size
+		self.count -= n
+
+	# Forget the newest sample
+	def discardNewest(self):
+		if self.count:
+			self.count -= 1
@@ -0,0 +1,79 @@
+# USB Power Switch ProM
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Telemetry payload template
+#
+# Holds a JSON message in a preallocated bytearray with a fixed width slot for
+# each number, so publishing only writes digits into the slots rather than
+# building nested dicts and running json.dumps (lots of small allocations
+# which fragment the heap over a long uptime).
+#
+# Slots are written in the template text as "%(name)8.3f" or "%(name)6d".
+# The same name can be used for more than one slot. Numbers are right aligned
+# and padded with spaces (valid JSON whitespace). A number too big for its
+# slot is clamped to the largest value that fits. Every slot starts as 0.
+#
+
+class Template:
+	def __init__(self, text):
+		self.slots = {} # name -> [(pos, width, decimals), ...]
+		out = bytearray()
+		i = 0
+		while True:
+			start = text.find("%(", i)
+			if start < 0:
+				out.extend(text[i:].encode())
+				break
+			out.extend(text[i:start].encode())
+			end = text.find(")", start)
+			name = text[start + 2:end]
+			kind = end + 1
+			while text[kind] not in "fd":
+				kind += 1
+			spec = text[end + 1:kind].split(".")
+			width = int(spec[0])
+			decimals = int(spec[1]) if text[kind] == "f" and len(spec) > 1 else 0
+			self.slots.setdefault(name, []).append((len(out), width, decimals))
+			out.extend(b" " * width)
+			i = kind + 1
+		self.buf = out
+		for name in self.slots:
+			self.put(name, 0)
+
+	# Write "value" into every slot called "name"
+	def put(self, name, value):
+		for pos, width, decimals in self.slots[name]:
+			putNumber(self.buf, pos, width, decimals, value)
+
+_scales = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Write "value" right aligned in buf[pos:pos+width] with "decimals" places
+def putNumber(buf, pos, width, decimals, value):
+	n = int(value * _scales[decimals] + (0.5 if value >= 0 else -0.5))
+	negative = n < 0
+	if negative:
+		n = -n
+	digits = width - 1 if negative else width
+	if decimals:
+		digits -= 1 # Room for the "."
+	if decimals >= digits or n >= 10 ** digits:
+		n = 10 ** digits - 1
+	i = pos + width - 1
+	places = decimals
+	while True:
+		buf[i] = 48 + n % 10
+		n //= 10
+		i -= 1
+		places -= 1
+		if places == 0:
+			buf[i] = 46 # "."
+			i -= 1
+		elif places < 0 and n == 0:
+			break
+	if negative:
+		buf[i] = 45 # "-"
+		i -= 1
+	while i >= pos:
+		buf[i] = 32
+		i -= 1
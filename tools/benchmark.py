@@ -0,0 +1,1145 @@
+#!/usr/bin/env python3
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Benchmarks on the host simulator (see tools/sim)
+#
+# Runs every example through scripted scenarios (button storms with contact
+# bounce, button gestures, HTTP request floods, MQTT command bursts, broker
+# flaps and restarts, NTP outages/steps, DST changes and socket/WiFi failures) on the virtual clock and writes
+# the results as JSON, e.g.
+#
+#  tools/benchmark.py --out before.json
+#  ... change something ...
+#  tools/benchmark.py --out after.json --compare before.json
+#
+# For each scenario:
+#  latencyMs    - from each stimulus (press, request sent, MQTT command) to GP2
+#                 changing, mean/p50/p95/p99/max
+#  requests     - HTTP requests answered, per virtual second and response times
+#  loop         - main loop passes per virtual second and their time, from the
+#                 example's usbswitch.instrument stats (the web server task on
+#                 wifi-boost)
+#  dutyCycle    - fraction of virtual time the CPU was busy (not sleeping or waiting)
+#  wakeups      - times the CPU woke from sleeping or waiting
+#  relay        - GP2 changes (and per hour) and writes (including writes of the same value)
+#  allocations  - peak traced memory and generation 0 collections (CPython's,
+#                 so only useful for comparing one revision with another)
+#  events       - for Server-Sent Event listeners, the time from each change
+#                 to each listener getting it and the bytes sent per event
+#  boot         - for the boot scenarios, virtual ms from power on to the first
+#                 request served and the modules code.py imported
+#  energyWh     - energy total the ProM reported against what the load used
+#  backlog      - samples the ProM sent on BACKLOG after a broker outage, the
+#                 oldest one's age and the longest time between two of them
+#  etag         - for conditional polling, bytes per poll with If-None-Match
+#                 against the full response every poll would get without it
+#  recovery     - for scenarios which inject faults, how long the web server
+#                 was down after each and how often GP2 changed other than in
+#                 answer to a stimulus (e.g. when the board reset)
+#  checks       - what the scenario expects to have happened (e.g. which
+#                 payloads were published), True if it did
+#  realSeconds  - how long the run took on this machine
+#
+# There are also microbenchmarks of the shared library (usbswitch/...), of
+# code the examples share (web/...) and of the ProM's own modules
+# (wifi-mqtt-switch-prom/...) which run on the host without the
+# simulator, so their times are real ns and only useful for comparing one
+# revision or approach with another.
+#
+# Exits with status 1 if any check failed.
+# Times are virtual so everything but realSeconds is the same on every run.
+# The code itself runs in no virtual time, so latency is time spent sleeping,
+# waiting and polling before the change is seen (see tools/sim/clock.py).
+#
+# Usage: tools/benchmark.py [--out results.json] [--compare old.json] [scenario ...]
+#
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sim import Simulator, libDir, modulesDir
+from sim.broker import Broker, matches
+
+sys.path.insert(0, libDir)
+from usbswitch.scheduler import Scheduler
+
+WIFI = {"CIRCUITPY_WIFI_SSID": "bench", "CIRCUITPY_WIFI_PASSWORD": "bench"}
+FORM = {"Content-Type": "application/x-www-form-urlencoded"}
+
+# Press "pin" to GND at "at" with "bounce" extra make/break edges 1ms apart before it settles
+def bouncyPress(sim, pin, at, duration, bounce):
+	for k in range(bounce):
+		sim.at(at + k * 0.002, lambda: sim.pin(pin).set(False))
+		sim.at(at + k * 0.002 + 0.001, lambda: sim.pin(pin).set(None))
+	sim.press(pin, at + bounce * 0.002, duration)
+
+# Scenarios, each sets up the simulator and returns the times of stimuli
+# which should each change GP2. A scenario can also add
+# (description, function) pairs to context["checks"], each function is
+# called after the run and returns True if what it describes happened, and
+# put functions in context["report"] whose results are added to the results.
+
+def slideStorm(sim, context):
+	stimuli = []
+	for i in range(20):
+		at = 0.5 + i * 0.1
+		position = None if i % 2 else False # Odd flips back to off
+		for k in range(3):
+			sim.at(at + k * 0.002, lambda: sim.pin("GP13").set(False))
+			sim.at(at + k * 0.002 + 0.001, lambda: sim.pin("GP13").set(None))
+		sim.at(at + 0.006, lambda position=position: sim.pin("GP13").set(position))
+		stimuli.append(at)
+	return stimuli
+
+# Switch left alone, on after a second
+def slideIdle(sim, context):
+	sim.at(1, lambda: sim.pin("GP13").set(False))
+	return [1]
+
+def pushStorm(sim, context):
+	stimuli = []
+	for i in range(20):
+		at = 0.5 + i * 0.1
+		bouncyPress(sim, "GP13", at, 0.05, 3)
+		stimuli.append(at)
+	return stimuli
+
+# Short presses toggle and long ones turn off, timed from when each gesture
+# can be recognised (release for short, "holdOff" into the press for long)
+def pushGestures(sim, context):
+	stimuli = []
+	at = 0.5
+	for long in (False, True, False, False, False, True) * 3:
+		duration = 1.2 if long else 0.15
+		bouncyPress(sim, "GP13", at, duration, 3)
+		stimuli.append(at + 0.006 + (1.0 if long else duration))
+		at += duration + 0.5
+	return stimuli
+
+def temperatureSweep(sim, context):
+	# 30C rising 1C a minute to 40C then falling, crossing on at 35C and off at 33C
+	sim.temperature = lambda t: 30 + min(t, 1200 - t) / 60
+	return [300, 1020]
+
+# Readings like the Pico's sensor, "temp" plus noise in 0.47C ADC steps
+def noisy(temp, sd=0.6):
+	def reading(t):
+		noise = random.Random(int(t * 1000)).gauss(0, sd)
+		return round((temp(t) + noise) / 0.47) * 0.47
+	return reading
+
+def temperatureNoise(sim, context):
+	# Drifting slowly between 33C and 36C, so sitting near both thresholds
+	sim.temperature = noisy(lambda t: 34.5 + 1.5 * math.sin(t / 600))
+	return []
+
+def httpFlood(path, body, commands, period, count, method="POST", headers=FORM, start=15):
+	def scenario(sim, context):
+		stimuli = []
+		for i in range(count):
+			at = start + i * period
+			command = commands[i % len(commands)]
+			context["replies"].append(sim.request(at, method, path, body % command, headers))
+			stimuli.append(at)
+			# Reads in between the commands
+			context["replies"].append(sim.request(at + period / 2, "GET", "/"))
+		return stimuli
+	return scenario
+
+# Boot to first served request: "path" is asked for every 50 ms from power
+# on until "seconds", the first answered is when the board was ready (the
+# ProM waits a random 1 to MQTT_SENSOR_INTERVAL seconds before starting, so
+# it doesn't reconnect at the same time as every other board after a power
+# cut). Also lists the modules code.py imported (from the board, the bundle
+# and the example), which shouldn't include any "unwanted".
+def bootToFirstRequest(path, seconds, unwanted=()):
+	def scenario(sim, context):
+		polls = [sim.request(i * 0.05, "GET", path) for i in range(int(seconds / 0.05))]
+		firstOk = lambda: next((r for r in polls if r.status == 200), None)
+		imported = []
+		# Just before the end, while code.py's modules are still loaded
+		def listModules():
+			ours = tuple(os.path.abspath(d) for d in (sim.exampleDir, libDir, modulesDir))
+			imported.extend(sorted(name for name, module in sys.modules.items()
+				if name.startswith("adafruit_") or os.path.abspath(getattr(module, "__file__", None) or "").startswith(ours)))
+		sim.at(seconds - 0.001, listModules)
+		context["report"]["boot"] = lambda: {
+			"firstRequestMs": round(firstOk().sentAt * 1000, 3) if firstOk() else None,
+			"modules": imported,
+		}
+		context["checks"] += [
+			("a request is served", lambda: firstOk() != None),
+			("imports none of " + ", ".join(unwanted), lambda: imported and not set(imported) & set(unwanted)),
+		]
+		return []
+	return scenario
+
+def boostButtons(sim, context):
+	stimuli = []
+	for i in range(20):
+		at = 15 + i * 1.0
+		bouncyPress(sim, "GP12" if i % 2 == 0 else "GP13", at, 0.1, 3)
+		stimuli.append(at)
+	# Page loads while the buttons are being pressed
+	for i in range(80):
+		context["replies"].append(sim.request(15 + i * 0.25, "GET", "/"))
+	return stimuli
+
+# Each GP12 gesture boosts from off and GP13 turns it off again, timed from
+# when each can be recognised (the double press window after a short release,
+# the second release of a double, "longMs" into a long one). The last short
+# boost is left to run out, which is also timed.
+def boostGestures(sim, context):
+	stimuli = []
+	gestures = (
+		[(0.1, 0)], # Short
+		[(0.1, 0.15), (0.1, 0)], # Double
+		[(1.0, 0)], # Long
+		[(3.0, 0)], # Long then held for two repeats
+	)
+	at = 15
+	for presses in gestures:
+		for duration, gap in presses:
+			bouncyPress(sim, "GP12", at, duration, 3)
+			at += 0.006 + duration + gap
+		if len(presses) == 2:
+			stimuli.append(at)
+		elif presses[0][0] < 0.8:
+			stimuli.append(at + 0.3)
+		else:
+			stimuli.append(at - presses[0][0] + 0.8)
+		bouncyPress(sim, "GP13", at + 2, 0.1, 3)
+		stimuli.append(at + 2.006)
+		at += 5
+	bouncyPress(sim, "GP12", at, 0.1, 3)
+	stimuli += [at + 0.406, at + 0.406 + 15*60]
+	return stimuli
+
+# NTP doesn't answer for the first 100 s, then answers over an hour out (so the
+# first sync moves the wall clock a long way) with the board's clock running
+# 200 ppm slow. A boost started before the sync should still last 15 minutes
+# and page loads shouldn't stall while NTP is retried.
+def ntpStep(sim, context):
+	sim.ntpUp = False
+	sim.at(100, lambda: setattr(sim, "ntpUp", True))
+	sim.ntpOffset = 4000
+	sim.clockDrift = 200
+	context["replies"].append(sim.request(30, "POST", "/", "button=BOOST15", FORM))
+	for i in range(300):
+		context["replies"].append(sim.request(10 + i * 0.5, "GET", "/"))
+	return [30, 930]
+
+# Starts at 00:50 UTC on the day UK clocks go forward (at 01:00 UTC), so the
+# daily 00:55-02:10 (local) slot should be on 00:55-01:10 UTC
+def dstSchedule(sim, context):
+	sim.utcAtStart = 1774745400 # 2026-03-29 00:50 UTC
+	return [300, 1200]
+
+# (time, event data, bytes) of each "state" Server-Sent Event in "reply"
+def stateEvents(reply):
+	return [(t, json.loads(m.group(1)), len(m.group(0))) for t, chunk in reply.chunks for m in re.finditer(rb"data: (.*)\nevent: state\n(?:id: \d+\n)?\n", chunk)]
+
+# One more /events listener than "maxSubscribers" (4) is opened, which
+# should be turned away, then the power is switched on from the page, off by
+# GP13 and boosted. Each listener should be sent the state when it connects
+# and after each change.
+def eventFanout(sim, context):
+	streams = [sim.request(15 + i * 0.2, "GET", "/events") for i in range(5)]
+	kept, refused = streams[:4], streams[4]
+	changes = [(20, True), (25, False), (30, True)]
+	context["replies"] += streams
+	context["replies"].append(sim.request(20, "POST", "/", "button=ON", FORM))
+	bouncyPress(sim, "GP13", 25, 0.1, 3)
+	context["replies"].append(sim.request(30, "POST", "/", "button=BOOST15", FORM))
+
+	# Time from each change to each listener getting the new state, None if it didn't
+	def pushed():
+		times = []
+		for at, power in changes:
+			for reply in kept:
+				event = next((e for e in stateEvents(reply) if e[0] >= at), None)
+				times.append(event[0] - at if event != None and event[1]["power"] == power else None)
+		return times
+
+	def report():
+		events = sum(len(stateEvents(reply)) for reply in kept)
+		return {
+			"listeners": len(kept),
+			"pushMs": summary([t for t in pushed() if t != None]),
+			"bytesPerEvent": round(sum(e[2] for reply in kept for e in stateEvents(reply)) / max(1, events), 1),
+		}
+	context["report"]["events"] = report
+	context["checks"] += [
+		("the listener over maxSubscribers is refused", lambda: refused.status == 503 and refused.done),
+		("each listener is sent the state when it connects", lambda: all(stateEvents(reply) and stateEvents(reply)[0][1]["power"] == False and stateEvents(reply)[0][0] < 20 for reply in kept)),
+		("each listener is sent each change", lambda: None not in pushed()),
+	]
+	return [at for at, _ in changes]
+
+# The power is switched on, then the network stack falls over (every open
+# socket fails) twice and WiFi drops for 20 s (taking the sockets with it).
+# Pages are loaded throughout to see how long the server is down for, and the
+# power should stay on.
+def socketFaults(method, path, body, headers=FORM):
+	def scenario(sim, context):
+		context["replies"].append(sim.request(10, method, path, body, headers))
+		sim.at(20, sim.breakSockets)
+		sim.at(40, sim.breakSockets)
+		sim.at(60, lambda: (setattr(sim, "wifiUp", False), sim.breakSockets()))
+		sim.at(80, lambda: setattr(sim, "wifiUp", True))
+		context["faults"] = [20, 40, 60]
+		for i in range(400):
+			context["replies"].append(sim.request(12 + i * 0.25, "GET", "/"))
+		return [10]
+	return scenario
+
+# As socketFaults but with the watchdog on and WiFi down for over two minutes,
+# longer than the web server waits between retries once they have backed off.
+# Waiting doesn't feed the watchdog, so the board shouldn't wait longer than
+# the watchdog timeout (8 s) and the power should stay on throughout.
+def watchdogOutage(sim, context):
+	sim.constants["watchdogTimeout"] = True
+	context["replies"].append(sim.request(10, "POST", "/", "button=ON", FORM))
+	sim.at(60, lambda: (setattr(sim, "wifiUp", False), sim.breakSockets()))
+	sim.at(200, lambda: setattr(sim, "wifiUp", True))
+	context["faults"] = [60]
+	pages = [sim.request(12 + i, "GET", "/") for i in range(280)]
+	context["replies"] += pages
+	context["checks"] += [
+		("the watchdog doesn't reset the board", lambda: sim.resets == []),
+		("the power stays on", lambda: [value for t, value in sim.switches if t > 0] == [True]),
+		# Retries have backed off to every 60 s by then, the first after WiFi is back is at 259 s
+		("pages are served again once WiFi is back", lambda: all(r.status == 200 for r in pages[265 - 12:])),
+	]
+	return [10]
+
+# A client polls /api/v1/state every second sending back the last ETag in
+# If-None-Match, while the power is switched on then off. Each poll should be
+# an empty 304 unless the state changed since the last one.
+def etagPolling(sim, context):
+	polls = []
+	changes = [30, 50]
+	def poll():
+		etag = None
+		for reply in polls:
+			if reply.status == 200:
+				etag = reply.headers.get("etag")
+		polls.append(sim.request(sim.now(), "GET", "/api/v1/state", headers={"If-None-Match": etag} if etag else None))
+		context["replies"].append(polls[-1])
+	for i in range(60):
+		sim.at(15.25 + i, poll)
+	for at, value in zip(changes, ("true", "false")):
+		context["replies"].append(sim.request(at, "PUT", "/api/v1/switch", '{"button": "%s"}' % value, {"Content-Type": "application/json"}))
+
+	def report():
+		full = [len(r.raw) for r in polls if r.status == 200]
+		bytesPerPoll = sum(len(r.raw) for r in polls) / len(polls)
+		return {
+			"polls": len(polls),
+			"notModified": sum(1 for r in polls if r.status == 304),
+			"bytesPerPoll": round(bytesPerPoll, 1),
+			"bytesPerPollUnconditional": round(sum(full) / len(full), 1),
+			"saved": round(1 - bytesPerPoll * len(full) / sum(full), 3),
+		}
+	context["report"]["etag"] = report
+
+	# The first poll after the start and after each change gets the state, the rest 304
+	def firstAfter(t):
+		return next(r for r in polls if r.sentAt != None and r.sentAt > t)
+	fresh = lambda: [firstAfter(t) for t in [0] + changes]
+	context["checks"] += [
+		("every poll answered", lambda: len(polls) == 60 and all(r.status in (200, 304) for r in polls)),
+		("the first poll and the first after each change get the new state", lambda: [(r.status, r.body) for r in fresh()] == [(200, b'{"button": "false"}'), (200, b'{"button": "true"}'), (200, b'{"button": "false"}')]),
+		("the ETag changes with the state", lambda: len(set(r.headers.get("etag") for r in fresh())) == 3),
+		("every other poll is an empty 304", lambda: sum(1 for r in polls if r.status == 304 and r.body == b"") == len(polls) - 3),
+	]
+	return changes
+
+def mqttBurst(sim, context):
+	broker = context["broker"]
+	stimuli = []
+	for i in range(50):
+		at = 60 + i * 0.1
+		sim.at(at, lambda: broker.publish("cmnd/PWRSW/POWER", "TOGGLE"))
+		stimuli.append(at)
+	return stimuli
+
+# Tasmota commands, each checked by what the ProM publishes in reply. PulseTime
+# 25 (2.5 s) should turn the power off again 2.5 s after the ON at 50.
+def tasmotaCommands(sim, context):
+	broker = context["broker"]
+	script = [
+		(40, "POWER", "OFF"),
+		(42, "POWER", "TOGGLE"),
+		(44, "POWER", "2"),
+		(46, "POWER", ""),
+		(48, "PulseTime", "25"),
+		(50, "POWER", "ON"),
+		(51, "PulseTime", ""),
+		(55, "pulsetime", "0"), # Commands are case insensitive
+		(57, "POWER", "1"),
+		(58, "Status", ""),
+		(59, "Status", "8"),
+		(60, "State", ""),
+	]
+	for at, command, payload in script:
+		sim.at(at, lambda command=command, payload=payload: broker.publish("cmnd/PWRSW/" + command, payload))
+
+	def published(topic, start, end=float("inf")):
+		return [m[2].decode() for m in broker.messages if m[1] == topic and start <= m[0] < end]
+	def pulse():
+		return json.loads(published("stat/PWRSW/RESULT", 51, 52)[0])["PulseTime"]
+	def offAfterPulse():
+		return next((t for t, value in sim.switches if t > 50.5 and not value), None)
+	energy = lambda: json.loads(published("stat/PWRSW/STATUS8", 59)[0])["StatusSNS"]["ENERGY"]
+	context["checks"] += [
+		("POWER OFF/TOGGLE/2/empty/ON/1 answer with the state on stat/RESULT", lambda: published("stat/PWRSW/RESULT", 39, 47) == ['{"POWER":"OFF"}', '{"POWER":"ON"}', '{"POWER":"OFF"}', '{"POWER":"OFF"}'] and published("stat/PWRSW/RESULT", 49, 51) == ['{"POWER":"ON"}'] and published("stat/PWRSW/RESULT", 56, 58) == ['{"POWER":"ON"}']),
+		("each POWER command updates the retained stat/POWER", lambda: published("stat/PWRSW/POWER", 39, 47) == ["OFF", "ON", "OFF", "OFF"] and broker.retained.get("stat/PWRSW/POWER") == b"ON"),
+		("PulseTime answers with the value set", lambda: published("stat/PWRSW/RESULT", 47, 49) == ['{"PulseTime":{"Set":25,"Remaining":0}}'] and published("stat/PWRSW/RESULT", 54, 56) == ['{"PulseTime":{"Set":0,"Remaining":0}}']),
+		("PulseTime reports the time left of a pulse", lambda: pulse()["Set"] == 25 and 14 <= pulse()["Remaining"] <= 15),
+		("PulseTime turns the power off 2.5 s after ON", lambda: offAfterPulse() != None and 0 <= offAfterPulse() - 52.5 < 0.1 and "OFF" in published("stat/PWRSW/POWER", 52.5, 53)),
+		("the power stays on after PulseTime 0", lambda: sim.relay and not any(t > 57 and not value for t, value in sim.switches)),
+		("Status answers with the topic and power", lambda: published("stat/PWRSW/STATUS", 58, 59) == ['{"Status":{"Topic":"PWRSW","Power":1}}']),
+		("Status 8 answers with the energy readings", lambda: energy()["Voltage"] > 0 and energy()["Power"] > 0),
+		("State publishes tele/STATE", lambda: json.loads(published("tele/PWRSW/STATE", 60)[0])["POWER"] == "ON"),
+	]
+	return [40, 42, 44, 50, 52.5, 57]
+
+# The broker is restarted (forgetting its retained messages) and the Home
+# Assistant discovery configs should be published again, retained, once the
+# ProM reconnects
+def discoveryRestart(sim, context):
+	broker = context["broker"]
+	sim.at(60, lambda: broker.restart(10))
+	pattern = "homeassistant/+/+/+/config"
+
+	def configs(start, end=float("inf")):
+		return {m[1]: m[2] for m in broker.messages if matches(pattern, m[1]) and m[3] and start <= m[0] < end}
+	def retained():
+		return {topic: payload for topic, payload in broker.retained.items() if matches(pattern, topic)}
+	def valid(configs):
+		parsed = {topic: json.loads(payload) for topic, payload in configs.items()}
+		switch = [c for topic, c in parsed.items() if topic.split("/")[1] == "switch"]
+		sensors = [c for topic, c in parsed.items() if topic.split("/")[1] == "sensor"]
+		return (len(switch) == 1 and switch[0]["command_topic"] == "cmnd/PWRSW/POWER" and switch[0]["state_topic"] == "stat/PWRSW/POWER"
+			and sorted(c["value_template"] for c in sensors) == ["{{ value_json.ENERGY.%s }}" % f for f in ("Current", "Power", "Total", "Voltage")]
+			and all(c["state_topic"] == "tele/PWRSW/SENSOR" for c in sensors)
+			and len(set(c["unique_id"] for c in parsed.values())) == 5)
+	context["checks"] += [
+		("the switch and four sensor configs are published retained on connect", lambda: len(configs(0, 60)) == 5 and valid(configs(0, 60))),
+		("they are published again after the broker restarts", lambda: configs(70) == configs(0, 60)),
+		("the restarted broker has them retained", lambda: retained() == configs(0, 60)),
+		("the restarted broker has the power state retained", lambda: broker.retained.get("stat/PWRSW/POWER") == b"ON"),
+	]
+	return []
+
+def brokerFlap(sim, context):
+	broker = context["broker"]
+	for i in range(6):
+		sim.at(60 + i * 90, lambda: setattr(broker, "up", False))
+		sim.at(60 + i * 90 + 45, lambda: setattr(broker, "up", True))
+	# WiFi stays up throughout, so only MQTT should ever be reconnected
+	output = lambda: sim.output.getvalue()
+	context["checks"].append(("broker outages don't reset the sockets or radio", lambda: output().count("Reconnecting (Radio") == 1 and "Reconnecting (Sockets" not in output()))
+	stimuli = []
+	for i in range(60):
+		at = 35 + i * 10
+		sim.at(at, lambda i=i: broker.publish("cmnd/PWRSW/POWER", "OFF" if i % 2 == 0 else "ON"))
+		stimuli.append(at)
+	return stimuli
+
+# WiFi drops for a minute while the (constant 2.5 W) load stays on, readings
+# stall while reconnecting but the energy total should still cover the gap
+def wifiOutageEnergy(sim, context):
+	sim.at(100, lambda: (setattr(sim, "wifiUp", False), sim.breakSockets()))
+	sim.at(160, lambda: setattr(sim, "wifiUp", True))
+	metrics = sim.request(599, "GET", "/metrics")
+	context["replies"].append(metrics)
+	def energy():
+		line = next(l for l in metrics.body.decode().splitlines() if l.startswith("usbsw_energy_watt_hours_total"))
+		return float(line.split()[1])
+	expected = 2.5 * 599 / 3600
+	context["report"]["energyWh"] = lambda: {"measured": energy(), "expected": round(expected, 4)}
+	context["checks"].append(("energy used during the outage is counted", lambda: abs(energy() - expected) <= 0.002))
+	return []
+
+# The broker is down for 340 s with WiFi up, the samples taken meanwhile should
+# all arrive on BACKLOG once it is back, once each and 30 s apart
+def brokerOutageBacklog(sim, context):
+	broker = context["broker"]
+	sim.at(60, lambda: setattr(broker, "up", False))
+	sim.at(400, lambda: setattr(broker, "up", True))
+	def rows():
+		return [(at, row) for at, topic, payload, _ in broker.messages if topic == "tele/PWRSW/BACKLOG" for row in json.loads(payload)["Samples"]]
+	def seqs():
+		return [row[0] for _, row in rows()]
+	def taken():
+		return [at - row[1] for at, row in rows() if at > 400]
+	def accounted():
+		samples = sim.main["samples"]
+		return len(seqs()) + len(broker.topic("tele/PWRSW/SENSOR")) + samples.count == samples.nextSeq and samples.dropped == 0
+	def gaps():
+		t = taken()
+		return [round(b - a, 1) for a, b in zip(t, t[1:])]
+	context["report"]["backlog"] = lambda: {
+		"samples": len(seqs()),
+		"messages": len(broker.topic("tele/PWRSW/BACKLOG")),
+		"oldestAgeS": max(row[1] for _, row in rows()),
+		"maxGapS": max(gaps()),
+	}
+	context["checks"] += [
+		("every sample is sent once, on SENSOR or BACKLOG", accounted),
+		("no BACKLOG sample is sent twice", lambda: seqs() == sorted(set(seqs()))),
+		("the backlog covers the outage", lambda: 60 <= taken()[0] < 75 and 385 <= taken()[-1] <= 400),
+		("no backlog gap is longer than two sample periods", lambda: max(gaps()) <= 60),
+	]
+	return []
+
+def metricsFlood(sim, context):
+	for i in range(600):
+		context["replies"].append(sim.request(40 + i * 0.05, "GET", "/metrics"))
+	return []
+
+# Microbenchmarks, each returns its results with "checks" as a dict of
+# description -> True if it held
+
+# List of [at, action] scanned for the earliest, as wifi-boost timed boosts
+# before the scheduler
+class ListScheduler:
+	def __init__(self):
+		self._entries = []
+
+	def schedule(self, at, action):
+		entry = [at, action]
+		self._entries.append(entry)
+		return entry
+
+	def cancel(self, entry):
+		self._entries.remove(entry)
+
+	def nextDue(self):
+		return min(entry[0] for entry in self._entries) if self._entries else None
+
+	def runDue(self, now):
+		due = sorted((entry for entry in self._entries if entry[0] <= now), key=lambda entry: entry[0])
+		for entry in due:
+			self._entries.remove(entry)
+			entry[1]()
+		return len(due)
+
+# Every entry in the scheduler's heap is due no earlier than its parent and
+# knows its own index
+def heapValid(scheduler):
+	heap = scheduler._heap
+	return all(entry.index == i and (i == 0 or heap[(i - 1) >> 1].at <= entry.at) for i, entry in enumerate(heap))
+
+# Schedule "n" entries at random times, cancel the middle half (by due time)
+# then run them all, asking for nextDue() after every change as wifi-boost's
+# schedule task does. Times are ns per operation, including the nextDue().
+def schedulerRun(make, n, checks):
+	rng = random.Random(n)
+	times = [rng.randrange(1000000) for _ in range(n)]
+	scheduler = make()
+	heap = isinstance(scheduler, Scheduler)
+	name = "heap" if heap else "list scan"
+	fired = []
+	entries = []
+
+	start = time.perf_counter_ns()
+	for at in times:
+		entries.append(scheduler.schedule(at, lambda at=at: fired.append(at)))
+		scheduler.nextDue()
+	insertNs = (time.perf_counter_ns() - start) / n
+	if heap:
+		checks["heap: %d entries, valid after inserting" % n] = heapValid(scheduler)
+
+	byTime = sorted(range(n), key=lambda i: times[i])
+	cancelled = set(byTime[n // 4:n // 4 + n // 2])
+	start = time.perf_counter_ns()
+	for i in cancelled:
+		scheduler.cancel(entries[i])
+		scheduler.nextDue()
+	cancelNs = (time.perf_counter_ns() - start) / len(cancelled)
+	if heap:
+		checks["heap: %d entries, valid after cancelling the middle half" % n] = heapValid(scheduler) and len(scheduler) == n - len(cancelled)
+
+	start = time.perf_counter_ns()
+	due = scheduler.nextDue()
+	while due != None:
+		scheduler.runDue(due)
+		due = scheduler.nextDue()
+	fireNs = (time.perf_counter_ns() - start) / len(fired)
+
+	expected = sorted(times[i] for i in range(n) if i not in cancelled)
+	checks["%s: %d entries fire in due order, none of the cancelled" % (name, n)] = fired == expected
+	return {"insertNs": round(insertNs), "cancelNs": round(cancelNs), "fireNs": round(fireNs)}
+
+# usbswitch.scheduler against a list scan for 10 to 1000 entries, plus a
+# repeating entry run late (which should skip the repeats it missed)
+def schedulerBench():
+	checks = {}
+	result = {"heap": {}, "listScan": {}}
+	for n in (10, 100, 1000):
+		result["heap"][str(n)] = schedulerRun(Scheduler, n, checks)
+		result["listScan"][str(n)] = schedulerRun(ListScheduler, n, checks)
+
+	scheduler = Scheduler()
+	runs = []
+	entry = scheduler.schedule(100, lambda: runs.append(entry.at), repeat=50)
+	other = scheduler.schedule(120, lambda: runs.append("other"))
+	scheduler.runDue(100)
+	scheduler.cancel(other)
+	scheduler.runDue(275)
+	checks["repeat: runs again every repeat, once when late"] = runs == [150, 300] and scheduler.nextDue() == 300 and heapValid(scheduler)
+	result["checks"] = checks
+	return result
+
+# A browser's POST of a page button, with the headers a real one sends
+def buttonRequest(body, contentType="application/x-www-form-urlencoded"):
+	return ("POST / HTTP/1.1\r\nHost: 192.168.4.2:5000\r\nConnection: keep-alive\r\n"
+		"Content-Length: %d\r\nCache-Control: max-age=0\r\nOrigin: http://192.168.4.2:5000\r\n"
+		"Content-Type: %s\r\nUpgrade-Insecure-Requests: 1\r\n"
+		"User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36\r\n"
+		"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+		"Referer: http://192.168.4.2:5000/\r\nAccept-Encoding: gzip, deflate\r\nAccept-Language: en-GB,en;q=0.9\r\n"
+		"\r\n%s" % (len(body), contentType, body)).encode()
+
+# The examples before the command table, decoding the whole request and
+# looking for each command anywhere in it (wifi-boost's order)
+def substringCommand(request):
+	raw_text = request.raw_request.decode("utf8")
+	for command in ("ON", "OFF", "BOOST15", "BOOST30", "BOOST45", "BOOST60", "true", "false"):
+		if command in raw_text:
+			return command
+	return None
+
+# As the examples now do, only the "button" field of the body (form data,
+# or JSON from Home Assistant as on wifi-RESTfulSwitch) looked up in a dict
+COMMANDS = {command: command for command in ("ON", "OFF", "BOOST15", "BOOST30", "BOOST45", "BOOST60", "true", "false")}
+
+def bodyCommand(request):
+	if request.body.startswith(b"{"):
+		try:
+			return COMMANDS.get(request.json().get("button"))
+		except (ValueError, AttributeError):
+			return None
+	if request.form_data == None:
+		return None
+	return COMMANDS.get(request.form_data.get("button"))
+
+# Cost of working out the command of a POST, body lookup against the old
+# substring scan, in ns per request. The requests are parsed (as the server
+# does for each one) before the clock starts, that cost is given separately.
+def commandBench():
+	try:
+		from adafruit_httpserver import Request
+	except ImportError:
+		return {"error": "adafruit_httpserver isn't installed", "checks": {}}
+	raws = [(command, buttonRequest("button=" + command)) for command in ("ON", "OFF", "BOOST15", "BOOST30", "BOOST45", "BOOST60", "REFRESH")]
+	raws += [(value, buttonRequest('{"button": "%s"}' % value, "application/json")) for value in ("true", "false")]
+	repeat = 2000
+	server = types.SimpleNamespace(debug=False) # All Request uses of its server
+
+	def parse():
+		return [Request(server, None, ("127.0.0.1", 0), raw) for _ in range(repeat) for _, raw in raws]
+
+	# Best of 3 runs of "find" over freshly parsed requests
+	def timed(find):
+		best = None
+		for _ in range(3):
+			requests = parse()
+			start = time.perf_counter_ns()
+			for request in requests:
+				find(request)
+			ns = (time.perf_counter_ns() - start) / len(requests)
+			best = ns if best == None else min(best, ns)
+		return best
+
+	# Mean peak bytes allocated while finding the command of one request
+	def allocated(find):
+		total = 0
+		tracemalloc.start()
+		for _, raw in raws:
+			request = Request(server, None, ("127.0.0.1", 0), raw)
+			before = tracemalloc.get_traced_memory()[0]
+			tracemalloc.reset_peak()
+			find(request)
+			total += tracemalloc.get_traced_memory()[1] - before
+		tracemalloc.stop()
+		return round(total / len(raws))
+
+	start = time.perf_counter_ns()
+	parse()
+	parseNs = (time.perf_counter_ns() - start) / (repeat * len(raws))
+	substringNs = timed(substringCommand)
+	bodyNs = timed(bodyCommand)
+	found = lambda find: [find(Request(server, None, ("127.0.0.1", 0), raw)) for _, raw in raws]
+	expected = [command if command != "REFRESH" else None for command, _ in raws]
+	return {
+		"requestBytes": round(sum(len(raw) for _, raw in raws) / len(raws)),
+		"requestParseNs": round(parseNs),
+		"substringNs": round(substringNs),
+		"bodyLookupNs": round(bodyNs),
+		"substringBytes": allocated(substringCommand),
+		"bodyLookupBytes": allocated(bodyCommand),
+		"checks": {
+			"body lookup finds every command, REFRESH finds none": found(bodyCommand) == expected,
+			"substring scan finds the same, so the times compare like for like": found(substringCommand) == expected,
+		},
+	}
+
+# Runs on the simulator (instrument needs supervisor and microcontroller), a
+# loop of "passes" doing a little work bare, then timed with Stats.start()
+# and loop() as the examples' main loops are, then with request() as well.
+# Real ns per pass are left in "results".
+INSTRUMENT_LOOP = """
+import time
+from usbswitch import instrument
+
+stats = instrument.Stats()
+work = [0]
+
+def bare():
+	for _ in range(PASSES):
+		work[0] += 1
+
+def looped():
+	for _ in range(PASSES):
+		start = stats.start()
+		work[0] += 1
+		stats.loop(start)
+
+def requested():
+	for _ in range(PASSES):
+		start = stats.start()
+		work[0] += 1
+		stats.request(start)
+		stats.loop(start)
+
+results = {}
+for name, run in (("bare", bare), ("loop", looped), ("loopAndRequest", requested)):
+	best = None
+	for _ in range(3):
+		start = time.perf_counter_ns()
+		run()
+		ns = (time.perf_counter_ns() - start) / PASSES
+		best = ns if best == None else min(best, ns)
+	results[name] = best
+json = stats.json()
+"""
+
+# Overhead of usbswitch.instrument on a main loop pass, on against off
+def instrumentBench():
+	passes = 20000
+	with tempfile.TemporaryDirectory() as example:
+		with open(os.path.join(example, "code.py"), "w") as f:
+			f.write(INSTRUMENT_LOOP.replace("PASSES", str(passes)))
+		sim = Simulator(example, quiet=True)
+		sim.run(1)
+	if sim.error:
+		return {"error": sim.error.strip().splitlines()[-1], "checks": {}}
+	ns = sim.main["results"]
+	loops = json.loads(sim.main["json"])["Loop"]
+	loopNs = ns["loop"] - ns["bare"]
+	requestNs = ns["loopAndRequest"] - ns["loop"]
+	return {
+		"bareNs": round(ns["bare"]),
+		"loopOverheadNs": round(loopNs),
+		"requestOverheadNs": round(requestNs),
+		"checks": {
+			"every timed pass is counted": loops["Count"] == passes * 3 * 2,
+			"Stats.start() and loop() cost under 5 us a pass (host)": loopNs < 5000,
+			"request() costs under 5 us (host)": requestNs < 5000,
+		},
+	}
+
+# The ProM's SENSOR message, filled in from its preallocated template
+# against building the nested dict and running json.dumps each time as it
+# used to (with the MAC and IP worked out again, as the old code did)
+SENSOR_TEMPLATE = ('{"ENERGY":{'
+	'"Voltage":%(V)8.3f,"Current":%(I)9.5f,"Power":%(W)8.3f,"Factor":1,'
+	'"ApparentPower":%(W)8.3f,"ReactivePower":%(W)8.3f,'
+	'"Total":%(Total)12.6f,"Period":%(Period)10.3f},'
+	'"INA219":{"Readings":%(Readings)6d,'
+	'"VoltageMin":%(MinV)8.3f,"VoltageMax":%(MaxV)8.3f},'
+	'"DEVICE":{"MAC":["0x28","0xcd","0xc1","0x0","0x0","0x1"],"IP":"192.168.4.2"}}')
+
+def telemetryBench():
+	sys.path.insert(0, os.path.join(libDir, "..", "wifi-mqtt-switch-prom"))
+	from telemetry import Template
+	mac = bytes((0x28, 0xcd, 0xc1, 0, 0, 1))
+	rng = random.Random(1)
+	readings = [(rng.uniform(4.8, 5.2), rng.uniform(-0.1, 2.0), rng.randrange(1200)) for _ in range(2000)]
+
+	def fields(v, i, n):
+		return {"V": v, "I": i, "W": v * i, "Total": n / 7, "Period": i / 3, "Readings": n, "MinV": v - 0.01, "MaxV": v + 0.01}
+
+	template = Template(SENSOR_TEMPLATE)
+	def filled(v, i, n):
+		for name, value in fields(v, i, n).items():
+			template.put(name, value)
+		return bytes(template.buf)
+
+	def dumped(v, i, n):
+		f = fields(v, i, n)
+		return json.dumps({
+			"ENERGY": {"Voltage": f["V"], "Current": f["I"], "Power": f["W"], "Factor": 1, "ApparentPower": f["W"], "ReactivePower": f["W"], "Total": f["Total"], "Period": f["Period"]},
+			"INA219": {"Readings": n, "VoltageMin": f["MinV"], "VoltageMax": f["MaxV"]},
+			"DEVICE": {"MAC": [hex(b) for b in mac], "IP": "192.168.4.2"},
+		}).encode()
+
+	# Best of 3, ns per message
+	def timed(make):
+		best = None
+		for _ in range(3):
+			start = time.perf_counter_ns()
+			for reading in readings:
+				make(*reading)
+			ns = (time.perf_counter_ns() - start) / len(readings)
+			best = ns if best == None else min(best, ns)
+		return best
+
+	# Mean peak bytes allocated making one message
+	def allocated(make):
+		total = 0
+		tracemalloc.start()
+		for reading in readings[:200]:
+			before = tracemalloc.get_traced_memory()[0]
+			tracemalloc.reset_peak()
+			make(*reading)
+			total += tracemalloc.get_traced_memory()[1] - before
+		tracemalloc.stop()
+		return round(total / 200)
+
+	# Same JSON, to the template's decimal places
+	def same(reading):
+		old = json.loads(dumped(*reading))
+		for section in old.values():
+			for key, value in section.items():
+				if isinstance(value, float):
+					section[key] = round(value, 6 if key == "Total" else 5 if key == "Current" else 3)
+		return json.loads(filled(*reading)) == old
+
+	sizes = [len(filled(*r)) for r in readings[:10]]
+	return {
+		"templateNs": round(timed(filled)),
+		"jsonDumpsNs": round(timed(dumped)),
+		"templateBytes": allocated(filled),
+		"jsonDumpsBytes": allocated(dumped),
+		"messageBytes": sizes[0],
+		"checks": {
+			"the template gives the same JSON as json.dumps": all(same(r) for r in readings),
+			"every message is the same size": len(set(sizes)) == 1,
+		},
+	}
+
+# The ProM's unsent sample ring: how fast samples can be added, the RAM it
+# takes per 1000 samples (CPython's "L" is 8 bytes, 4 on the board so it needs 20
+# bytes per sample there) and that adding and discarding allocates nothing
+def sampleRingBench():
+	sys.path.insert(0, os.path.join(libDir, "..", "wifi-mqtt-switch-prom"))
+	from samples import SampleRing
+	n = 20000
+
+	def fill(ring):
+		for k in range(n):
+			ring.add(k, 5.0, 0.5, 2.5)
+
+	def churn(ring):
+		fill(ring)
+		for _ in range(n // 20):
+			ring.discard(20)
+			ring.add(0, 5.0, 0.5, 2.5)
+
+	best = None
+	for _ in range(3):
+		ring = SampleRing(720)
+		start = time.perf_counter_ns()
+		fill(ring)
+		ns = (time.perf_counter_ns() - start) / n
+		best = ns if best == None else min(best, ns)
+
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	ring = SampleRing(1000)
+	ringBytes = tracemalloc.get_traced_memory()[0] - before
+	churn(ring) # Once to warm up, then measured
+	before = tracemalloc.get_traced_memory()[0]
+	churn(ring)
+	grown = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+
+	# Fill to half, then take batches off the front as flushBacklog does
+	ring = SampleRing(720)
+	for k in range(360):
+		ring.add(k, 5.0, 0.5, 2.5)
+	sent = []
+	while ring.count:
+		sent += [ring.seq(k) for k in range(min(20, ring.count))]
+		ring.discard(20)
+	full = SampleRing(720)
+	for k in range(1000):
+		full.add(k, 5.0, 0.5, 2.5)
+	return {
+		"addNs": round(best),
+		"samplesPerSecond": round(1e9 / best),
+		"bytesPer1000": ringBytes,
+		"itemBytes": sum(a.itemsize for a in (ring.seqs, ring.t, ring.v, ring.i, ring.w)),
+		"churnBytes": grown,
+		"checks": {
+			# A few bytes are left over from the loop itself, but nothing per sample
+			"adding and discarding allocates nothing per sample": grown < n // 10,
+			"batches come off oldest first, each once": sent == list(range(360)),
+			"a full ring keeps the newest and counts the dropped": full.seq(0) == 280 and full.dropped == 280,
+		},
+	}
+
+MICROBENCHMARKS = {
+	"usbswitch/scheduler": schedulerBench,
+	"web/command-parse": commandBench,
+	"usbswitch/instrument": instrumentBench,
+	"wifi-mqtt-switch-prom/telemetry-encode": telemetryBench,
+	"wifi-mqtt-switch-prom/sample-ring": sampleRingBench,
+}
+
+SCENARIOS = {
+	"slide-switch/toggle-storm": ("slide-switch", 3, {}, False, slideStorm),
+	"slide-switch/idle": ("slide-switch", 10, {}, False, slideIdle),
+	"momentary-push/button-storm": ("momentary-push", 3, {}, False, pushStorm),
+	"momentary-push/gestures": ("momentary-push", 30, {}, False, pushGestures),
+	"internal-temp/temperature-sweep": ("internal-temp", 1200, {}, False, temperatureSweep),
+	"internal-temp/noisy-threshold": ("internal-temp", 3600, {}, False, temperatureNoise),
+	"wifi-buttons/boot": ("wifi-buttons", 10, WIFI, False, bootToFirstRequest("/", 10, ("keypad", "usbswitch.gestures", "usbswitch.timekeeping", "usbswitch.scheduler", "usbswitch.events", "adafruit_ntp"))),
+	"wifi-buttons/socket-faults": ("wifi-buttons", 115, WIFI, False, socketFaults("POST", "/", "button=ON")),
+	"wifi-buttons/http-flood": ("wifi-buttons", 60, WIFI, False, httpFlood("/", "button=%s", ("ON", "OFF"), 0.2, 200)),
+	"wifi-boost/boot": ("wifi-boost", 10, WIFI, False, bootToFirstRequest("/", 10, ("adafruit_ntp",))),
+	"wifi-boost/button-storm": ("wifi-boost", 60, WIFI, False, boostButtons),
+	"wifi-boost/gestures": ("wifi-boost", 960, WIFI, False, boostGestures),
+	"wifi-boost/ntp-step": ("wifi-boost", 940, WIFI, False, ntpStep),
+	"wifi-boost/dst-schedule": ("wifi-boost", 1300, dict(WIFI, TZ="GMT0BST,M3.5.0/1,M10.5.0", DAILY_SCHEDULE="00:55-02:10"), False, dstSchedule),
+	"wifi-boost/event-fanout": ("wifi-boost", 35, WIFI, False, eventFanout),
+	"wifi-boost/socket-faults": ("wifi-boost", 115, WIFI, False, socketFaults("POST", "/", "button=ON")),
+	"wifi-boost/watchdog-wifi-outage": ("wifi-boost", 300, WIFI, False, watchdogOutage),
+	"wifi-boost/http-flood": ("wifi-boost", 60, WIFI, False, httpFlood("/", "button=%s", ("ON", "OFF"), 0.2, 200)),
+	"wifi-RESTfulSwitch/boot": ("wifi-RESTfulSwitch", 10, WIFI, False, bootToFirstRequest("/api/v1/state", 10, ("keypad", "usbswitch.gestures", "usbswitch.timekeeping", "usbswitch.scheduler", "usbswitch.events", "adafruit_ntp"))),
+	"wifi-RESTfulSwitch/socket-faults": ("wifi-RESTfulSwitch", 115, WIFI, False, socketFaults("PUT", "/api/v1/switch", '{"button": "true"}', {"Content-Type": "application/json"})),
+	"wifi-RESTfulSwitch/etag-poll": ("wifi-RESTfulSwitch", 76, WIFI, False, etagPolling),
+	"wifi-RESTfulSwitch/http-flood": ("wifi-RESTfulSwitch", 60, WIFI, False, httpFlood("/api/v1/switch", '{"button": "%s"}', ("true", "false"), 0.2, 200, "PUT", {"Content-Type": "application/json"})),
+	"wifi-mqtt-switch-prom/boot": ("wifi-mqtt-switch-prom", 60, WIFI, True, bootToFirstRequest("/metrics", 60, ("keypad", "adafruit_ntp"))),
+	"wifi-mqtt-switch-prom/mqtt-burst": ("wifi-mqtt-switch-prom", 90, WIFI, True, mqttBurst),
+	"wifi-mqtt-switch-prom/tasmota-commands": ("wifi-mqtt-switch-prom", 65, WIFI, True, tasmotaCommands),
+	"wifi-mqtt-switch-prom/discovery-restart": ("wifi-mqtt-switch-prom", 90, WIFI, True, discoveryRestart),
+	"wifi-mqtt-switch-prom/broker-flap": ("wifi-mqtt-switch-prom", 640, WIFI, True, brokerFlap),
+	"wifi-mqtt-switch-prom/broker-outage-backlog": ("wifi-mqtt-switch-prom", 600, WIFI, True, brokerOutageBacklog),
+	"wifi-mqtt-switch-prom/wifi-outage-energy": ("wifi-mqtt-switch-prom", 600, WIFI, True, wifiOutageEnergy),
+	"wifi-mqtt-switch-prom/http-flood": ("wifi-mqtt-switch-prom", 75, WIFI, True, metricsFlood),
+}
+
+# count/mean/p50/p95/max of "values" (seconds) in ms
+def summary(values):
+	if not values:
+		return {"count": 0}
+	values = sorted(values)
+	ms = lambda v: round(v * 1000, 3)
+	return {
+		"count": len(values),
+		"mean": ms(sum(values) / len(values)),
+		"p50": ms(values[len(values) // 2]),
+		"p95": ms(values[min(len(values) - 1, int(len(values) * 0.95))]),
+		"p99": ms(values[min(len(values) - 1, int(len(values) * 0.99))]),
+		"max": ms(values[-1]),
+	}
+
+# Time from each stimulus to the first GP2 change before the next one (the
+# clock counts whole ns so times are rounded to those first)
+def latencies(stimuli, switches):
+	found = []
+	missed = 0
+	stimuli = sorted(round(at, 9) for at in stimuli)
+	for n, at in enumerate(stimuli):
+		until = stimuli[n + 1] if n + 1 < len(stimuli) else float("inf")
+		change = next((t for t, _ in switches if at <= round(t, 9) < until), None)
+		if change == None:
+			missed += 1
+		else:
+			found.append(max(0, change - at))
+	result = summary(found)
+	result["missed"] = missed
+	return result
+
+# After each fault the time until a request sent then was answered, and how
+# many times GP2 changed other than in answer to a stimulus
+def recovery(faults, replies, switches, latency):
+	downtimes = []
+	for n, at in enumerate(faults):
+		until = faults[n + 1] if n + 1 < len(faults) else float("inf")
+		ok = [r.sentAt for r in replies if r.sentAt != None and at <= r.sentAt < until and r.status != None and r.status < 400]
+		if ok:
+			downtimes.append(min(ok) - at)
+	result = {"faults": len(faults), "recovered": len(downtimes), "downtime": summary(downtimes)}
+	result["relayGlitches"] = len(switches) - latency["count"]
+	return result
+
+def run(name):
+	if name in MICROBENCHMARKS:
+		start = time.perf_counter()
+		result = MICROBENCHMARKS[name]()
+		result["realSeconds"] = round(time.perf_counter() - start, 3)
+		return result
+
+	example, seconds, settings, withBroker, scenario = SCENARIOS[name]
+	sim = Simulator(example, settings=dict(settings), quiet=True)
+	context = {"replies": [], "broker": Broker(sim) if withBroker else None, "checks": [], "report": {}}
+	stimuli = scenario(sim, context)
+
+	gc.collect()
+	collections = gc.get_stats()[0]["collections"]
+	tracemalloc.start()
+	start = time.perf_counter()
+	sim.run(seconds)
+	realSeconds = time.perf_counter() - start
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	# Before the first stimulus GP2 is just being set up
+	switches = [s for s in sim.switches if s[0] > 0]
+	replies = context["replies"]
+	answered = [r for r in replies if r.status != None]
+	result = {
+		"example": example,
+		"virtualSeconds": seconds,
+		"realSeconds": round(realSeconds, 3),
+		"error": sim.error.strip().splitlines()[-1] if sim.error else None,
+		"boots": sim.boots,
+		"resets": [reason for _, reason in sim.resets],
+		"dutyCycle": round(sim.clock.dutyCycle(), 6),
+		"wakeups": sim.clock.wakeups,
+		"relay": {"changes": len(switches), "perHour": round(len(switches) * 3600 / seconds, 1), "writes": sim.pin("GP2").writes},
+		"latencyMs": latencies(stimuli, switches),
+		"allocations": {"peakBytes": peak, "gen0Collections": gc.get_stats()[0]["collections"] - collections},
+	}
+	if replies:
+		result["requests"] = {
+			"sent": len(replies),
+			"answered": len(answered),
+			"ok": sum(1 for r in answered if r.status < 400),
+			"perSecond": round(len(answered) / seconds, 3),
+			"responseMs": summary([r.doneAt - r.sentAt for r in answered if r.doneAt != None]),
+		}
+	# Main loop passes as counted by code.py's usbswitch.instrument stats (the
+	# web server task on wifi-boost), since it last started
+	runStats = sim.main.get("runStats")
+	if runStats != None:
+		loops = runStats.loops
+		running = seconds - sim.bootNs / 1000000000
+		result["loop"] = {"count": loops.count, "perSecond": round(loops.count / running, 1), "meanMs": round(loops.total / max(1, loops.count), 3), "maxMs": loops.max}
+	if "faults" in context:
+		result["recovery"] = recovery(context["faults"], replies, switches, result["latencyMs"])
+	if context["broker"] != None:
+		broker = context["broker"]
+		result["mqtt"] = {"connects": broker.connects, "published": len(broker.messages)}
+	for key, report in context["report"].items():
+		result[key] = report()
+	if context["checks"]:
+		result["checks"] = {description: bool(check()) for description, check in context["checks"]}
+	return result
+
+def revision():
+	try:
+		return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+	except OSError:
+		return None
+
+# Print how the main numbers of "new" differ from "old"
+def compare(old, new):
+	keys = (
+		("latencyMs", "p95"),
+		("latencyMs", "p99"),
+		("latencyMs", "missed"),
+		("requests", "perSecond"),
+		("requests", "responseMs", "p95"),
+		("requests", "responseMs", "p99"),
+		("loop", "perSecond"),
+		("dutyCycle",),
+		("wakeups",),
+		("relay", "perHour"),
+		("relay", "writes"),
+		("allocations", "peakBytes"),
+		("heap", "1000", "insertNs"),
+		("heap", "1000", "cancelNs"),
+		("heap", "1000", "fireNs"),
+		("substringNs",),
+		("bodyLookupNs",),
+		("loopOverheadNs",),
+		("templateNs",),
+		("templateBytes",),
+		("requestOverheadNs",),
+		("realSeconds",),
+	)
+	for name, result in new["scenarios"].items():
+		before = old["scenarios"].get(name)
+		if before == None:
+			continue
+		print(name)
+		for key in keys:
+			a, b = before, result
+			for k in key:
+				a = a.get(k) if isinstance(a, dict) else None
+				b = b.get(k) if isinstance(b, dict) else None
+			if a == None or b == None or a == b:
+				continue
+			change = f"{(b - a) / a * 100:+.1f}%" if a else "new"
+			print(f"  {'.'.join(key):24} {a:>14} -> {b:<14} {change}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the examples on the host simulator")
+	parser.add_argument("scenario", nargs="*", help="scenarios to run (default all), e.g. wifi-boost/http-flood or just wifi-boost")
+	parser.add_argument("--out", help="write the results to this file (default stdout)")
+	parser.add_argument("--compare", help="results from an earlier run to compare with")
+	parser.add_argument("--list", action="store_true", help="list the scenarios")
+	args = parser.parse_args()
+
+	if args.list:
+		print("\n".join(list(SCENARIOS) + list(MICROBENCHMARKS)))
+		return
+
+	names = [name for name in list(SCENARIOS) + list(MICROBENCHMARKS) if not args.scenario or any(name == s or name.startswith(s + "/") for s in args.scenario)]
+	results = {"revision": revision(), "python": sys.version.split()[0], "scenarios": {}}
+	for name in names:
+		print(f"{name} ...", file=sys.stderr)
+		results["scenarios"][name] = run(name)
+
+	text = json.dumps(results, indent=1)
+	if args.out:
+		with open(args.out, "w") as f:
+			f.write(text + "\n")
+	else:
+		print(text)
+
+	if args.compare:
+		with open(args.compare) as f:
+			compare(json.load(f), results)
+
+	failed = [(name, description) for name, result in results["scenarios"].items() for description, ok in result.get("checks", {}).items() if not ok]
+	for name, description in failed:
+		print(f"{name}: check failed: {description}", file=sys.stderr)
+	if failed:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
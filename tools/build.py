@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Precompiled build
+#
+# CircuitPython compiles code.py (and any .py it imports) every time the
+# board starts, which takes time and RAM while the power output sits in its
+# default state. This builds each example into a folder ready to copy to the
+# CIRCUITPY drive with everything precompiled to .mpy by mpy-cross:
+#
+#  build/<example>/code.py          - just "import app"
+#  build/<example>/app.mpy          - the example's code.py
+#  build/<example>/*.mpy            - the example's other modules
+#  build/<example>/lib/usbswitch/   - the shared package
+#  build/<example>/settings.toml    - copied as is (as is safemode.py)
+#
+# and prints the source size, .mpy size and mpy-cross compile time of each file.
+#
+# mpy-cross must match the CircuitPython version on the board, download it from
+# https://adafruit-circuit-python.s3.amazonaws.com/index.html?prefix=bin/mpy-cross/
+#
+# Usage: tools/build.py [--mpy-cross path] [--out build] [example ...]
+#
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CircuitPython")
+libDir = os.path.join(root, "lib")
+
+# Copied without compiling, safemode.py has to be source for CircuitPython to find it
+copyAsIs = ("settings.toml", "safemode.py")
+
+bootCode = "# Precompiled build, the example itself is app.mpy\nimport app\n"
+
+def examples():
+	return sorted(name for name in os.listdir(root) if name != "lib" and os.path.isfile(os.path.join(root, name, "code.py")))
+
+# Compile "source" to "target", returns the time mpy-cross took (seconds)
+def compileModule(mpyCross, source, target):
+	os.makedirs(os.path.dirname(target), exist_ok=True)
+	start = time.perf_counter()
+	subprocess.run([mpyCross, "-o", target, source], check=True)
+	return time.perf_counter() - start
+
+# Build one example into out/<name>, returns a list of (file, source bytes, mpy bytes, seconds)
+def build(mpyCross, name, out):
+	source = os.path.join(root, name)
+	target = os.path.join(out, name)
+	shutil.rmtree(target, ignore_errors=True)
+	os.makedirs(target)
+	report = []
+
+	for file in sorted(os.listdir(source)):
+		path = os.path.join(source, file)
+		if file in copyAsIs:
+			shutil.copy(path, target)
+		elif file.endswith(".py"):
+			module = "app" if file == "code.py" else file[:-3]
+			mpy = os.path.join(target, module + ".mpy")
+			seconds = compileModule(mpyCross, path, mpy)
+			report.append((file, os.path.getsize(path), os.path.getsize(mpy), seconds))
+
+	with open(os.path.join(target, "code.py"), "w") as f:
+		f.write(bootCode)
+
+	# The shared package is only copied if the example uses it
+	with open(os.path.join(source, "code.py")) as f:
+		usesLib = "usbswitch" in f.read()
+	if usesLib:
+		package = os.path.join(libDir, "usbswitch")
+		for file in sorted(os.listdir(package)):
+			if not file.endswith(".py"):
+				continue
+			path = os.path.join(package, file)
+			mpy = os.path.join(target, "lib", "usbswitch", file[:-3] + ".mpy")
+			seconds = compileModule(mpyCross, path, mpy)
+			report.append(("lib/usbswitch/" + file, os.path.getsize(path), os.path.getsize(mpy), seconds))
+
+	return report
+
+def main():
+	parser = argparse.ArgumentParser(description="Build the examples as precompiled .mpy bundles")
+	parser.add_argument("--mpy-cross", default="mpy-cross", help="mpy-cross executable")
+	parser.add_argument("--out", default="build", help="output folder")
+	parser.add_argument("example", nargs="*", help="examples to build (default all)")
+	args = parser.parse_args()
+
+	if shutil.which(args.mpy_cross) == None:
+		sys.exit(f"{args.mpy_cross} not found, see the comment at the top of this file")
+
+	for name in args.example or examples():
+		report = build(args.mpy_cross, name, args.out)
+		print(f"{name}:")
+		print(f"  {'file':32} {'source':>8} {'mpy':>8} {'compile ms':>10}")
+		for file, sourceSize, mpySize, seconds in report:
+			print(f"  {file:32} {sourceSize:8d} {mpySize:8d} {seconds * 1000:10.1f}")
+		sourceTotal = sum(r[1] for r in report)
+		mpyTotal = sum(r[2] for r in report)
+		print(f"  {'total':32} {sourceTotal:8d} {mpyTotal:8d} {sum(r[3] for r in report) * 1000:10.1f}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,432 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Host simulator
+#
+# Runs an example's code.py unmodified under CPython, with stand-ins for the
+# CircuitPython modules it uses (see sim/modules) and a virtual clock, e.g.
+#
+#  from sim import Simulator
+#  s = Simulator("wifi-boost", quiet=True)
+#  s.press("GP12", at=5)
+#  page = s.request(10, "GET", "/")
+#  s.run(60)
+#  print(s.switches, page.status)
+#
+# Sleeping moves the virtual clock on instantly and polling the hardware costs
+# a little time (Clock.pollCost), so runs are fast and repeatable.
+# microcontroller.reset() and the watchdog restart code.py with a fresh set of
+# modules, keeping nvm, pin wiring and time.
+#
+# "constants" sets top level names in code.py to other values, as if the file
+# had been edited, e.g. Simulator("wifi-boost", constants={"watchdogTimeout": True}).
+#
+# Libraries from the bundle (adafruit_httpserver, adafruit_minimqtt, ...) are
+# the real ones, install them with pip (adafruit-circuitpython-httpserver etc.).
+#
+
+import ast
+import asyncio
+import calendar
+import contextlib
+import gc
+import io
+import logging
+import os
+import random
+import selectors
+import socket
+import sys
+import time
+import traceback
+import tomllib
+
+from sim import hw
+from sim.clock import Clock, Stop
+
+tools = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+root = os.path.join(tools, "..", "CircuitPython")
+modulesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+libDir = os.path.join(root, "lib")
+
+# Where CircuitPython's RTC starts until it is set
+RTC_START = 946684800 # 2000-01-01
+
+# microcontroller.nvm, counting writes (each one erases flash on the RP2040)
+class NVM:
+	def __init__(self, size=4096):
+		self.data = bytearray(b"\xff" * size)
+		self.writes = 0
+
+	def __len__(self):
+		return len(self.data)
+
+	def __getitem__(self, key):
+		return self.data[key]
+
+	def __setitem__(self, key, value):
+		self.data[key] = value
+		self.writes += 1
+
+# Reply to a Simulator.request(), filled in as it arrives
+class Reply:
+	def __init__(self, method, path):
+		self.method = method
+		self.path = path
+		self.sentAt = None
+		self.doneAt = None
+		self.raw = b""
+		self.chunks = [] # (time, data) as it arrived, e.g. for a stream of events
+		self.status = None
+		self.headers = {}
+		self.body = b""
+
+	@property
+	def done(self):
+		return self.doneAt != None
+
+	def _parse(self):
+		head, _, self.body = self.raw.partition(b"\r\n\r\n")
+		lines = head.decode("latin-1").split("\r\n")
+		if lines and lines[0].startswith("HTTP/"):
+			self.status = int(lines[0].split()[1])
+		for line in lines[1:]:
+			name, _, value = line.partition(":")
+			self.headers[name.strip().lower()] = value.strip()
+
+# Function of time interpolating between (seconds, value) points, e.g. a
+# recorded temperature trace for Simulator.temperature
+def trace(points):
+	points = sorted(points)
+	def value(t):
+		if t <= points[0][0]:
+			return points[0][1]
+		for (t0, v0), (t1, v1) in zip(points, points[1:]):
+			if t <= t1:
+				return v0 + (v1 - v0) * (t - t0) / (t1 - t0) if t1 > t0 else v1
+		return points[-1][1]
+	return value
+
+# asyncio selector which moves the virtual clock on instead of waiting
+class _Selector(selectors.BaseSelector):
+	def __init__(self, clock):
+		self._clock = clock
+		self._map = {}
+
+	def register(self, fileobj, events, data=None):
+		key = selectors.SelectorKey(fileobj, selectors._fileobj_to_fd(fileobj), events, data)
+		self._map[fileobj] = key
+		return key
+
+	def unregister(self, fileobj):
+		return self._map.pop(fileobj)
+
+	# Stop can be raised inside a task (where asyncio would keep it), so it is raised again here
+	def select(self, timeout=None):
+		if self._clock.stopped:
+			raise Stop()
+		if timeout == None:
+			timeout = self._clock.nextTimer()
+			if timeout == None:
+				timeout = 1
+		self._clock.advance(timeout, idle=True)
+		return []
+
+	def get_map(self):
+		return self._map
+
+	def close(self):
+		self._map.clear()
+
+class _Policy(asyncio.DefaultEventLoopPolicy):
+	def __init__(self, clock):
+		super().__init__()
+		self._clock = clock
+
+	def new_event_loop(self):
+		return asyncio.SelectorEventLoop(_Selector(self._clock))
+
+class Simulator:
+	def __init__(self, example, settings=None, quiet=False, pollCost=0.00001, utc=1790000000, seed=0, constants=None):
+		self.exampleDir = example if os.path.isdir(example) else os.path.join(root, example)
+		self.constants = constants or {}
+		self.settings = {}
+		path = os.path.join(self.exampleDir, "settings.toml")
+		if os.path.exists(path):
+			with open(path, "rb") as f:
+				self.settings = tomllib.load(f)
+		self.settings.update(settings or {})
+
+		self.clock = Clock(pollCost)
+		self.clock.hooks.append(self._check)
+		self.clock.limit = self._watchdogDeadline
+		self.bootNs = 0
+		self._random = random.Random(seed).getstate() # code.py's random numbers, so runs repeat
+		self.utcAtStart = utc # Real world time when the simulation starts (what NTP reports)
+		self.rtcBase = RTC_START
+
+		# Hardware, these can be changed while running (e.g. from a timer)
+		self.pins = {}
+		self.nvm = NVM()
+		self.load = lambda t: (5.0, 0.5) # INA219 reading (volts, amps) at time t when the output is on
+		self.temperature = lambda t: 27.0 # CPU temperature at time t
+		self.heapSize = 150000 # gc.mem_free() + gc.mem_alloc(), CPython's heap isn't measured
+		self.sensorUp = True
+		self.wifiUp = True
+		self.ntpUp = True
+		self.ntpDelay = 0.02 # NTP round trip (seconds)
+		self.ntpOffset = 0 # Seconds the NTP server is out by, change it to step the time
+		self.clockDrift = 0 # How much faster real time runs than the board's clock (ppm)
+		self.wifiConnectTime = 2.0
+		self.gatewayUp = True # Whether the gateway answers pings (WiFi can be up without it)
+		self.socketGeneration = 0 # Bumped by breakSockets()
+		self.socketPollCost = 0.0002 # A non-blocking socket call with nothing to do goes through lwIP so costs more than a pin read
+		self.ip = "192.168.4.2"
+		self.gateway = "192.168.4.1"
+		self.subnet = "255.255.255.0"
+		self.hosts = {} # Host name -> address
+		self.ports = {} # Port a server on the board asked for -> real 127.0.0.1 port
+		self.services = {} # (address, port) of a simulated server (e.g. sim.broker) -> real 127.0.0.1 port
+		self.watchdog = None
+
+		# What happened
+		self.resetReason = "POWER_ON"
+		self.boots = 0
+		self.resets = [] # (time, reason)
+		self.switches = [] # (time, value) each time GP2 changes
+		self.lookups = [] # (time, host) of each DNS lookup
+		self.error = None # Traceback if code.py stopped with an exception
+		self.main = {} # code.py's globals since it last started, to look at its state after a run
+		self.output = io.StringIO() if quiet else None
+		self._clients = []
+
+	# Time since the simulation started
+	def now(self):
+		return self.clock.monotonic()
+
+	def utc(self):
+		return self.utcAtStart + self.clock.monotonic()
+
+	# What NTP says the time is at simulation time "t" (default now)
+	def ntpTime(self, t=None):
+		if t == None:
+			t = self.now()
+		return self.utcAtStart + t * (1 + self.clockDrift / 1000000) + self.ntpOffset
+
+	# Seconds since the board last booted
+	def uptimeNs(self):
+		return self.clock.ns - self.bootNs
+
+	def rtcTime(self):
+		return self.rtcBase + self.uptimeNs() / 1000000000
+
+	def setTime(self, t):
+		self.rtcBase = t - self.uptimeNs() / 1000000000
+
+	# Every socket open now fails from now on, as when the network stack falls
+	# over, sockets opened afterwards work
+	def breakSockets(self):
+		self.socketGeneration += 1
+
+	def pin(self, name):
+		if name not in self.pins:
+			self.pins[name] = hw.Pin(name)
+		return self.pins[name]
+
+	def pinChanged(self, pin):
+		if pin.name == "GP2":
+			self.switches.append((self.now(), pin.output))
+		pin.changed()
+
+	# GP2, True when the power output is on
+	@property
+	def relay(self):
+		return bool(self.pin("GP2").output)
+
+	# Run "function" "at" seconds into the simulation
+	def at(self, at, function):
+		self.clock.at(at, function)
+
+	# Press a button between "name" and GND at time "at" for "duration" seconds
+	def press(self, name, at, duration=0.1):
+		self.at(at, lambda: self.pin(name).set(False))
+		self.at(at + duration, lambda: self.pin(name).set(None))
+
+	# Send an HTTP request to the board at time "at", returns a Reply
+	# "port" defaults to the first server the board started
+	def request(self, at, method, path, body=b"", headers=None, port=None):
+		reply = Reply(method, path)
+		if isinstance(body, str):
+			body = body.encode()
+
+		def send():
+			real = self.ports.get(port) if port != None else next(iter(self.ports.values()), None)
+			if real == None or not self.wifiUp:
+				reply.doneAt = self.now() # Nothing listening (or can't be reached)
+				return
+			text = "%s %s HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n" % (method, path, self.ip, len(body))
+			for name, value in (headers or {}).items():
+				text += "%s: %s\r\n" % (name, value)
+			try:
+				# A full listen backlog (nothing accepting) would block for real
+				sock = socket.create_connection(("127.0.0.1", real), timeout=0.1)
+			except OSError:
+				reply.doneAt = self.now() # Refused, the server isn't running or accepting
+				return
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			sock.sendall(text.encode() + b"\r\n" + body)
+			sock.setblocking(False)
+			reply.sentAt = self.now()
+			self._clients.append((sock, reply))
+
+		self.at(at, send)
+		return reply
+
+	def resolve(self, host):
+		if host in self.hosts:
+			return self.hosts[host]
+		if host == "localhost":
+			return "127.0.0.1"
+		if host.replace(".", "").isdigit():
+			return host
+		return None
+
+	# Where a connection from the board to host:port really goes
+	def route(self, host, port):
+		if host in (self.ip, "127.0.0.1", "localhost") and port in self.ports:
+			return "127.0.0.1", self.ports[port]
+		address = self.resolve(host)
+		if address == None:
+			raise OSError(-2, "Name or service not known")
+		if (address, port) in self.services:
+			return "127.0.0.1", self.services[(address, port)]
+		return address, port
+
+	# Sleeping stops when the watchdog goes off, so the reset happens on time
+	def _watchdogDeadline(self):
+		return self.watchdog.deadline if self.watchdog != None else None
+
+	# Called every time the clock moves
+	def _check(self):
+		wdt = self.watchdog
+		if wdt != None and wdt.deadline != None and self.clock.ns > wdt.deadline:
+			wdt.deadline = None
+			raise hw.Reset("WATCHDOG")
+		for client in list(self._clients):
+			sock, reply = client
+			try:
+				while True:
+					data = sock.recv(4096)
+					if data == b"":
+						sock.close()
+						self._clients.remove(client)
+						reply.doneAt = self.now()
+						break
+					reply.raw += data
+					reply.chunks.append((self.now(), data))
+			except BlockingIOError:
+				pass
+			except OSError:
+				sock.close()
+				self._clients.remove(client)
+				reply.doneAt = self.now()
+			reply._parse()
+
+	# Time, os.getenv and gc as seen by code.py
+	@contextlib.contextmanager
+	def _patched(self):
+		names = ("sleep", "monotonic", "monotonic_ns", "time", "localtime", "mktime")
+		saved = {name: getattr(time, name) for name in names}
+		gmtime = time.gmtime
+		getenv = os.getenv
+		path = list(sys.path)
+		randomState = random.getstate()
+		random.setstate(self._random)
+		policy = asyncio.get_event_loop_policy()
+		# Tasks left behind when a run stops part way through would be logged
+		asyncioLog = logging.getLogger("asyncio")
+		asyncioLevel = asyncioLog.level
+		asyncioLog.setLevel(logging.CRITICAL)
+
+		def sleep(seconds):
+			if seconds < 0:
+				raise ValueError("sleep length must be non-negative")
+			self.clock.advance(seconds, idle=True)
+
+		time.sleep = sleep
+		time.monotonic = lambda: self.uptimeNs() / 1000000000
+		time.monotonic_ns = self.uptimeNs
+		time.time = lambda: int(self.rtcTime())
+		time.localtime = lambda t=None: gmtime(self.rtcTime() if t == None else t)
+		time.mktime = lambda t: calendar.timegm(tuple(t))
+		os.getenv = lambda key, default=None: self.settings.get(key, default)
+		gc.mem_free = lambda: self.heapSize // 2
+		gc.mem_alloc = lambda: self.heapSize - self.heapSize // 2
+		sys.path[:0] = [modulesDir, self.exampleDir, libDir]
+		asyncio.set_event_loop_policy(_Policy(self.clock))
+		hw.current = self
+		try:
+			with contextlib.redirect_stdout(self.output) if self.output != None else contextlib.nullcontext():
+				yield
+		finally:
+			hw.current = None
+			asyncio.set_event_loop_policy(policy)
+			gc.collect() # While still quiet
+			asyncioLog.setLevel(asyncioLevel)
+			sys.path[:] = path
+			self._random = random.getstate()
+			random.setstate(randomState)
+			os.getenv = getenv
+			del gc.mem_free, gc.mem_alloc
+			for name, value in saved.items():
+				setattr(time, name, value)
+
+	# Forget every module code.py imported, so a reset starts afresh
+	def _unload(self):
+		keep = (modulesDir, self.exampleDir, libDir)
+		for name, module in list(sys.modules.items()):
+			file = getattr(module, "__file__", None) or ""
+			if name.startswith("adafruit_") or any(os.path.abspath(file).startswith(os.path.abspath(d)) for d in keep):
+				del sys.modules[name]
+
+	def _boot(self):
+		self.boots += 1
+		self.bootNs = self.clock.ns
+		self.rtcBase = RTC_START
+		self.watchdog = None
+		for pin in self.pins.values():
+			pin.reset()
+		self._unload()
+		path = os.path.join(self.exampleDir, "code.py")
+		with open(path) as f:
+			tree = ast.parse(f.read(), path)
+		for node in tree.body:
+			if isinstance(node, ast.Assign) and len(node.targets) == 1 and getattr(node.targets[0], "id", None) in self.constants:
+				node.value = ast.copy_location(ast.Constant(self.constants[node.targets[0].id]), node.value)
+		self.main = {"__name__": "__main__", "__file__": path}
+		exec(compile(tree, path, "exec"), self.main)
+
+	# Run for "seconds" of virtual time
+	def run(self, seconds):
+		self.clock.until = self.clock.ns + int(seconds * 1000000000)
+		self.clock.stopped = False
+		with self._patched():
+			while True:
+				try:
+					self._boot()
+					# code.py finished, the board sits idle until the end
+					self.clock.advance(seconds, idle=True)
+				except Stop:
+					break
+				except hw.Reset as e:
+					self.resets.append((self.now(), e.reason))
+					self.resetReason = e.reason if e.reason == "WATCHDOG" else "SOFTWARE"
+					continue
+				except Exception:
+					self.error = traceback.format_exc()
+					print(self.error)
+					self.clock.stopped = True
+					break
+		self._unload()
+		return self
@@ -0,0 +1,227 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Simulator MQTT broker
+#
+# Just enough of MQTT 3.1.1 for the examples: CONNECT, PUBLISH (QoS 0/1,
+# retained), SUBSCRIBE (with + and # wildcards), UNSUBSCRIBE, PINGREQ and
+# DISCONNECT. It runs inside the simulation (checked every time the virtual
+# clock moves) so every run is the same, e.g.
+#
+#  s = Simulator("wifi-mqtt-switch-prom", quiet=True)
+#  broker = Broker(s)
+#  s.at(60, lambda: broker.publish("cmnd/PWRSW/POWER", b"OFF"))
+#  s.run(120)
+#  print(broker.topic("tele/PWRSW/SENSOR"))
+#
+# Setting "up" to False drops every client and refuses connections (as if
+# the broker process had stopped) until it is set back to True.
+#
+
+import socket
+import struct
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# True if "topic" matches subscription "pattern"
+def matches(pattern, topic):
+	p = pattern.split("/")
+	t = topic.split("/")
+	for i, part in enumerate(p):
+		if part == "#":
+			return True
+		if i >= len(t) or (part != "+" and part != t[i]):
+			return False
+	return len(p) == len(t)
+
+def packet(kind, body, flags=0):
+	header = bytearray([kind << 4 | flags])
+	n = len(body)
+	while True:
+		byte = n % 128
+		n //= 128
+		header.append(byte | 0x80 if n else byte)
+		if not n:
+			break
+	return bytes(header) + body
+
+def string(text):
+	return struct.pack("!H", len(text)) + text
+
+class Client:
+	def __init__(self, sock):
+		self.sock = sock
+		self.data = b""
+		self.subscriptions = []
+
+	def send(self, data):
+		try:
+			self.sock.sendall(data)
+		except OSError:
+			pass
+
+	# Next complete packet (kind, flags, body) or None
+	def take(self):
+		if len(self.data) < 2:
+			return None
+		length = 0
+		shift = 0
+		i = 1
+		while True:
+			if i >= len(self.data):
+				return None
+			byte = self.data[i]
+			length |= (byte & 0x7F) << shift
+			shift += 7
+			i += 1
+			if not byte & 0x80:
+				break
+		if len(self.data) < i + length:
+			return None
+		kind = self.data[0] >> 4
+		flags = self.data[0] & 0x0F
+		body = self.data[i:i + length]
+		self.data = self.data[i + length:]
+		return kind, flags, body
+
+class Broker:
+	def __init__(self, sim, host=None, port=None):
+		self.sim = sim
+		host = host or sim.settings.get("MQTT_BROKER", "127.0.0.1")
+		port = port or sim.settings.get("MQTT_PORT", 1883)
+		self.up = True
+		self.clients = []
+		self.retained = {} # topic -> payload
+		self.messages = [] # (time, topic, payload, retain) for every PUBLISH from a client
+		self.connects = 0
+		self._address = (sim.resolve(host) or host, port)
+		self._listener = None
+		self._listen()
+		sim.clock.hooks.append(self.pump)
+
+	def _listen(self):
+		self._listener = socket.socket()
+		self._listener.bind(("127.0.0.1", 0))
+		self._listener.listen(4)
+		self._listener.setblocking(False)
+		self.sim.services[self._address] = self._listener.getsockname()[1]
+
+	# Payloads published to "topic"
+	def topic(self, topic):
+		return [m[2] for m in self.messages if m[1] == topic]
+
+	# Send a message to every client subscribed to "topic"
+	def publish(self, topic, payload, retain=False):
+		if isinstance(payload, str):
+			payload = payload.encode()
+		if retain:
+			self.retained[topic] = payload
+		message = packet(PUBLISH, string(topic.encode()) + payload)
+		for client in self.clients:
+			if any(matches(s, topic) for s in client.subscriptions):
+				client.send(message)
+
+	# Stop for "seconds" then start again having forgotten the retained
+	# messages, as a broker without persistence does when it is restarted
+	def restart(self, seconds):
+		self.up = False
+		self.retained.clear()
+		self.sim.at(self.sim.now() + seconds, lambda: setattr(self, "up", True))
+
+	def _drop(self, client):
+		client.sock.close()
+		self.clients.remove(client)
+
+	def pump(self):
+		if not self.up:
+			if self._listener != None:
+				self._listener.close()
+				self._listener = None
+				for client in list(self.clients):
+					self._drop(client)
+			return
+		if self._listener == None:
+			self._listen()
+
+		while True:
+			try:
+				sock, _ = self._listener.accept()
+			except BlockingIOError:
+				break
+			sock.setblocking(False)
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+			self.clients.append(Client(sock))
+
+		for client in list(self.clients):
+			try:
+				while True:
+					data = client.sock.recv(4096)
+					if data == b"":
+						self._drop(client)
+						break
+					client.data += data
+			except BlockingIOError:
+				pass
+			except OSError:
+				self._drop(client)
+				continue
+			while client in self.clients:
+				p = client.take()
+				if p == None:
+					break
+				self._handle(client, *p)
+
+	def _handle(self, client, kind, flags, body):
+		if kind == CONNECT:
+			self.connects += 1
+			client.send(packet(CONNACK, b"\x00\x00"))
+		elif kind == PUBLISH:
+			n = struct.unpack("!H", body[:2])[0]
+			topic = body[2:2 + n].decode()
+			rest = body[2 + n:]
+			qos = (flags >> 1) & 3
+			if qos:
+				client.send(packet(PUBACK, rest[:2]))
+				rest = rest[2:]
+			retain = bool(flags & 1)
+			self.messages.append((self.sim.now(), topic, bytes(rest), retain))
+			self.publish(topic, bytes(rest), retain)
+		elif kind == SUBSCRIBE:
+			packetId = body[:2]
+			i = 2
+			granted = b""
+			topics = []
+			while i < len(body):
+				n = struct.unpack("!H", body[i:i + 2])[0]
+				topics.append(body[i + 2:i + 2 + n].decode())
+				i += 3 + n
+				granted += b"\x00"
+			client.subscriptions += topics
+			client.send(packet(SUBACK, packetId + granted))
+			for topic, payload in self.retained.items():
+				if any(matches(s, topic) for s in topics):
+					client.send(packet(PUBLISH, string(topic.encode()) + payload, 1))
+		elif kind == UNSUBSCRIBE:
+			i = 2
+			while i < len(body):
+				n = struct.unpack("!H", body[i:i + 2])[0]
+				topic = body[i + 2:i + 2 + n].decode()
+				if topic in client.subscriptions:
+					client.subscriptions.remove(topic)
+				i += 2 + n
+			client.send(packet(UNSUBACK, body[:2]))
+		elif kind == PINGREQ:
+			client.send(packet(PINGRESP, b""))
+		elif kind == DISCONNECT:
+			self._drop(client)
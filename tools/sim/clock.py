@@ -0,0 +1,95 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Simulator virtual clock
+#
+# Time only moves when the code being run sleeps, or when it polls the
+# (simulated) hardware, which costs "pollCost" seconds. So a simulated day
+# runs as fast as the code can go and every run is the same.
+#
+# Time spent sleeping or waiting (on the network etc.) is counted as idle,
+# the rest is the CPU being busy, see dutyCycle().
+#
+
+import heapq
+import math
+
+# Raised inside the running code when the run is over
+class Stop(BaseException):
+	pass
+
+class Clock:
+	def __init__(self, pollCost=0.00001):
+		self.ns = 0 # Since boot
+		self.idleNs = 0
+		self.wakeups = 0 # Idle periods, each one ends with the CPU waking up
+		self.pollCost = pollCost
+		self._pollNs = max(1, math.ceil(pollCost * 1000000000))
+		self.until = None # Stop when this is reached (ns)
+		self.stopped = False
+		self.hooks = [] # Called after every advance
+		self.limit = None # Returns the ns an advance stops just after (e.g. when the watchdog goes off) or None
+		self._timers = [] # (at ns, seq, function)
+		self._seq = 0
+		self._running = False
+
+	def monotonic(self):
+		return self.ns / 1000000000
+
+	# Run "function" once the clock reaches "at" seconds
+	def at(self, at, function):
+		heapq.heappush(self._timers, (int(at * 1000000000), self._seq, function))
+		self._seq += 1
+
+	# Seconds until the next timer, None if there aren't any
+	def nextTimer(self):
+		if self._timers:
+			return max(0, self._timers[0][0] - self.ns) / 1000000000
+		return None
+
+	def advance(self, seconds, idle=False):
+		start = self.ns
+		target = self.ns + max(0, math.ceil(seconds * 1000000000))
+		if self.until != None and target > self.until:
+			target = self.until
+		limit = self.limit() if self.limit != None else None
+		if limit != None and target > limit + 1:
+			target = max(self.ns, limit + 1)
+		# Timers may advance the clock themselves, so don't nest
+		if not self._running:
+			self._running = True
+			try:
+				while self._timers and self._timers[0][0] <= target:
+					at, _, function = heapq.heappop(self._timers)
+					self.ns = max(self.ns, at)
+					function()
+			finally:
+				self._running = False
+		self.ns = max(self.ns, target)
+		if idle and self.ns > start:
+			self.idleNs += self.ns - start
+			self.wakeups += 1
+		for hook in self.hooks:
+			hook()
+		if self.until != None and self.ns >= self.until:
+			self.stopped = True
+			raise Stop()
+
+	# Time spent polling hardware, called millions of times by busy loops so
+	# the usual case (no timer due, not stopping) is kept short
+	def poll(self):
+		target = self.ns + self._pollNs
+		if (self._timers and self._timers[0][0] <= target) or (self.until != None and target >= self.until):
+			self.advance(self.pollCost)
+			return
+		self.ns = target
+		for hook in self.hooks:
+			hook()
+
+	# Fraction of the time since "startNs" (with "idleAtStart" idle) the CPU was busy
+	def dutyCycle(self, startNs=0, idleAtStart=0):
+		total = self.ns - startNs
+		if total <= 0:
+			return 0.0
+		return 1 - (self.idleNs - idleAtStart) / total
@@ -0,0 +1,72 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# The simulator currently running, used by the stand-in modules
+#
+
+current = None
+
+# Raised inside the running code by microcontroller.reset() / the watchdog
+class Reset(BaseException):
+	def __init__(self, reason):
+		super().__init__(reason)
+		self.reason = reason
+
+# A GPIO pin, "drive" is what is connected to it from outside (None = nothing)
+class Pin:
+	def __init__(self, name):
+		self.name = name
+		self.drive = None
+		self.writes = 0 # Times the output has been written, changed or not
+		self.reset()
+
+	# Back to how it is after a reset
+	def reset(self):
+		self.output = None # Value when an output, None when an input
+		self.pull = None # None, "UP" or "DOWN"
+		self.claimed = False # In use by a DigitalInOut, Keys etc.
+		self.watchers = []
+
+	@property
+	def level(self):
+		if self.output != None:
+			return self.output
+		if self.drive != None:
+			return self.drive
+		return self.pull == "UP"
+
+	# Drive the pin from outside (e.g. a button to GND = False)
+	def set(self, value):
+		self.drive = value
+		self.changed()
+
+	# Take the pin for a DigitalInOut etc. like CircuitPython, which only allows one user
+	def claim(self):
+		if self.claimed:
+			raise ValueError(f"{self} in use")
+		self.claimed = True
+
+	def changed(self):
+		for watcher in self.watchers:
+			watcher(self)
+
+	def __repr__(self):
+		return "board." + self.name
+
+# Constants which print like the CircuitPython ones, e.g. microcontroller.ResetReason.POWER_ON
+class Const:
+	def __init__(self, group, name):
+		self.group = group
+		self.name = name
+
+	def __repr__(self):
+		return self.group + "." + self.name
+
+def constants(group, *names):
+	class Group:
+		pass
+	Group.__name__ = group.split(".")[-1]
+	for name in names:
+		setattr(Group, name, Const(group, name))
+	return Group
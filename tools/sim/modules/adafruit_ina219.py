@@ -0,0 +1,96 @@
+# Simulator stand-in for adafruit_ina219
+#
+# Readings come from the simulator's load(t) -> (volts, amps), current only
+# flows while GP2 (the power output) is on.
+
+import sim.hw as hw
+
+class BusVoltageRange:
+	RANGE_16V = 0x00
+	RANGE_32V = 0x01
+
+class Gain:
+	DIV_1_40MV = 0x00
+	DIV_2_80MV = 0x01
+	DIV_4_160MV = 0x02
+	DIV_8_320MV = 0x03
+
+class Mode:
+	POWERDOWN = 0x00
+	SVOLT_TRIGGERED = 0x01
+	BVOLT_TRIGGERED = 0x02
+	SANDBVOLT_TRIGGERED = 0x03
+	ADCOFF = 0x04
+	SVOLT_CONTINUOUS = 0x05
+	BVOLT_CONTINUOUS = 0x06
+	SANDBVOLT_CONTINUOUS = 0x07
+
+class ADCResolution:
+	ADCRES_9BIT_1S = 0x00
+	ADCRES_10BIT_1S = 0x01
+	ADCRES_11BIT_1S = 0x02
+	ADCRES_12BIT_1S = 0x03
+	ADCRES_12BIT_2S = 0x09
+	ADCRES_12BIT_4S = 0x0A
+	ADCRES_12BIT_8S = 0x0B
+	ADCRES_12BIT_16S = 0x0C
+	ADCRES_12BIT_32S = 0x0D
+	ADCRES_12BIT_64S = 0x0E
+	ADCRES_12BIT_128S = 0x0F
+
+class INA219:
+	def __init__(self, i2c_bus, addr=0x40):
+		self.i2c_addr = addr
+		self.bus_voltage_range = BusVoltageRange.RANGE_32V
+		self.gain = Gain.DIV_8_320MV
+		self.bus_adc_resolution = ADCResolution.ADCRES_12BIT_1S
+		self.shunt_adc_resolution = ADCResolution.ADCRES_12BIT_1S
+		self.mode = Mode.SANDBVOLT_CONTINUOUS
+		self._read()
+
+	def set_calibration_32V_2A(self):
+		pass
+
+	def set_calibration_32V_1A(self):
+		pass
+
+	def set_calibration_16V_400mA(self):
+		pass
+
+	def set_calibration_16V_5A(self):
+		pass
+
+	def _read(self):
+		sim = hw.current
+		sim.clock.poll()
+		if not sim.sensorUp:
+			raise OSError(19, "No such device")
+		volts, amps = sim.load(sim.clock.monotonic())
+		if not sim.pin("GP2").level:
+			amps = 0.0
+		return volts, amps
+
+	@property
+	def bus_voltage(self):
+		return self._read()[0]
+
+	@property
+	def current(self):
+		return self._read()[1] * 1000
+
+	@property
+	def shunt_voltage(self):
+		return self._read()[1] * 0.02
+
+	@property
+	def power(self):
+		volts, amps = self._read()
+		return volts * amps
+
+	@property
+	def overflow(self):
+		return self._read()[1] > 5
+
+	@property
+	def conversion_ready(self):
+		return 1
@@ -0,0 +1,43 @@
+# Simulator stand-in for the CircuitPython alarm module
+#
+# Light sleep moves the virtual clock on (as idle time) until one of the
+# alarms goes off, with the pins left as they are. Deep sleep waits the same
+# way then restarts code.py.
+
+import sim.hw as hw
+# On the board "import alarm" is enough to use alarm.pin and alarm.time
+from alarm import pin, time
+
+__all__ = ["pin", "time", "sleep_memory", "wake_alarm", "light_sleep_until_alarms", "exit_and_deep_sleep_until_alarms"]
+
+sleep_memory = bytearray(4096)
+wake_alarm = None
+
+# Wait until one of "alarms" goes off and return it
+def _wait(alarms):
+	for a in alarms:
+		if isinstance(a, pin.PinAlarm) and a.pin.claimed:
+			raise ValueError(f"{a.pin} in use")
+	clock = hw.current.clock
+	for a in alarms:
+		a._arm()
+	while True:
+		for a in alarms:
+			if a._triggered():
+				return a
+		step = clock.nextTimer()
+		for a in alarms:
+			left = a._secondsLeft()
+			if left != None:
+				step = left if step == None else min(step, left)
+		# Nothing will ever wake it, sleep until the end of the run
+		clock.advance(step if step != None else 3600, idle=True)
+
+def light_sleep_until_alarms(*alarms):
+	global wake_alarm
+	wake_alarm = _wait(alarms)
+	return wake_alarm
+
+def exit_and_deep_sleep_until_alarms(*alarms, preserve_dios=()):
+	_wait(alarms)
+	raise hw.Reset("DEEP_SLEEP_ALARM")
@@ -0,0 +1,25 @@
+# Simulator stand-in for alarm.pin
+
+class PinAlarm:
+	def __init__(self, pin, value, edge=False, pull=False):
+		self.pin = pin
+		self.value = value
+		self.edge = edge
+		self.pull = pull
+
+	# Called as sleep starts, the alarm configures the pin
+	def _arm(self):
+		if self.pull:
+			self.pin.pull = "DOWN" if self.value else "UP"
+		self._last = self.pin.level
+
+	def _triggered(self):
+		level = self.pin.level
+		if self.edge:
+			fired = level != self._last and level == self.value
+			self._last = level
+			return fired
+		return level == self.value
+
+	def _secondsLeft(self):
+		return None
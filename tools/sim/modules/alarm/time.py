@@ -0,0 +1,22 @@
+# Simulator stand-in for alarm.time
+
+import sim.hw as hw
+
+class TimeAlarm:
+	def __init__(self, *, monotonic_time=None, epoch_time=None):
+		if (monotonic_time == None) == (epoch_time == None):
+			raise ValueError("Use monotonic_time or epoch_time")
+		self.monotonic_time = monotonic_time
+		self.epoch_time = epoch_time
+
+	def _arm(self):
+		pass
+
+	def _secondsLeft(self):
+		sim = hw.current
+		if self.monotonic_time != None:
+			return max(0, self.monotonic_time - sim.uptimeNs() / 1000000000)
+		return max(0, self.epoch_time - sim.rtcTime())
+
+	def _triggered(self):
+		return self._secondsLeft() <= 0
@@ -0,0 +1,14 @@
+# Simulator stand-in for the CircuitPython board module (Pico W pins)
+
+import sim.hw as hw
+
+for _n in range(29):
+	globals()["GP%d" % _n] = hw.current.pin("GP%d" % _n)
+
+LED = hw.current.pin("LED")
+SMPS_MODE = hw.current.pin("SMPS_MODE")
+VBUS_SENSE = hw.current.pin("VBUS_SENSE")
+VOLTAGE_MONITOR = GP29 = A3 = hw.current.pin("GP29")
+A0 = globals()["GP26"]
+A1 = globals()["GP27"]
+A2 = globals()["GP28"]
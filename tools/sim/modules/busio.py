@@ -0,0 +1,28 @@
+# Simulator stand-in for the CircuitPython busio module (only enough for the INA219 stand-in)
+
+class I2C:
+	def __init__(self, scl, sda, *, frequency=100000, timeout=255):
+		self.scl = scl
+		self.sda = sda
+		self._locked = False
+
+	def try_lock(self):
+		if self._locked:
+			return False
+		self._locked = True
+		return True
+
+	def unlock(self):
+		self._locked = False
+
+	def scan(self):
+		return [0x40]
+
+	def deinit(self):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.deinit()
@@ -0,0 +1,76 @@
+# Simulator stand-in for the CircuitPython digitalio module
+
+import sim.hw as hw
+
+Direction = hw.constants("digitalio.Direction", "INPUT", "OUTPUT")
+Pull = hw.constants("digitalio.Pull", "UP", "DOWN")
+DriveMode = hw.constants("digitalio.DriveMode", "PUSH_PULL", "OPEN_DRAIN")
+
+class DigitalInOut:
+	def __init__(self, pin):
+		pin.claim()
+		self._pin = pin
+		pin.output = None
+
+	def deinit(self):
+		if self._pin != None:
+			self._pin.output = None
+			self._pin.claimed = False
+			self._pin = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.deinit()
+
+	def switch_to_output(self, value=False, drive_mode=DriveMode.PUSH_PULL):
+		self._setOutput(bool(value))
+
+	def switch_to_input(self, pull=None):
+		self._pin.output = None
+		self.pull = pull
+
+	def _setOutput(self, value):
+		self._pin.writes += 1
+		changed = self._pin.output != value
+		self._pin.output = value
+		if changed:
+			hw.current.pinChanged(self._pin)
+
+	@property
+	def direction(self):
+		return Direction.INPUT if self._pin.output == None else Direction.OUTPUT
+
+	@direction.setter
+	def direction(self, value):
+		if value is Direction.OUTPUT:
+			if self._pin.output == None:
+				self._setOutput(False)
+		else:
+			self.switch_to_input()
+
+	@property
+	def value(self):
+		if self._pin.output == None:
+			hw.current.clock.poll()
+		return self._pin.level
+
+	@value.setter
+	def value(self, value):
+		if self._pin.output == None:
+			raise AttributeError("Cannot set value when direction is input.")
+		self._setOutput(bool(value))
+
+	@property
+	def pull(self):
+		if self._pin.pull == None:
+			return None
+		return getattr(Pull, self._pin.pull)
+
+	@pull.setter
+	def pull(self, value):
+		self._pin.pull = None if value == None else value.name
+		self._pin.changed()
+
+	drive_mode = DriveMode.PUSH_PULL
@@ -0,0 +1,127 @@
+# Simulator stand-in for the CircuitPython keypad module (Keys only)
+
+import sim.hw as hw
+from supervisor import ticks_ms
+
+class Event:
+	def __init__(self, key_number=0, pressed=True, timestamp=None):
+		self.key_number = key_number
+		self.pressed = pressed
+		self.timestamp = ticks_ms() if timestamp == None else timestamp
+
+	@property
+	def released(self):
+		return not self.pressed
+
+	def __eq__(self, other):
+		if not isinstance(other, Event):
+			return False
+		return self.key_number == other.key_number and self.pressed == other.pressed
+
+	def __repr__(self):
+		return "<Event: key_number %d %s>" % (self.key_number, "pressed" if self.pressed else "released")
+
+class EventQueue:
+	def __init__(self, maxEvents):
+		self._events = []
+		self._max = maxEvents
+		self.overflowed = False
+
+	def _add(self, event):
+		if len(self._events) >= self._max:
+			self.overflowed = True
+			return
+		self._events.append(event)
+
+	def get(self):
+		if self._events:
+			return self._events.pop(0)
+		hw.current.clock.poll()
+		return None
+
+	def get_into(self, event):
+		e = self.get()
+		if e == None:
+			return False
+		event.key_number = e.key_number
+		event.pressed = e.pressed
+		event.timestamp = e.timestamp
+		return True
+
+	def clear(self):
+		self._events.clear()
+		self.overflowed = False
+
+	def __len__(self):
+		return len(self._events)
+
+	def __bool__(self):
+		return bool(self._events)
+
+# Like the real one the pins are scanned every "interval" seconds and a change
+# has to be seen on "debounce_threshold" scans in a row, but scans are only
+# scheduled while a pin has changed so idle keys cost nothing
+class Keys:
+	def __init__(self, pins, *, value_when_pressed, pull=True, interval=0.02, max_events=64, debounce_threshold=1):
+		self._pins = list(pins)
+		self._whenPressed = value_when_pressed
+		self.events = EventQueue(max_events)
+		self._interval = int(interval * 1000000000)
+		self._threshold = debounce_threshold
+		self._counts = [0] * len(self._pins)
+		self._scanning = False
+		for pin in self._pins:
+			pin.claim()
+			pin.output = None
+			if pull:
+				pin.pull = "DOWN" if value_when_pressed else "UP"
+			pin.watchers.append(self._changed)
+		# Like the real one every key starts released, so one held down now is reported on the first scan
+		self.reset()
+
+	def _isPressed(self, pin):
+		return pin.level == self._whenPressed
+
+	def _changed(self, pin):
+		if not self._scanning:
+			self._scanning = True
+			self._scheduleScan()
+
+	def _scheduleScan(self):
+		clock = hw.current.clock
+		at = (clock.ns // self._interval + 1) * self._interval
+		clock.at(at / 1000000000, self._scan)
+
+	def _scan(self):
+		pending = False
+		for n, pin in enumerate(self._pins):
+			pressed = self._isPressed(pin)
+			if pressed == self._pressed[n]:
+				self._counts[n] = 0
+				continue
+			self._counts[n] += 1
+			if self._counts[n] >= self._threshold:
+				self._counts[n] = 0
+				self._pressed[n] = pressed
+				self.events._add(Event(n, pressed))
+			else:
+				pending = True
+		if pending:
+			self._scheduleScan()
+		else:
+			self._scanning = False
+
+	@property
+	def key_count(self):
+		return len(self._pins)
+
+	def reset(self):
+		self._pressed = [False] * len(self._pins)
+		self._changed(None)
+
+	def deinit(self):
+		for pin in self._pins:
+			if self._changed in pin.watchers:
+				pin.watchers.remove(self._changed)
+			pin.claimed = False
+		self._pins = []
@@ -0,0 +1,42 @@
+# Simulator stand-in for the CircuitPython microcontroller module
+
+import sim.hw as hw
+from watchdog import WatchDogTimer
+
+ResetReason = hw.constants("microcontroller.ResetReason", "POWER_ON", "BROWNOUT", "SOFTWARE", "DEEP_SLEEP_ALARM", "RESET_PIN", "WATCHDOG", "UNKNOWN", "RESCUE_DEBUG")
+RunMode = hw.constants("microcontroller.RunMode", "NORMAL", "SAFE_MODE", "BOOTLOADER", "UF2")
+
+class Processor:
+	frequency = 125000000
+	uid = bytearray(b"\xe6\x61\x41\x04\x03\x23\x45\x2b")
+	voltage = 3.3
+
+	@property
+	def temperature(self):
+		hw.current.clock.poll()
+		return hw.current.temperature(hw.current.clock.monotonic())
+
+	@property
+	def reset_reason(self):
+		return getattr(ResetReason, hw.current.resetReason)
+
+cpu = Processor()
+cpus = (cpu, cpu)
+nvm = hw.current.nvm
+watchdog = WatchDogTimer()
+hw.current.watchdog = watchdog
+
+def reset():
+	raise hw.Reset("SOFTWARE")
+
+def on_next_reset(run_mode):
+	pass
+
+def delay_us(delay):
+	hw.current.clock.advance(delay / 1000000)
+
+def disable_interrupts():
+	pass
+
+def enable_interrupts():
+	pass
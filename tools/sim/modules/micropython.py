@@ -0,0 +1,13 @@
+# Simulator stand-in for the micropython module
+
+def const(x):
+	return x
+
+def native(f):
+	return f
+
+def viper(f):
+	return f
+
+def opt_level(level=None):
+	return 0
@@ -0,0 +1,19 @@
+# Simulator stand-in for the CircuitPython rtc module
+
+import calendar
+import time
+import sim.hw as hw
+
+class RTC:
+	@property
+	def datetime(self):
+		return time.localtime()
+
+	@datetime.setter
+	def datetime(self, value):
+		hw.current.setTime(calendar.timegm(tuple(value)[:6] + (0, 0, 0)))
+
+	calibration = 0
+
+def set_time_source(rtc):
+	pass
@@ -0,0 +1,199 @@
+# Simulator stand-in for the CircuitPython socketpool module
+#
+# TCP sockets are real CPython sockets on 127.0.0.1 (the board's own address
+# is mapped there and servers are given a free port, see Simulator.ports), with
+# errors reported the CircuitPython way. Blocking reads wait in virtual time, so
+# timeouts cost nothing and simulated servers (sim.broker) get to answer.
+# UDP only talks to the simulated NTP server.
+
+import errno
+import socket as _socket
+import struct
+import sim.hw as hw
+
+NTP_TO_UNIX_EPOCH = 2208988800
+
+class Socket(_socket.socket):
+	# The real socket never blocks, waiting for data moves the virtual clock on
+	# (running the simulated servers) until the socket's timeout is reached
+	# Nagle's algorithm would hold small writes back for real milliseconds,
+	# which is forever to a virtual clock, so it is turned off
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		super().setblocking(False)
+		self._timeout = None
+		self.setsockopt(_socket.IPPROTO_TCP, _socket.TCP_NODELAY, 1)
+		self._generation = hw.current.socketGeneration # See Simulator.breakSockets()
+
+	def settimeout(self, value):
+		self._timeout = value
+
+	def setblocking(self, flag):
+		self._timeout = None if flag else 0
+
+	def gettimeout(self):
+		return self._timeout
+
+	def bind(self, address):
+		host, port = address
+		super().bind(("127.0.0.1", 0))
+		hw.current.ports[port] = self.getsockname()[1]
+
+	def connect(self, address):
+		host, port = hw.current.route(*address)
+		super().setblocking(True)
+		try:
+			super().connect((host, port))
+		except TimeoutError:
+			raise OSError(errno.ETIMEDOUT, "timed out")
+		except ConnectionRefusedError:
+			raise OSError(errno.ECONNREFUSED, "ECONNREFUSED")
+		finally:
+			super().setblocking(False)
+
+	def accept(self):
+		fd, address = self._wait(self._accept)
+		conn = Socket(self.family, self.type, self.proto, fileno=fd)
+		conn.setblocking(True)
+		return conn, address
+
+	# Simulated servers answer as soon as the clock moves, so if nothing has
+	# arrived after one poll nothing will until the next timer (or the timeout)
+	def _wait(self, function, *args):
+		if self._generation != hw.current.socketGeneration:
+			raise OSError(errno.ENOTCONN, "ENOTCONN")
+		clock = hw.current.clock
+		start = clock.ns
+		polled = False
+		while True:
+			try:
+				result = function(*args)
+				if result == 0 or result == b"":
+					clock.advance(hw.current.socketPollCost) # Closed, code looping on this still sees time pass
+				return result
+			except BlockingIOError:
+				if self._timeout == 0:
+					clock.advance(hw.current.socketPollCost)
+					raise OSError(errno.EAGAIN, "EAGAIN")
+				waited = (clock.ns - start) / 1000000000
+				if self._timeout != None and waited >= self._timeout:
+					raise OSError(errno.ETIMEDOUT, "timed out")
+				if not polled:
+					clock.poll()
+				else:
+					step = clock.nextTimer()
+					if self._timeout != None:
+						step = min(step, self._timeout - waited) if step != None else self._timeout - waited
+					clock.advance(step if step != None else 1, idle=True)
+				polled = not polled
+			except (ConnectionResetError, BrokenPipeError):
+				raise OSError(errno.ECONNRESET, "ECONNRESET")
+
+	def recv_into(self, buffer, nbytes=0):
+		return self._wait(super().recv_into, buffer, nbytes)
+
+	def recv(self, bufsize):
+		return self._wait(super().recv, bufsize)
+
+	def send(self, data):
+		return self._wait(super().send, data)
+
+	def sendall(self, data):
+		data = memoryview(data)
+		while len(data):
+			data = data[self.send(data):]
+
+# UDP, answers NTP requests as a server using the simulator's real world time
+# (see Simulator.ntpTime), arriving "ntpDelay" seconds after they are sent
+class UdpSocket:
+	def __init__(self):
+		self._timeout = None
+		self._reply = None
+		self._replyAt = None
+
+	def settimeout(self, value):
+		self._timeout = value
+
+	def setblocking(self, flag):
+		self._timeout = None if flag else 0
+
+	def sendto(self, data, address):
+		sim = hw.current
+		if address[1] == 123 and sim.ntpUp and sim.wifiUp:
+			t = sim.ntpTime(sim.now() + sim.ntpDelay / 2) + NTP_TO_UNIX_EPOCH
+			seconds = int(t) & 0xFFFFFFFF
+			fraction = int((t - int(t)) * 2**32)
+			reply = bytearray(48)
+			reply[0] = 0x24 # Version 4, server
+			reply[1] = 2 # Stratum
+			reply[2] = 6 # Poll
+			reply[24:32] = bytes(data[40:48]) # Originate, the request's transmit time
+			struct.pack_into("!IIII", reply, 32, seconds, fraction, seconds, fraction)
+			self._reply = reply
+			self._replyAt = sim.now() + sim.ntpDelay
+		return len(data)
+
+	def recv_into(self, buffer, nbytes=0):
+		clock = hw.current.clock
+		wait = None if self._reply == None else self._replyAt - clock.monotonic()
+		if self._timeout == 0 and (wait == None or wait > 0):
+			clock.advance(hw.current.socketPollCost)
+			raise OSError(errno.EAGAIN, "EAGAIN")
+		if wait == None or (self._timeout != None and wait > self._timeout):
+			clock.advance(self._timeout or 0, idle=True)
+			raise OSError(errno.ETIMEDOUT, "timed out")
+		clock.advance(max(0, wait), idle=True)
+		n = min(len(buffer), len(self._reply))
+		buffer[:n] = self._reply[:n]
+		self._reply = None
+		return n
+
+	def recvfrom_into(self, buffer):
+		return self.recv_into(buffer), ("0.0.0.0", 123)
+
+	def close(self):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+class SocketPool:
+	AF_INET = _socket.AF_INET
+	AF_INET6 = _socket.AF_INET6
+	SOCK_STREAM = _socket.SOCK_STREAM
+	SOCK_DGRAM = _socket.SOCK_DGRAM
+	SOCK_RAW = _socket.SOCK_RAW
+	SOL_SOCKET = _socket.SOL_SOCKET
+	SO_REUSEADDR = _socket.SO_REUSEADDR
+	IPPROTO_TCP = _socket.IPPROTO_TCP
+	IPPROTO_IP = _socket.IPPROTO_IP
+	TCP_NODELAY = _socket.TCP_NODELAY
+	EAI_NONAME = -2
+
+	class gaierror(OSError):
+		pass
+
+	def __init__(self, radio):
+		self._radio = radio
+
+	def socket(self, family=_socket.AF_INET, type=_socket.SOCK_STREAM, proto=0):
+		if not self._radio.connected:
+			raise OSError(errno.ENETUNREACH, "Network unreachable")
+		if type == _socket.SOCK_DGRAM:
+			return UdpSocket()
+		return Socket(family, type, proto)
+
+	def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+		hw.current.lookups.append((hw.current.now(), host))
+		if not self._radio.connected:
+			raise self.gaierror(self.EAI_NONAME, "Name or service not known")
+		if port == 123 or host.endswith("pool.ntp.org"):
+			address = "0.0.0.0"
+		else:
+			address = hw.current.resolve(host)
+			if address == None:
+				raise self.gaierror(self.EAI_NONAME, "Name or service not known")
+		return [(_socket.AF_INET, _socket.SOCK_STREAM, 0, "", (address, port))]
@@ -0,0 +1,26 @@
+# Simulator stand-in for the CircuitPython supervisor module
+
+import sim.hw as hw
+
+RunReason = hw.constants("supervisor.RunReason", "STARTUP", "AUTO_RELOAD", "SUPERVISOR_RELOAD", "REPL_RELOAD")
+SafeModeReason = hw.constants("supervisor.SafeModeReason", "NONE", "BROWNOUT", "HARD_FAULT", "WATCHDOG", "USER", "PROGRAMMATIC")
+
+class Runtime:
+	def __init__(self):
+		self.autoreload = True
+		self.run_reason = RunReason.STARTUP
+		self.safe_mode_reason = SafeModeReason.NONE
+		self.serial_connected = True
+		self.serial_bytes_available = 0
+		self.usb_connected = True
+
+runtime = Runtime()
+
+def ticks_ms():
+	return (hw.current.clock.ns // 1000000) & ((1 << 29) - 1)
+
+def reload():
+	raise hw.Reset("reload")
+
+def set_next_code_file(filename, **kwargs):
+	pass
@@ -0,0 +1,32 @@
+# Simulator stand-in for the CircuitPython watchdog module
+
+import sim.hw as hw
+
+WatchDogMode = hw.constants("watchdog.WatchDogMode", "RAISE", "RESET")
+
+class WatchDogTimeout(Exception):
+	pass
+
+# microcontroller.watchdog, the simulator checks "deadline" as the clock moves
+class WatchDogTimer:
+	def __init__(self):
+		self.mode = None
+		self._timeout = 0
+		self.deadline = None
+
+	@property
+	def timeout(self):
+		return self._timeout
+
+	@timeout.setter
+	def timeout(self, value):
+		self._timeout = value
+		self.feed()
+
+	def feed(self):
+		if self.mode != None:
+			self.deadline = hw.current.clock.ns + int(self._timeout * 1000000000)
+
+	def deinit(self):
+		self.mode = None
+		self.deadline = None
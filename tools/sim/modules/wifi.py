@@ -0,0 +1,67 @@
+# Simulator stand-in for the CircuitPython wifi module (station mode only)
+
+import ipaddress
+import sim.hw as hw
+
+class Radio:
+	def __init__(self):
+		self._enabled = True
+		self._connected = False
+		self.hostname = "cpy-pico-w"
+		self.mac_address = bytes.fromhex("28cdc1000001")
+		self.tx_power = 20
+
+	@property
+	def enabled(self):
+		return self._enabled
+
+	@enabled.setter
+	def enabled(self, value):
+		self._enabled = value
+		if not value:
+			self._connected = False
+
+	@property
+	def connected(self):
+		return self._connected and hw.current.wifiUp
+
+	def connect(self, ssid, password="", *, channel=0, bssid=None, timeout=None):
+		hw.current.clock.advance(hw.current.wifiConnectTime, idle=True)
+		if not self._enabled:
+			raise RuntimeError("Wifi is not enabled")
+		if not hw.current.wifiUp or ssid != hw.current.settings.get("CIRCUITPY_WIFI_SSID"):
+			raise ConnectionError("No network with that ssid")
+		self._connected = True
+
+	def stop_station(self):
+		self._connected = False
+
+	def _address(self, name):
+		if not self.connected:
+			return None
+		return ipaddress.IPv4Address(getattr(hw.current, name))
+
+	@property
+	def ipv4_address(self):
+		return self._address("ip")
+
+	@property
+	def ipv4_gateway(self):
+		return self._address("gateway")
+
+	@property
+	def ipv4_dns(self):
+		return self._address("gateway")
+
+	@property
+	def ipv4_subnet(self):
+		return self._address("subnet")
+
+	def ping(self, ip, *, timeout=0.5):
+		if not self.connected or not hw.current.gatewayUp:
+			hw.current.clock.advance(timeout, idle=True)
+			return None
+		hw.current.clock.advance(0.002, idle=True)
+		return 0.002
+
+radio = Radio()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Run an example on the host simulator (see tools/sim)
+#
+# Prints the example's output then a summary of what the power output did,
+# the resets and the replies to any requests.
+#
+# Usage: tools/simulate.py [--seconds 60] [--set KEY=VALUE ...] [--const NAME=VALUE ...] [--press GP12@5[:0.1] ...]
+#                          [--get /path@10 ...] [--post /path@10=body ...] [--broker]
+#                          [--temperature trace.csv] [--clock-drift PPM] [--ntp-step SECONDS@10 ...]
+#                          [--ntp-down START:END ...] [--break-sockets TIME ...] [--wifi-down START:END ...]
+#                          example
+#
+# e.g. tools/simulate.py --seconds 7200 --press GP12@5 --get /@10 wifi-boost
+#
+# --const changes a setting at the top of code.py (e.g. watchdogTimeout=True),
+# the value is a Python literal.
+#
+# A temperature trace is a CSV file of "seconds,celsius" lines (e.g. recorded
+# from a board), replayed as the CPU temperature.
+#
+# The NTP server can be stepped (as if someone changed its time) or stopped
+# for a while, and the board's clock can be made to run slow (or fast if
+# negative) compared with NTP.
+#
+# --break-sockets makes every socket open at that time fail (as when the
+# network stack falls over), --wifi-down drops WiFi (and its sockets) for a while.
+#
+
+import argparse
+import ast
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sim import Simulator, trace
+from sim.broker import Broker
+
+# "VALUE" as an int if it looks like one (os.getenv on CircuitPython returns str or int)
+def settingValue(text):
+	try:
+		return int(text)
+	except ValueError:
+		return text
+
+# (seconds, celsius) points from a CSV file, lines that aren't numbers are skipped
+def readTrace(path):
+	points = []
+	with open(path) as f:
+		for line in f:
+			try:
+				t, value = line.split(",")[:2]
+				points.append((float(t), float(value)))
+			except ValueError:
+				continue
+	return points
+
+def main():
+	parser = argparse.ArgumentParser(description="Run an example under the host simulator")
+	parser.add_argument("example", help="example folder name (or path)")
+	parser.add_argument("--seconds", type=float, default=60, help="virtual seconds to run for")
+	parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a settings.toml value")
+	parser.add_argument("--const", action="append", default=[], metavar="NAME=VALUE", help="change a constant at the top of code.py")
+	parser.add_argument("--press", action="append", default=[], metavar="PIN@TIME[:DURATION]", help="press a button")
+	parser.add_argument("--get", action="append", default=[], metavar="PATH@TIME", help="send a GET request")
+	parser.add_argument("--post", action="append", default=[], metavar="PATH@TIME=BODY", help="send a POST request")
+	parser.add_argument("--broker", action="store_true", help="run an MQTT broker at MQTT_BROKER:MQTT_PORT")
+	parser.add_argument("--temperature", metavar="CSV", help="replay a recorded CPU temperature trace")
+	parser.add_argument("--clock-drift", type=float, default=0, metavar="PPM", help="how much slower the board's clock runs than NTP time")
+	parser.add_argument("--ntp-step", action="append", default=[], metavar="SECONDS@TIME", help="move the NTP server's time")
+	parser.add_argument("--ntp-down", action="append", default=[], metavar="START:END", help="stop NTP answering for a while")
+	parser.add_argument("--break-sockets", action="append", default=[], type=float, metavar="TIME", help="make every open socket fail")
+	parser.add_argument("--wifi-down", action="append", default=[], metavar="START:END", help="drop WiFi for a while")
+	parser.add_argument("--quiet", action="store_true", help="only print the summary")
+	args = parser.parse_args()
+
+	settings = {}
+	for item in args.set:
+		key, _, value = item.partition("=")
+		settings[key] = settingValue(value)
+
+	constants = {}
+	for item in args.const:
+		name, _, value = item.partition("=")
+		constants[name] = ast.literal_eval(value)
+
+	sim = Simulator(args.example, settings=settings, quiet=args.quiet, constants=constants)
+	broker = Broker(sim) if args.broker else None
+	if args.temperature:
+		sim.temperature = trace(readTrace(args.temperature))
+
+	sim.clockDrift = args.clock_drift
+	for item in args.ntp_step:
+		seconds, _, at = item.partition("@")
+		sim.at(float(at), lambda seconds=float(seconds): setattr(sim, "ntpOffset", sim.ntpOffset + seconds))
+	for item in args.ntp_down:
+		start, _, end = item.partition(":")
+		sim.at(float(start), lambda: setattr(sim, "ntpUp", False))
+		sim.at(float(end), lambda: setattr(sim, "ntpUp", True))
+
+	for at in args.break_sockets:
+		sim.at(at, sim.breakSockets)
+	for item in args.wifi_down:
+		start, _, end = item.partition(":")
+		sim.at(float(start), lambda: (setattr(sim, "wifiUp", False), sim.breakSockets()))
+		sim.at(float(end), lambda: setattr(sim, "wifiUp", True))
+
+	for item in args.press:
+		name, _, when = item.partition("@")
+		at, _, duration = when.partition(":")
+		sim.press(name, float(at), float(duration or 0.1))
+
+	replies = []
+	for item in args.get:
+		path, _, at = item.rpartition("@")
+		replies.append(sim.request(float(at), "GET", path))
+	for item in args.post:
+		target, _, body = item.partition("=")
+		path, _, at = target.rpartition("@")
+		replies.append(sim.request(float(at), "POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"}))
+
+	sim.run(args.seconds)
+
+	print()
+	changes = sum(1 for t, _ in sim.switches if t > 0)
+	print(f"{args.example}: {args.seconds:g} s, {sim.boots} boot(s), nvm writes: {sim.nvm.writes}")
+	print(f"  GP2 changes: {changes} ({changes * 3600 / args.seconds:.1f}/hour), writes: {sim.pin('GP2').writes}")
+	print(f"  CPU busy: {sim.clock.dutyCycle() * 100:.4f}%, wakeups: {sim.clock.wakeups}")
+	for t, value in sim.switches:
+		print(f"  {t:10.3f} GP2 {'on' if value else 'off'}")
+	for t, reason in sim.resets:
+		print(f"  {t:10.3f} reset ({reason})")
+	for reply in replies:
+		if reply.sentAt == None:
+			print(f"  {reply.method} {reply.path}: nothing listening")
+		else:
+			print(f"  {reply.sentAt:10.3f} {reply.method} {reply.path}: {reply.status} ({len(reply.body)} bytes)")
+	if broker != None:
+		print(f"  MQTT: {broker.connects} connect(s), {len(broker.messages)} message(s) published")
+	if sim.error != None:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,37 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Tests of the examples on the host simulator (see tools/sim), run with
+#
+#  python -m pytest tools/tests
+#
+# The examples use the real Adafruit libraries, tests of examples which need
+# one that isn't installed are skipped.
+#
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim import Simulator
+
+WIFI = {"CIRCUITPY_WIFI_SSID": "test", "CIRCUITPY_WIFI_PASSWORD": "test"}
+FORM = {"Content-Type": "application/x-www-form-urlencoded"}
+JSON = {"Content-Type": "application/json"}
+
+# Skip unless the libraries "modules" (e.g. adafruit_httpserver) are installed
+def needs(*modules):
+	for module in modules:
+		pytest.importorskip(module)
+
+# A quiet simulator running "example" with WiFi set up
+def simulator(example, settings=None, **kwargs):
+	return Simulator(example, settings=dict(WIFI, **(settings or {})), quiet=True, **kwargs)
+
+# Times GP2 changed to "value" after the start
+def switched(sim, value):
+	return [t for t, v in sim.switches if t > 0 and v == value]
@@ -0,0 +1,122 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# ProM power switched by MQTT commands, through the simulated broker
+#
+
+import json
+
+from sim.broker import Broker
+
+from conftest import needs, simulator, switched
+
+def test_power_commands():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.at(40, lambda: broker.publish("cmnd/PWRSW/POWER", "OFF"))
+	sim.at(45, lambda: broker.publish("cmnd/PWRSW/POWER", "TOGGLE"))
+	sim.run(50)
+	assert sim.error == None
+	assert 40 <= switched(sim, False)[0] < 40.1
+	assert 45 <= switched(sim, True)[0] < 45.1
+	assert broker.topic("stat/PWRSW/POWER")[-2:] == [b"OFF", b"ON"]
+	assert broker.retained["stat/PWRSW/POWER"] == b"ON"
+
+# The broker going away is recovered from by reconnecting, without a reset
+def test_reconnects_after_broker_outage():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.at(50, lambda: setattr(broker, "up", False))
+	sim.at(80, lambda: setattr(broker, "up", True))
+	sim.at(140, lambda: broker.publish("cmnd/PWRSW/POWER", "OFF"))
+	sim.run(145)
+	assert sim.error == None and sim.resets == []
+	assert broker.connects == 2
+	assert switched(sim, False) and 140 <= switched(sim, False)[0] < 140.1
+	assert broker.retained["stat/PWRSW/POWER"] == b"OFF"
+
+# /events listeners are sent the state when they connect and after each change
+def test_events_follow_power():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	listener = sim.request(40, "GET", "/events")
+	sim.at(45, lambda: broker.publish("cmnd/PWRSW/POWER", "OFF"))
+	sim.at(50, lambda: broker.publish("cmnd/PWRSW/POWER", "ON"))
+	sim.run(55)
+	assert sim.error == None
+	events = b"".join(chunk for _, chunk in listener.chunks)
+	assert listener.status == 200
+	assert events.count(b"event: state") == 3
+	assert events.index(b'{"POWER":"ON"}') < events.index(b'{"POWER":"OFF"}') < events.rindex(b'{"POWER":"ON"}')
+
+# /metrics is still answered while MQTT is being reconnected
+def test_metrics_answered_during_broker_outage():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.at(60, lambda: setattr(broker, "up", False))
+	sim.at(400, lambda: setattr(broker, "up", True))
+	scrapes = [sim.request(at, "GET", "/metrics") for at in (50, 100, 200, 300, 450)]
+	sim.run(460)
+	assert sim.error == None and sim.resets == []
+	assert [r.status for r in scrapes] == [200] * 5
+	assert all(r.doneAt - r.sentAt < 0.5 for r in scrapes)
+
+# A broker outage with WiFi up is retried at the MQTT tier alone, the sockets
+# and radio are left alone as nothing points to them
+def test_broker_outage_stays_at_mqtt_tier():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.at(60, lambda: setattr(broker, "up", False))
+	sim.at(400, lambda: setattr(broker, "up", True))
+	sim.run(460)
+	output = sim.output.getvalue()
+	assert sim.error == None and sim.resets == []
+	assert output.count("Reconnecting (Radio") == 1 # Only the first connect
+	assert "Reconnecting (Sockets" not in output
+	assert "Recovered (MQTT)" in output and broker.connects == 2
+
+# The gateway not answering pings is evidence of a network fault, so the
+# recovery still moves up to restarting the radio
+def test_gateway_outage_restarts_radio():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	def down():
+		broker.up = False
+		sim.gatewayUp = False
+	def up():
+		broker.up = True
+		sim.gatewayUp = True
+	sim.at(60, down)
+	sim.at(300, up)
+	sim.run(400)
+	output = sim.output.getvalue()
+	assert sim.error == None and sim.resets == []
+	assert "Reconnecting (Sockets" in output
+	assert output.count("Reconnecting (Radio") > 1
+	assert "Recovered (Radio)" in output
+
+# Samples taken while the broker is down are sent on BACKLOG once it is back,
+# each exactly once, with ages which put them in the outage 30 s apart
+def test_backlog_covers_broker_outage():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.at(60, lambda: setattr(broker, "up", False))
+	sim.at(400, lambda: setattr(broker, "up", True))
+	sim.run(600)
+	assert sim.error == None and sim.resets == []
+	rows = [(at, row) for at, topic, payload, _ in broker.messages if topic == "tele/PWRSW/BACKLOG" for row in json.loads(payload)["Samples"]]
+	seqs = [row[0] for _, row in rows]
+	taken = [at - row[1] for at, row in rows if at > 400]
+	samples = sim.main["samples"]
+	assert seqs == sorted(set(seqs)) and samples.dropped == 0
+	assert len(seqs) + len(broker.topic("tele/PWRSW/SENSOR")) + samples.count == samples.nextSeq
+	assert 60 <= taken[0] < 75 and 385 <= taken[-1] <= 400
+	assert all(25 <= b - a <= 35 for a, b in zip(taken[1:], taken[2:]))
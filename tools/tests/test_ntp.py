@@ -0,0 +1,43 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# NTP syncs on wifi-boost, syncing every minute so there are a few of them
+#
+
+from conftest import needs, simulator
+
+def ntpLookups(sim):
+	return [round(t) for t, host in sim.lookups if host == "pool.ntp.org"]
+
+def syncs(sim):
+	return sim.output.getvalue().count("NTP sync")
+
+def test_server_looked_up_once():
+	needs("adafruit_httpserver", "asyncio")
+	sim = simulator("wifi-boost", constants={"ntpInterval": 60})
+	sim.run(300)
+	assert sim.error == None
+	assert syncs(sim) == 5
+	assert ntpLookups(sim) == [2]
+
+def test_server_looked_up_again_after_failure():
+	needs("adafruit_httpserver", "asyncio")
+	sim = simulator("wifi-boost", constants={"ntpInterval": 60})
+	sim.ntpUp = False
+	sim.at(30, lambda: setattr(sim, "ntpUp", True))
+	sim.run(300)
+	assert sim.error == None
+	assert syncs(sim) >= 3
+	# Timed out 5 s after WiFi connected, retried 60 s later
+	assert ntpLookups(sim) == [2, 67]
+
+# The sync at 122 s fails with WiFi down, so the retry looks it up again
+def test_server_looked_up_again_after_wifi_drop():
+	needs("adafruit_httpserver", "asyncio")
+	sim = simulator("wifi-boost", constants={"ntpInterval": 60})
+	sim.at(110, lambda: setattr(sim, "wifiUp", False))
+	sim.at(150, lambda: setattr(sim, "wifiUp", True))
+	sim.run(300)
+	assert sim.error == None
+	assert ntpLookups(sim) == [2, 182]
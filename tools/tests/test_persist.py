@@ -0,0 +1,125 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# ProM energy / relay state records in nvm (wifi-mqtt-switch-prom/persist.py),
+# torn by power cuts, corrupted, restored at boot and how often they are written
+#
+
+import os
+import sys
+
+import pytest
+
+from sim import root
+from sim.broker import Broker
+
+from conftest import needs, simulator
+
+sys.path.insert(0, os.path.join(root, "wifi-mqtt-switch-prom"))
+
+from persist import EnergyStore, RECORD_SIZE
+
+# Raised by TearingNVM when it loses power part way through a write
+class PowerCut(Exception):
+	pass
+
+# nvm which only writes the first "tearAt" bytes of the next write, then loses power
+class TearingNVM(bytearray):
+	tearAt = None
+
+	def __setitem__(self, key, value):
+		if self.tearAt != None and isinstance(key, slice):
+			start = key.start
+			super().__setitem__(slice(start, start + self.tearAt), value[:self.tearAt])
+			self.tearAt = None
+			raise PowerCut()
+		super().__setitem__(key, value)
+
+def store(nvm, slots=8):
+	return EnergyStore(nvm, slots=slots, end=len(nvm) - 32)
+
+def saved(nvm, count, slots=8):
+	s = store(nvm, slots)
+	for n in range(1, count + 1):
+		s.save(n * 100, n % 2 == 1)
+	return s
+
+# Cut at every byte of a record, over blank nvm and over an older record
+@pytest.mark.parametrize("count", [3, 8 + 3])
+@pytest.mark.parametrize("tearAt", range(1, RECORD_SIZE))
+def test_torn_record_is_ignored(count, tearAt):
+	nvm = TearingNVM(b"\xff" * 4096)
+	s = saved(nvm, count)
+	nvm.tearAt = tearAt
+	with pytest.raises(PowerCut):
+		s.save(99999, False)
+	assert store(nvm).load() == (count * 100, count % 2 == 1)
+
+def test_corrupt_record_is_ignored():
+	nvm = bytearray(b"\xff" * 4096)
+	s = saved(nvm, 5)
+	newest = s.offset + s.slot * RECORD_SIZE
+	for pos in range(newest, newest + RECORD_SIZE):
+		for bit in (0x01, 0x80):
+			corrupt = bytearray(nvm)
+			corrupt[pos] ^= bit
+			assert store(corrupt).load() == (400, False)
+	# Corrupting an older record doesn't matter
+	nvm[newest - RECORD_SIZE + 6] ^= 0x10
+	assert store(nvm).load() == (500, True)
+
+def test_newest_record_wins_round_the_ring():
+	nvm = bytearray(b"\xff" * 4096)
+	for count in (1, 7, 8, 9, 30):
+		nvm[:] = b"\xff" * 4096
+		saved(nvm, count)
+		restored = store(nvm)
+		assert restored.load() == (count * 100, count % 2 == 1)
+		# and carries on from there
+		restored.save(12345, True)
+		assert store(nvm).load() == (12345, True)
+
+def test_nothing_saved():
+	assert store(bytearray(b"\xff" * 4096)).load() == None
+	assert store(bytearray(4096)).load() == None
+
+# Records stay below the reset reason at the end of nvm however many slots are asked for
+def test_records_stay_below_reset_reason():
+	nvm = bytearray(b"\xff" * 4096)
+	nvm[-32:] = b"R" * 32
+	s = saved(nvm, 1000, slots=10000)
+	assert s.slots == (4096 - 32) // RECORD_SIZE
+	assert nvm[-32:] == b"R" * 32
+
+# The ProM restarted from the nvm of one which lost power carries on with its
+# energy total and relay state
+def test_restored_after_power_cut():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.at(40, lambda: broker.publish("cmnd/PWRSW/POWER", "OFF"))
+	sim.run(120)
+	assert sim.error == None and not sim.relay
+	total = EnergyStore(sim.nvm.data, slots=32).load()[0]
+
+	again = simulator("wifi-mqtt-switch-prom")
+	again.nvm = sim.nvm
+	again.run(5)
+	assert again.error == None
+	assert again.switches[0] == (0, False)
+	assert "Restored %d mWh, power off" % total in again.output.getvalue()
+
+# Flash wear: the energy total is saved every NVM_CHECKPOINT_MINUTES (15) and
+# relay changes at most once a minute (checkpointMinGap)
+@pytest.mark.parametrize("toggleEvery, budget", [(None, 60 // 15 + 1), (15, 60)])
+def test_writes_per_hour(toggleEvery, budget):
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom", {"SENSOR_SAMPLE_RATE": 2})
+	broker = Broker(sim)
+	if toggleEvery:
+		for i in range(int(3600 / toggleEvery)):
+			sim.at(40 + i * toggleEvery, lambda: broker.publish("cmnd/PWRSW/POWER", "TOGGLE"))
+	sim.run(3600)
+	assert sim.error == None
+	assert 0 < sim.nvm.writes <= budget
@@ -0,0 +1,64 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# The ProM's telemetry template (wifi-mqtt-switch-prom/telemetry.py) should
+# give the same JSON the old json.dumps of a dict did
+#
+
+import json
+import os
+import sys
+
+import pytest
+
+from sim import root
+from sim.broker import Broker
+
+from conftest import needs, simulator
+
+sys.path.insert(0, os.path.join(root, "wifi-mqtt-switch-prom"))
+from telemetry import Template
+
+TEXT = '{"V":%(V)8.3f,"I":%(I)9.5f,"N":%(N)6d,"Again":%(V)8.3f}'
+
+@pytest.mark.parametrize("v, i, n", [
+	(0, 0, 0),
+	(5.0, 0.5, 1200),
+	(4.9996, 0.000004, 7), # Rounded to the slot's places
+	(-1.25, -0.03125, -42),
+	(9999.999, 999.99999, 999999), # Widest that fit
+	(-999.999, -99.99999, -99999),
+	(-0.0004, -0.000004, 0), # Round to nothing
+])
+def test_template_round_trip(v, i, n):
+	t = Template(TEXT)
+	t.put("V", v)
+	t.put("I", i)
+	t.put("N", n)
+	assert len(t.buf) == len(Template(TEXT).buf)
+	assert json.loads(t.buf) == json.loads(json.dumps({"V": round(v, 3), "I": round(i, 5), "N": n, "Again": round(v, 3)}))
+
+# Too big for the slot clamps to the widest that fits
+def test_template_clamps():
+	t = Template(TEXT)
+	t.put("V", 123456.0)
+	t.put("I", -5000.0)
+	t.put("N", 10000000)
+	assert json.loads(t.buf) == {"V": 9999.999, "I": -99.99999, "N": 999999, "Again": 9999.999}
+
+# The message the ProM publishes has what the old json.dumps one did
+def test_sensor_message_matches_old_payload():
+	needs("adafruit_minimqtt", "adafruit_httpserver")
+	sim = simulator("wifi-mqtt-switch-prom")
+	broker = Broker(sim)
+	sim.load = lambda t: (5.0, 0.5)
+	sim.run(70)
+	assert sim.error == None
+	message = json.loads(broker.topic("tele/PWRSW/SENSOR")[-1])
+	energy = message["ENERGY"]
+	assert {k: energy[k] for k in ("Voltage", "Current", "Power", "Factor", "ApparentPower", "ReactivePower")} == {
+		"Voltage": 5.0, "Current": 0.5, "Power": 2.5, "Factor": 1, "ApparentPower": 2.5, "ReactivePower": 2.5,
+	}
+	assert message["DEVICE"]["IP"] == sim.ip
+	assert all(mac.startswith("0x") for mac in message["DEVICE"]["MAC"])
@@ -0,0 +1,82 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Watchdog resets, on a small example of its own and the web examples with
+# the watchdog turned on
+#
+
+import pytest
+
+from sim import Simulator
+
+from conftest import FORM, needs, simulator, switched
+
+# Counts its boots in nvm, prints why it reset and feeds the watchdog "feeds" times
+STALLS = """
+import microcontroller
+import time
+from usbswitch.wdt import Watchdog
+
+microcontroller.nvm[0] = (microcontroller.nvm[0] + 1) & 0xFF
+print("Reset reason", microcontroller.cpu.reset_reason)
+wdt = Watchdog(2)
+for i in range(FEEDS):
+	wdt.feed()
+	time.sleep(1)
+while True:
+	time.sleep(1)
+"""
+
+def stalls(tmp_path, feeds):
+	(tmp_path / "code.py").write_text(STALLS.replace("FEEDS", str(feeds)))
+	return Simulator(str(tmp_path), quiet=True)
+
+def test_resets_when_not_fed(tmp_path):
+	sim = stalls(tmp_path, 0)
+	sim.run(5)
+	assert sim.error == None
+	assert [reason for _, reason in sim.resets] == ["WATCHDOG", "WATCHDOG"]
+	assert [round(t, 1) for t, _ in sim.resets] == [2.0, 4.0]
+	assert sim.boots == 3
+	# nvm is kept and the next boot sees why
+	assert sim.nvm[0] == 2
+	assert sim.output.getvalue().count("Reset reason microcontroller.ResetReason.WATCHDOG") == 2
+
+# Fed every second until 9 s, so it goes off 2 s after that
+def test_no_reset_while_fed(tmp_path):
+	sim = stalls(tmp_path, 10)
+	sim.run(10.9)
+	assert sim.resets == []
+	sim = stalls(tmp_path, 10)
+	sim.run(12)
+	assert [round(t, 1) for t, _ in sim.resets] == [11.0]
+
+@pytest.mark.parametrize("example, modules", [
+	("wifi-buttons", ("adafruit_httpserver",)),
+	("wifi-boost", ("adafruit_httpserver", "asyncio")),
+])
+def test_web_examples_feed_the_watchdog(example, modules):
+	needs(*modules)
+	sim = simulator(example, constants={"watchdogTimeout": True})
+	on = sim.request(10, "POST", "/", "button=ON", FORM)
+	sim.run(60)
+	assert sim.error == None and sim.resets == []
+	assert on.status == 200 and sim.relay
+
+# Long enough for the web server's retries to back off past the watchdog timeout
+@pytest.mark.parametrize("example, modules", [
+	("wifi-buttons", ("adafruit_httpserver",)),
+	("wifi-boost", ("adafruit_httpserver", "asyncio")),
+])
+def test_web_examples_feed_the_watchdog_with_wifi_down(example, modules):
+	needs(*modules)
+	sim = simulator(example, constants={"watchdogTimeout": True})
+	on = sim.request(10, "POST", "/", "button=ON", FORM)
+	sim.at(60, lambda: (setattr(sim, "wifiUp", False), sim.breakSockets()))
+	sim.at(200, lambda: setattr(sim, "wifiUp", True))
+	page = sim.request(280, "GET", "/")
+	sim.run(285)
+	assert sim.error == None and sim.resets == []
+	assert on.status == 200 and switched(sim, False) == []
+	assert page.status == 200
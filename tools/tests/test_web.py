@@ -0,0 +1,59 @@
+# USB Power Switch Pro
+#
+# https://github.com/8086net/usb-pwr-switch-pro-examples/
+#
+# Web examples, power switched by HTTP requests
+#
+
+import json
+
+from conftest import FORM, JSON, needs, simulator, switched
+
+def test_buttons_on_off():
+	needs("adafruit_httpserver")
+	sim = simulator("wifi-buttons")
+	on = sim.request(10, "POST", "/", "button=ON", FORM)
+	off = sim.request(20, "POST", "/", "button=OFF", FORM)
+	page = sim.request(25, "GET", "/")
+	sim.run(30)
+	assert sim.error == None
+	assert (on.status, off.status, page.status) == (200, 200, 200)
+	assert 10 <= switched(sim, True)[0] < 10.1
+	assert 20 <= switched(sim, False)[0] < 20.1
+	assert not sim.relay
+
+def test_restful_switch():
+	needs("adafruit_httpserver")
+	sim = simulator("wifi-RESTfulSwitch")
+	on = sim.request(10, "PUT", "/api/v1/switch", '{"button": "true"}', JSON)
+	state = sim.request(15, "GET", "/api/v1/state")
+	bad = sim.request(20, "PUT", "/api/v1/switch", '{"button": "maybe"}', JSON)
+	sim.run(25)
+	assert sim.error == None
+	assert on.status == 200 and json.loads(on.body) == {"button": "true"}
+	assert state.status == 200 and state.headers["etag"] == on.headers["etag"]
+	assert bad.status == 400
+	assert sim.relay
+
+def test_boost_turns_off_after_15_minutes():
+	needs("adafruit_httpserver", "asyncio")
+	sim = simulator("wifi-boost")
+	boost = sim.request(20, "POST", "/", "button=BOOST15", FORM)
+	sim.run(930)
+	assert sim.error == None and sim.resets == []
+	assert boost.status == 200
+	assert 20 <= switched(sim, True)[0] < 20.1
+	assert 920 <= switched(sim, False)[0] < 920.1
+
+# Slots with a bad time are skipped whole, so the power is never left on with no off
+def test_boost_daily_schedule_skips_bad_slots():
+	needs("adafruit_httpserver", "asyncio")
+	sim = simulator("wifi-boost", {"DAILY_SCHEDULE": "00:00-6, 00:00-00:xx, 25:00-00:05, 00:00-00:75, 00:01-00:02"})
+	sim.utcAtStart = 1790035200 - 30 # 30 s before midnight UTC
+	sim.run(200)
+	assert sim.error == None
+	output = sim.output.getvalue()
+	for slot in ("00:00-6", "00:00-00:xx", "25:00-00:05", "00:00-00:75"):
+		assert "Invalid DAILY_SCHEDULE slot: " + slot in output
+	assert [round(t) for t in switched(sim, True)] == [90]
+	assert [round(t) for t in switched(sim, False)] == [150]